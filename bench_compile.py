@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from profiling import MAXRSS_UNIT
+from synth import read_corpus_manifest, write_corpus
+
+REPO_DIR = Path(__file__).resolve().parent
+WORK_DIR = Path("bench-corpus")
+SCALES = (1.0,)
+
+
+class Compiler(NamedTuple):
+    script: str
+    args: tuple[str, ...]
+    db_path: Path
+    corpus_format: str
+
+
+COMPILERS = {
+    "compile": Compiler("compile.py", (), Path("api/cards.sqlite"), "json"),
+    "compile-workers": Compiler("compile.py", ("--workers", "0"), Path("api/cards.sqlite"), "json"),
+    "compile-intern": Compiler("compile.py", ("--intern",), Path("api/cards.sqlite"), "json"),
+    "compile2": Compiler("compile2.py", ("--no-cache",), Path("data/cards2.sqlite"), "ts"),
+    "compile3": Compiler("compile3.py", (), Path("api/cards.sqlite"), "json"),
+    "compile3-normalized": Compiler(
+        "compile3.py", ("--normalized",), Path("api/cards.sqlite"), "json"
+    ),
+}
+
+
+class RunResult(NamedTuple):
+    compiler: str
+    scale: float
+    cards: int
+    seconds: float
+    peak_rss_bytes: int
+    phases: list[dict[str, Any]]
+
+
+def corpus_dir(work_dir: Path, scale: float, seed: int) -> Path:
+    return work_dir / f"scale-{scale:g}-seed-{seed}"
+
+
+def ensure_corpus(work_dir: Path, scale: float, seed: int, formats: tuple[str, ...]) -> Path:
+    directory = corpus_dir(work_dir, scale, seed)
+    manifest = read_corpus_manifest(directory)
+    if manifest is None or not set(formats) <= set(manifest["formats"]):
+        directory.mkdir(parents=True, exist_ok=True)
+        manifest = write_corpus(directory, scale, seed, formats)
+        print(f"Generated {manifest['cards']} cards in {manifest['sets']} sets into {directory}")
+    return directory
+
+
+def count_cards(db_path: Path) -> int:
+    conn = sqlite3.connect(f"file:{db_path.resolve()}?mode=ro", uri=True)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM "cards"').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def run_compiler(name: str, compiler: Compiler, directory: Path, scale: float) -> RunResult:
+    profile_path = directory / f"{name}.profile.json"
+    log_path = directory / f"{name}.log"
+    command = [
+        sys.executable,
+        str(REPO_DIR / compiler.script),
+        *compiler.args,
+        "--profile",
+        str(profile_path.resolve()),
+    ]
+    with log_path.open("wb") as log:
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=directory, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"{name} exited with {process.returncode}, see {log_path}")
+    report = json.loads(profile_path.read_text(encoding="utf-8"))
+    return RunResult(
+        compiler=name,
+        scale=scale,
+        cards=count_cards(directory / compiler.db_path),
+        seconds=seconds,
+        peak_rss_bytes=usage.ru_maxrss * MAXRSS_UNIT,
+        phases=report["phases"],
+    )
+
+
+def best_run(results: list[RunResult]) -> RunResult:
+    best = min(results, key=lambda result: result.seconds)
+    return best._replace(peak_rss_bytes=max(result.peak_rss_bytes for result in results))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the compilers against synthetic corpora at several scales."
+    )
+    parser.add_argument(
+        "--scale",
+        action="append",
+        type=float,
+        help="corpus scale relative to the real data (repeatable, e.g. 1, 10 and 100; default 1)",
+    )
+    parser.add_argument(
+        "--compiler",
+        action="append",
+        choices=sorted(COMPILERS),
+        help="compiler configuration to run (repeatable, default: all)",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="runs per compiler and scale")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic corpus")
+    parser.add_argument(
+        "--work-dir", type=Path, default=WORK_DIR, help="directory holding generated corpora"
+    )
+    parser.add_argument("--json", type=Path, help="also write every result as JSON to this path")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    names = args.compiler or list(COMPILERS)
+    formats = tuple(sorted({COMPILERS[name].corpus_format for name in names}))
+    results: list[RunResult] = []
+    baselines: dict[str, float] = {}
+    print(
+        f"{'compiler':<20} {'scale':>6} {'cards':>9} {'seconds':>9} {'cards/s':>9} "
+        f"{'peak MB':>8} {'us/card':>8} {'scaling':>7}"
+    )
+    for scale in sorted(args.scale or SCALES):
+        directory = ensure_corpus(args.work_dir, scale, args.seed, formats)
+        for name in names:
+            result = best_run(
+                [run_compiler(name, COMPILERS[name], directory, scale) for _ in range(args.repeat)]
+            )
+            results.append(result)
+            per_card = result.seconds / max(result.cards, 1)
+            baseline = baselines.setdefault(name, per_card)
+            print(
+                f"{name:<20} {scale:>6g} {result.cards:>9} {result.seconds:>9.2f} "
+                f"{result.cards / result.seconds:>9.0f} {result.peak_rss_bytes / 2**20:>8.1f} "
+                f"{per_card * 1e6:>8.1f} {per_card / baseline:>6.2f}x"
+            )
+    if args.json is not None:
+        args.json.write_text(
+            json.dumps([result._asdict() for result in results], indent=2), encoding="utf-8"
+        )
+
+
+if __name__ == "__main__":
+    main()
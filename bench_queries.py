@@ -0,0 +1,115 @@
+import argparse
+import random
+import sqlite3
+import statistics
+import time
+from pathlib import Path
+from typing import Any
+
+QUERIES = {
+    "packs_page": (
+        'SELECT "id", "packName", "packSeries", "packCode", "releaseDate", "cardCount" '
+        'FROM "packs" ORDER BY "id" LIMIT 5 OFFSET ?'
+    ),
+    "pack_pool": 'SELECT "id", "name", "number", "rarity" FROM "cards" WHERE "packId" = ?',
+    "pack_rarity_pool": (
+        'SELECT "id", "name", "number" FROM "cards" WHERE "packId" = ? AND "rarity" = ?'
+    ),
+    "name_lookup": 'SELECT "id", "packId", "number" FROM "cards" WHERE "name" = ?',
+    "code_number_lookup": (
+        'SELECT c."id", c."name" FROM "cards" AS c JOIN "packs" AS p ON p."id" = c."packId" '
+        'WHERE p."packCode" = ? AND c."number" = ?'
+    ),
+}
+
+
+def connect_read_only(db_path: Path) -> sqlite3.Connection:
+    return sqlite3.connect(f"file:{db_path.resolve()}?mode=ro", uri=True)
+
+
+def sample_parameters(
+    conn: sqlite3.Connection, iterations: int, seed: int
+) -> dict[str, list[tuple[Any, ...]]]:
+    rng = random.Random(seed)
+    cards = conn.execute(
+        'SELECT c."name", c."number", c."rarity", c."packId", p."packCode" '
+        'FROM "cards" AS c LEFT JOIN "packs" AS p ON p."id" = c."packId" ORDER BY c."id"'
+    ).fetchall()
+    if not cards:
+        raise ValueError("Database has no cards to sample")
+    pack_count = conn.execute('SELECT COUNT(*) FROM "packs"').fetchone()[0]
+    picks = [rng.choice(cards) for _ in range(iterations)]
+    return {
+        "packs_page": [(rng.randrange(max(pack_count, 1)),) for _ in range(iterations)],
+        "pack_pool": [(pack_id,) for _, _, _, pack_id, _ in picks],
+        "pack_rarity_pool": [(pack_id, rarity) for _, _, rarity, pack_id, _ in picks],
+        "name_lookup": [(name,) for name, _, _, _, _ in picks],
+        "code_number_lookup": [(pack_code, number) for _, number, _, _, pack_code in picks],
+    }
+
+
+def query_plan(conn: sqlite3.Connection, sql: str, parameters: tuple[Any, ...]) -> str:
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    return "; ".join(row[-1] for row in rows)
+
+
+def time_query(
+    conn: sqlite3.Connection, sql: str, parameters: list[tuple[Any, ...]]
+) -> list[float]:
+    timings: list[float] = []
+    for values in parameters:
+        started = time.perf_counter()
+        conn.execute(sql, values).fetchall()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def benchmark(
+    db_path: Path, parameters: dict[str, list[tuple[Any, ...]]]
+) -> list[tuple[str, float, float, float, str]]:
+    results: list[tuple[str, float, float, float, str]] = []
+    for name, sql in QUERIES.items():
+        cold_conn = connect_read_only(db_path)
+        cold = time_query(cold_conn, sql, parameters[name][:1])[0]
+        cold_conn.close()
+        conn = connect_read_only(db_path)
+        timings = time_query(conn, sql, parameters[name])
+        plan = query_plan(conn, sql, parameters[name][0])
+        conn.close()
+        results.append(
+            (name, cold, statistics.median(timings), percentile(timings, 0.99), plan)
+        )
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Time the draw and lookup queries against one or more compiled databases."
+    )
+    parser.add_argument("databases", nargs="+", type=Path, help="compiled cards.sqlite files")
+    parser.add_argument("--iterations", type=int, default=2000, help="executions per query")
+    parser.add_argument("--seed", type=int, default=0, help="seed for sampling query parameters")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    sample_conn = connect_read_only(args.databases[0])
+    parameters = sample_parameters(sample_conn, args.iterations, args.seed)
+    sample_conn.close()
+    print(f"{'database':<32} {'query':<20} {'cold us':>9} {'p50 us':>9} {'p99 us':>9}  plan")
+    for db_path in args.databases:
+        for name, cold, p50, p99, plan in benchmark(db_path, parameters):
+            print(
+                f"{str(db_path):<32} {name:<20} {cold * 1e6:>9.1f} {p50 * 1e6:>9.1f} "
+                f"{p99 * 1e6:>9.1f}  {plan}"
+            )
+
+
+if __name__ == "__main__":
+    main()
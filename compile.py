@@ -1,170 +1,398 @@
+import argparse
+import hashlib
 import json
+import os
+import shutil
 import sqlite3
-from datetime import date
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Any
+from typing import Any, NamedTuple
+
+from compiler import (
+    EXCLUDED_KEYS,
+    STAGING_TABLE_NAME,
+    TABLE_NAME,
+    CardBatch,
+    PackMetadata,
+    SourceAdapter,
+    Staging,
+    assign_pack_ids,
+    build_batch,
+    collect_key_types,
+    compile_cards,
+    copy_staged_rows,
+    create_metadata_table,
+    detect_shadow_columns,
+    infer_columns,
+    input_metadata,
+    internable_columns,
+    iter_card_files,
+    load_set_metadata,
+    publish_build,
+    publish_version,
+    read_metadata,
+    read_packs,
+    read_shadow_columns,
+    read_value_tables,
+    shadow_definitions,
+    small_image_url,
+    value_table_name,
+    write_metadata,
+    write_outputs,
+    write_packs,
+)
+from profiling import Profiler
+from publish import build_path, validate_database
 
 CARDS_DIR = Path("pokemon-tcg-data/cards/en")
 SETS_PATH = Path("pokemon-tcg-data/sets/en.json")
 DB_PATH = Path("api/cards.sqlite")
-TABLE_NAME = "cards"
-EXCLUDED_KEYS = {
-    "retreatCost",
-    "flavorText",
-    "legalities",
-    "images",
-    "nationalPokedexNumbers",
-}
-SQLITE_TYPE_BY_PYTHON_TYPE: dict[type[Any], str] = {
-    int: "INTEGER",
-    float: "REAL",
-    str: "TEXT",
-    bool: "INTEGER",
+PROFILE_HOT_PHASES = ("parse", "stage")
+MANIFEST_TABLE_NAME = "manifest"
+PYTHON_TYPE_BY_NAME: dict[str, type[Any]] = {
+    value_type.__name__: value_type for value_type in (int, float, str, bool, list, dict, type(None))
 }
 
 
-def iter_card_files(cards_dir: Path) -> list[Path]:
-    return sorted(cards_dir.glob("*.json"))
+class CardFile(NamedTuple):
+    set_id: str
+    digest: str
+    batch: CardBatch
+    card_ids: list[Any]
 
 
-def infer_columns(card_files: list[Path]) -> list[tuple[str, str]]:
-    key_types: dict[str, set[type[Any]]] = {}
-    for path in card_files:
-        with path.open("r", encoding="utf-8") as f:
-            cards = json.load(f)
-        for card in cards:
-            for key, value in card.items():
-                if key in EXCLUDED_KEYS:
-                    continue
-                key_types.setdefault(key, set()).add(type(value))
-    if "id" not in key_types:
-        raise ValueError("Missing required key: id")
-    ordered_keys = ["id"] + sorted(k for k in key_types if k != "id")
-    columns: list[tuple[str, str]] = []
-    for key in ordered_keys:
-        types = key_types[key]
-        if len(types) != 1:
-            sqlite_type = "TEXT"
-        else:
-            value_type = next(iter(types))
-            if value_type in (list, dict):
-                sqlite_type = "TEXT"
-            else:
-                sqlite_type = SQLITE_TYPE_BY_PYTHON_TYPE.get(value_type, "TEXT")
-        columns.append((key, sqlite_type))
-    columns.extend(
-        [
-            ("packName", "TEXT"),
-            ("packSeries", "TEXT"),
-            ("packCode", "TEXT"),
-            ("releaseDate", "DATE"),
-            ("imageUrl", "TEXT"),
-        ]
+def create_manifest_table(conn: sqlite3.Connection) -> None:
+    conn.execute(f'DROP TABLE IF EXISTS "{MANIFEST_TABLE_NAME}"')
+    conn.execute(
+        f'CREATE TABLE "{MANIFEST_TABLE_NAME}" ('
+        '"setId" TEXT PRIMARY KEY, "sha256" TEXT NOT NULL, "cardIds" TEXT NOT NULL, "keyTypes" TEXT NOT NULL)'
     )
-    return columns
 
 
-def encode_value(value: Any) -> Any:
-    if isinstance(value, (list, dict)):
-        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
-    return value
+def set_digest(data: bytes, metadata: PackMetadata | None) -> str:
+    digest = hashlib.sha256(data)
+    if metadata is not None:
+        pack_name, pack_series, pack_code, release_date = metadata
+        release_value = release_date.isoformat() if release_date is not None else None
+        digest.update(json.dumps([pack_name, pack_series, pack_code, release_value]).encode("utf-8"))
+    return digest.hexdigest()
 
 
-def create_database(db_path: Path, columns: list[tuple[str, str]]) -> sqlite3.Connection:
-    db_path.parent.mkdir(parents=True, exist_ok=True)
-    if db_path.exists():
-        db_path.unlink()
-    conn = sqlite3.connect(db_path)
-    conn.execute("PRAGMA journal_mode = OFF")
-    conn.execute("PRAGMA synchronous = OFF")
-    conn.execute("PRAGMA temp_store = MEMORY")
-    conn.execute("PRAGMA locking_mode = EXCLUSIVE")
-    definitions = [f'"{name}" {col_type}' for name, col_type in columns]
-    definitions[0] = f'{definitions[0]} PRIMARY KEY'
-    conn.execute(f'DROP TABLE IF EXISTS "{TABLE_NAME}"')
-    conn.execute(f'CREATE TABLE "{TABLE_NAME}" ({", ".join(definitions)})')
-    return conn
+def merge_key_types(target: dict[str, set[type[Any]]], source: dict[str, set[type[Any]]]) -> None:
+    for key, types in source.items():
+        target.setdefault(key, set()).update(types)
 
 
-def insert_cards(
-    conn: sqlite3.Connection,
+def parse_card_file(
+    set_id: str,
+    data: bytes,
+    digest: str,
+    pack_id: int | None,
+) -> CardFile:
+    cards = json.loads(data)
+    key_types = collect_key_types(cards, EXCLUDED_KEYS)
+    extras = {"packId": lambda _: pack_id, "imageUrl": small_image_url}
+    batch = build_batch(cards, key_types, extras)
+    return CardFile(set_id, digest, batch, [card.get("id") for card in cards])
+
+
+def read_card_file(
+    path: Path,
+    set_metadata: dict[str, PackMetadata],
+    set_pack_ids: dict[str, int],
+) -> CardFile:
+    data = path.read_bytes()
+    digest = set_digest(data, set_metadata.get(path.stem))
+    return parse_card_file(path.stem, data, digest, set_pack_ids.get(path.stem))
+
+
+def iter_read_card_files(
     card_files: list[Path],
-    columns: list[tuple[str, str]],
-    set_metadata: dict[str, tuple[str | None, str | None, str | None, date | None]],
-) -> int:
-    column_names = [name for name, _ in columns]
-    placeholders = ", ".join("?" for _ in column_names)
-    quoted_columns = ", ".join(f'"{name}"' for name in column_names)
-    sql = f'INSERT INTO "{TABLE_NAME}" ({quoted_columns}) VALUES ({placeholders})'
-    total = 0
-    with conn:
+    set_metadata: dict[str, PackMetadata],
+    set_pack_ids: dict[str, int],
+    workers: int,
+) -> Iterator[CardFile]:
+    if workers <= 1:
         for path in card_files:
-            pack_name, pack_series, pack_code, release_date = set_metadata.get(
-                path.stem, (None, None, None, None)
-            )
-            with path.open("r", encoding="utf-8") as f:
-                cards = json.load(f)
-            rows = []
-            for card in cards:
-                image_url = None
-                images = card.get("images")
-                if isinstance(images, dict):
-                    image_url = images.get("small")
-                values: list[Any] = []
-                for name in column_names:
-                    if name == "packName":
-                        values.append(pack_name)
-                    elif name == "packSeries":
-                        values.append(pack_series)
-                    elif name == "packCode":
-                        values.append(pack_code)
-                    elif name == "releaseDate":
-                        values.append(release_date.isoformat() if release_date is not None else None)
-                    elif name == "imageUrl":
-                        values.append(image_url)
-                    else:
-                        values.append(encode_value(card.get(name)))
-                rows.append(tuple(values))
-            conn.executemany(sql, rows)
-            total += len(rows)
-    return total
-
-
-def parse_release_date(value: Any) -> date | None:
-    if not isinstance(value, str):
-        return None
-    try:
-        return date.fromisoformat(value.replace("/", "-"))
-    except ValueError:
+            yield read_card_file(path, set_metadata, set_pack_ids)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(
+            read_card_file, card_files, repeat(set_metadata), repeat(set_pack_ids)
+        )
+
+
+def count_card_rows(card_file: CardFile) -> int:
+    return len(card_file.batch.rows)
+
+
+def manifest_row(card_file: CardFile) -> tuple[str, str, str, str]:
+    key_types = {
+        key: sorted(value_type.__name__ for value_type in types)
+        for key, types in card_file.batch.key_types.items()
+    }
+    return (
+        card_file.set_id,
+        card_file.digest,
+        json.dumps(card_file.card_ids, ensure_ascii=False),
+        json.dumps(key_types, sort_keys=True),
+    )
+
+
+def read_manifest(
+    conn: sqlite3.Connection,
+) -> dict[str, tuple[str, list[Any], dict[str, set[type[Any]]]]] | None:
+    table = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (MANIFEST_TABLE_NAME,)
+    ).fetchone()
+    if table is None:
         return None
+    manifest: dict[str, tuple[str, list[Any], dict[str, set[type[Any]]]]] = {}
+    query = f'SELECT "setId", "sha256", "cardIds", "keyTypes" FROM "{MANIFEST_TABLE_NAME}"'
+    for set_id, digest, card_ids, key_types in conn.execute(query):
+        manifest[set_id] = (
+            digest,
+            json.loads(card_ids),
+            {
+                key: {PYTHON_TYPE_BY_NAME[name] for name in names}
+                for key, names in json.loads(key_types).items()
+            },
+        )
+    return manifest
+
+
+def write_manifest(conn: sqlite3.Connection, rows: list[tuple[str, str, str, str]]) -> None:
+    conn.executemany(
+        f'INSERT OR REPLACE INTO "{MANIFEST_TABLE_NAME}" ("setId", "sha256", "cardIds", "keyTypes") '
+        "VALUES (?, ?, ?, ?)",
+        rows,
+    )
+
+
+class PokemonTcgDataAdapter(SourceAdapter):
+    name = "compile"
+    cards_dir = CARDS_DIR
+
+    def __init__(
+        self, card_files: list[Path], set_metadata: dict[str, PackMetadata], workers: int = 1
+    ) -> None:
+        super().__init__()
+        self.card_files = card_files
+        self.set_metadata = set_metadata
+        self.workers = workers
+        self.set_pack_ids = assign_pack_ids(card_files, set_metadata, self.packs)
+        self.pack_metadata = set_metadata
+        self.manifest_rows: list[tuple[str, str, str, str]] = []
+
+    def stage(self, staging: Staging, profiler: Profiler) -> None:
+        card_file_reader = iter_read_card_files(
+            self.card_files, self.set_metadata, self.set_pack_ids, self.workers
+        )
+        for card_file in profiler.timed("parse", card_file_reader, count_card_rows):
+            with profiler.phase("stage") as phase:
+                phase.add(rows=staging.add(card_file.batch))
+                self.manifest_rows.append(manifest_row(card_file))
+
+    def create_tables(self, conn: sqlite3.Connection) -> None:
+        create_manifest_table(conn)
+
+    def input_paths(self) -> list[Path]:
+        return [*self.card_files, SETS_PATH]
+
+    def write_tables(self, conn: sqlite3.Connection) -> None:
+        write_manifest(conn, self.manifest_rows)
 
 
-def load_set_metadata(
-    sets_path: Path,
-) -> dict[str, tuple[str | None, str | None, str | None, date | None]]:
-    with sets_path.open("r", encoding="utf-8") as f:
-        sets = json.load(f)
-    metadata: dict[str, tuple[str | None, str | None, str | None, date | None]] = {}
-    for item in sets:
-        metadata[item["id"]] = (
-            item.get("name"),
-            item.get("series"),
-            item.get("ptcgoCode"),
-            parse_release_date(item.get("releaseDate")),
+def update_cards(
+    conn: sqlite3.Connection,
+    card_files: list[Path],
+    set_metadata: dict[str, PackMetadata],
+    intern: bool = False,
+) -> tuple[int, int, int] | None:
+    manifest = read_manifest(conn)
+    if manifest is None:
+        return None
+    packs = read_packs(conn)
+    if packs is None:
+        return None
+    set_pack_ids = assign_pack_ids(card_files, set_metadata, packs)
+    key_types: dict[str, set[type[Any]]] = {}
+    changed: list[CardFile] = []
+    stale_ids: list[Any] = []
+    for path in card_files:
+        data = path.read_bytes()
+        digest = set_digest(data, set_metadata.get(path.stem))
+        previous = manifest.pop(path.stem, None)
+        if previous is not None and previous[0] == digest:
+            merge_key_types(key_types, previous[2])
+            continue
+        card_file = parse_card_file(path.stem, data, digest, set_pack_ids.get(path.stem))
+        merge_key_types(key_types, card_file.batch.key_types)
+        changed.append(card_file)
+        if previous is not None:
+            stale_ids.extend(previous[1])
+    removed = list(manifest)
+    for _, card_ids, _ in manifest.values():
+        stale_ids.extend(card_ids)
+    interned = read_value_tables(conn) if intern else None
+    intern_columns = set(internable_columns(key_types)) if intern else set()
+    columns = infer_columns(key_types, intern_columns)
+    existing_columns = [(row[1], row[2]) for row in conn.execute(f'PRAGMA table_info("{TABLE_NAME}")')]
+    shadows = read_shadow_columns([name for name, _ in existing_columns])
+    if columns + shadow_definitions(shadows) != existing_columns:
+        return None
+    if not changed and not removed:
+        return (0, 0, 0)
+    staging = Staging(conn, columns=columns, interned=interned, intern_columns=intern_columns)
+    with conn:
+        for column_name in set(interned or ()) - intern_columns:
+            conn.execute(f'DROP TABLE "{value_table_name(column_name)}"')
+            del interned[column_name]
+        for card_file in changed:
+            staging.add(card_file.batch)
+        staged_shadows, _ = detect_shadow_columns(
+            conn, STAGING_TABLE_NAME, [shadow.source for shadow in shadows]
         )
-    return metadata
+        suffixed = {staged.source for staged in staged_shadows if staged.has_suffix}
+        if any(shadow.source in suffixed and not shadow.has_suffix for shadow in shadows):
+            conn.execute(f'DROP TABLE "{STAGING_TABLE_NAME}"')
+            return None
+        conn.executemany(
+            f'DELETE FROM "{TABLE_NAME}" WHERE "id" = ?', [(card_id,) for card_id in stale_ids]
+        )
+        conn.executemany(
+            f'DELETE FROM "{MANIFEST_TABLE_NAME}" WHERE "setId" = ?', [(set_id,) for set_id in removed]
+        )
+        total = copy_staged_rows(conn, STAGING_TABLE_NAME, TABLE_NAME, columns, shadows)
+        write_packs(conn, packs, set_metadata)
+        write_manifest(conn, [manifest_row(card_file) for card_file in changed])
+        create_metadata_table(conn)
+        write_metadata(
+            conn,
+            {
+                **read_metadata(conn),
+                "compiler": PokemonTcgDataAdapter.name,
+                **input_metadata([*card_files, SETS_PATH]),
+            },
+        )
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        conn.execute("ANALYZE")
+    return (total, len(changed), len(removed))
+
+
+def update_database(
+    card_files: list[Path],
+    set_metadata: dict[str, PackMetadata],
+    args: argparse.Namespace,
+    profiler: Profiler,
+) -> tuple[int, int, int] | None:
+    staged_path = build_path(DB_PATH)
+    try:
+        with profiler.phase("update") as phase:
+            shutil.copyfile(DB_PATH, staged_path)
+            conn = sqlite3.connect(staged_path)
+            result = update_cards(conn, card_files, set_metadata, args.intern)
+            manifest = read_manifest(conn) or {}
+            conn.close()
+            if result is not None:
+                phase.add(rows=result[0])
+        if result is None:
+            staged_path.unlink()
+            return None
+        total, changed, removed = result
+        published = False
+        if changed or removed:
+            expected = sum(len(card_ids) for _, card_ids, _ in manifest.values())
+            with profiler.phase("validate"):
+                validate_database(staged_path, {TABLE_NAME: expected})
+            with profiler.phase("publish"):
+                published = publish_build(staged_path, DB_PATH, args)
+                publish_version(DB_PATH)
+        else:
+            staged_path.unlink()
+    except BaseException:
+        staged_path.unlink(missing_ok=True)
+        raise
+    if published:
+        write_outputs(DB_PATH, profiler)
+    return result
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=f"Compile {CARDS_DIR} into {DB_PATH}.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only reinsert the cards of sets whose files changed since the last build",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processes used to parse card files (0 uses every CPU)",
+    )
+    parser.add_argument(
+        "--serving",
+        action="store_true",
+        help="build for read serving: WITHOUT ROWID cards, covering indexes, ANALYZE and larger pages",
+    )
+    parser.add_argument(
+        "--keep",
+        type=int,
+        default=0,
+        help=f"keep this many previous generations of {DB_PATH} next to it",
+    )
+    parser.add_argument(
+        "--patch",
+        type=Path,
+        help=f"also write a row-level patch from the current {DB_PATH} to the new build",
+    )
+    parser.add_argument(
+        "--intern",
+        action="store_true",
+        help="store list and dict values once in per-column value tables referenced by id",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        help="write wall time, CPU time, peak RSS, rows and bytes per build phase as JSON (- for stdout)",
+    )
+    parser.add_argument(
+        "--cprofile",
+        type=Path,
+        help="also dump cProfile stats of the parse and stage loops into this directory",
+    )
+    args = parser.parse_args()
+    if args.workers == 0:
+        args.workers = os.cpu_count() or 1
+    return args
 
 
 def main() -> None:
-    card_files = iter_card_files(CARDS_DIR)
-    if not card_files:
-        raise FileNotFoundError(f"No JSON files found in {CARDS_DIR}")
-    set_metadata = load_set_metadata(SETS_PATH)
-    columns = infer_columns(card_files)
-    conn = create_database(DB_PATH, columns)
-    total = insert_cards(conn, card_files, columns, set_metadata)
-    conn.execute("VACUUM")
-    conn.close()
+    args = parse_args()
+    profiler = Profiler("compile", args.profile is not None, args.cprofile, PROFILE_HOT_PHASES)
+    with profiler.phase("discover") as phase:
+        card_files = iter_card_files(CARDS_DIR)
+        if not card_files:
+            raise FileNotFoundError(f"No JSON files found in {CARDS_DIR}")
+        set_metadata = load_set_metadata(SETS_PATH)
+        phase.add(rows=len(card_files), size=sum(path.stat().st_size for path in card_files))
+    if args.incremental and DB_PATH.exists():
+        result = update_database(card_files, set_metadata, args, profiler)
+        if result is not None:
+            total, changed, removed = result
+            profiler.write(args.profile)
+            print(
+                f"Updated {total} cards from {changed} changed and {removed} removed sets "
+                f"in {DB_PATH}"
+            )
+            return
+        print(f"Schema or manifest changed, rebuilding {DB_PATH}")
+    adapter = PokemonTcgDataAdapter(card_files, set_metadata, args.workers)
+    total = compile_cards(DB_PATH, adapter, args, profiler, args.intern)
+    profiler.write(args.profile)
     print(f"Compiled {total} cards into {DB_PATH}")
 
 
@@ -1,35 +1,52 @@
+import argparse
 import json
-import sqlite3
 import subprocess
 import tempfile
-from datetime import date
+from collections.abc import Iterable, Iterator
+from functools import partial
+from itertools import islice
 from pathlib import Path
 from typing import Any
 
+from compiler import (
+    EXCLUDED_KEYS,
+    CardBatch,
+    PackMetadata,
+    SourceAdapter,
+    Staging,
+    build_batch,
+    collect_key_types,
+    compile_cards,
+    parse_release_date,
+)
+from profiling import Profiler
+
 CARDS_DIR = Path("cards-database/data")
 DB_PATH = Path("data/cards2.sqlite")
-TABLE_NAME = "cards"
-EXCLUDED_KEYS = {
-    "retreatCost",
-    "flavorText",
-    "legalities",
-    "images",
-    "nationalPokedexNumbers",
-    "set",
-}
-SQLITE_TYPE_BY_PYTHON_TYPE: dict[type[Any], str] = {
-    int: "INTEGER",
-    float: "REAL",
-    str: "TEXT",
-    bool: "INTEGER",
-}
+PROFILE_HOT_PHASES = ("extract", "encode", "stage")
+EXTRACT_CACHE_DIR = Path("data/cards2.extract-cache")
+BATCH_SIZE = 1000
+TCGDEX_EXCLUDED_KEYS = EXCLUDED_KEYS | {"set"}
 NODE_EXTRACT_SCRIPT = """
+import crypto from 'node:crypto';
 import fs from 'node:fs';
 import path from 'node:path';
 
 const cardsDir = path.resolve(process.argv[2]);
-const outputPath = path.resolve(process.argv[3]);
+const cacheDir = process.argv[3] ? path.resolve(process.argv[3]) : null;
 const cache = new Map();
+const digests = new Map();
+const importRegex = /^\\s*import\\s+(.+?)\\s+from\\s+(['\"])((?:\\\\.|(?!\\2).)+)\\2\\s*;?\\s*$/gm;
+const extractorDigest = sha256(fs.readFileSync(new URL(import.meta.url)));
+
+function sha256(...parts) {
+  const hash = crypto.createHash('sha256');
+  for (const part of parts) {
+    hash.update(part);
+    hash.update('\\0');
+  }
+  return hash.digest('hex');
+}
 
 function decodeSpecifier(raw, quote) {
   return Function(`\"use strict\"; return ${quote}${raw}${quote};`)();
@@ -49,27 +66,13 @@ function resolveImport(fromFile, specifier) {
   return null;
 }
 
-function loadModule(filePath) {
-  const resolvedPath = path.resolve(filePath);
-  if (cache.has(resolvedPath)) {
-    return cache.get(resolvedPath);
-  }
-
-  let source = fs.readFileSync(resolvedPath, 'utf8');
+function readDefaultImports(resolvedPath, source) {
   const imports = [];
-  const importRegex = /^\\s*import\\s+(.+?)\\s+from\\s+(['\"])((?:\\\\.|(?!\\2).)+)\\2\\s*;?\\s*$/gm;
+  importRegex.lastIndex = 0;
   let match;
   while ((match = importRegex.exec(source)) !== null) {
-    imports.push({
-      clause: match[1].trim(),
-      specifier: decodeSpecifier(match[3], match[2]),
-    });
-  }
-  source = source.replace(importRegex, '');
-
-  const argNames = [];
-  const argValues = [];
-  for (const { clause, specifier } of imports) {
+    const clause = match[1].trim();
+    const specifier = decodeSpecifier(match[3], match[2]);
     if (clause.startsWith('{')) {
       continue;
     }
@@ -81,6 +84,24 @@ function loadModule(filePath) {
     if (!importedPath) {
       continue;
     }
+    imports.push({ symbol, importedPath });
+  }
+  return imports;
+}
+
+function loadModule(filePath, cacheResult = true) {
+  const resolvedPath = path.resolve(filePath);
+  if (cache.has(resolvedPath)) {
+    return cache.get(resolvedPath);
+  }
+
+  let source = fs.readFileSync(resolvedPath, 'utf8');
+  const imports = readDefaultImports(resolvedPath, source);
+  source = source.replace(importRegex, '');
+
+  const argNames = [];
+  const argValues = [];
+  for (const { symbol, importedPath } of imports) {
     argNames.push(symbol);
     argValues.push(loadModule(importedPath));
   }
@@ -93,10 +114,27 @@ function loadModule(filePath) {
 
   const fn = new Function(...argNames, `\"use strict\";\\n${source}\\n`);
   const value = fn(...argValues);
-  cache.set(resolvedPath, value);
+  if (cacheResult) {
+    cache.set(resolvedPath, value);
+  }
   return value;
 }
 
+function moduleDigest(filePath) {
+  const resolvedPath = path.resolve(filePath);
+  if (digests.has(resolvedPath)) {
+    return digests.get(resolvedPath);
+  }
+  const source = fs.readFileSync(resolvedPath, 'utf8');
+  const parts = [source];
+  for (const { symbol, importedPath } of readDefaultImports(resolvedPath, source)) {
+    parts.push(symbol, moduleDigest(importedPath));
+  }
+  const digest = sha256(...parts);
+  digests.set(resolvedPath, digest);
+  return digest;
+}
+
 function collectCardFiles(root) {
   const result = [];
   const stack = [root];
@@ -120,109 +158,96 @@ function collectCardFiles(root) {
   return result.sort();
 }
 
-const cards = [];
-for (const cardPath of collectCardFiles(cardsDir)) {
+function extractCard(cardPath) {
   const localId = path.basename(cardPath, '.ts');
-  const card = loadModule(cardPath);
+  const card = loadModule(cardPath, false);
   if (!card || typeof card !== 'object') {
-    continue;
+    return '';
   }
   if (!card.set || typeof card.set !== 'object' || typeof card.set.id !== 'string') {
-    continue;
+    return '';
+  }
+  return JSON.stringify({ ...card, id: `${card.set.id}-${localId}`, number: localId });
+}
+
+function extractCachedCard(cardPath, usedKeys) {
+  if (!cacheDir) {
+    return extractCard(cardPath);
+  }
+  const rel = path.relative(cardsDir, cardPath).split(path.sep).join('/');
+  const key = sha256(extractorDigest, rel, moduleDigest(cardPath));
+  usedKeys.add(key);
+  const entryPath = path.join(cacheDir, key.slice(0, 2), `${key}.json`);
+  try {
+    return fs.readFileSync(entryPath, 'utf8');
+  } catch (err) {
+    if (err.code !== 'ENOENT') {
+      throw err;
+    }
+  }
+  const line = extractCard(cardPath);
+  const tempPath = `${entryPath}.${process.pid}.tmp`;
+  fs.mkdirSync(path.dirname(entryPath), { recursive: true });
+  fs.writeFileSync(tempPath, line, 'utf8');
+  fs.renameSync(tempPath, entryPath);
+  return line;
+}
+
+function pruneCache(usedKeys) {
+  for (const bucket of fs.readdirSync(cacheDir, { withFileTypes: true })) {
+    if (!bucket.isDirectory()) {
+      continue;
+    }
+    const bucketPath = path.join(cacheDir, bucket.name);
+    for (const name of fs.readdirSync(bucketPath)) {
+      if (!usedKeys.has(path.basename(name, '.json'))) {
+        fs.rmSync(path.join(bucketPath, name), { force: true });
+      }
+    }
   }
-  cards.push({ ...card, id: `${card.set.id}-${localId}`, number: localId });
 }
 
-fs.writeFileSync(outputPath, JSON.stringify(cards), 'utf8');
+const usedKeys = new Set();
+for (const cardPath of collectCardFiles(cardsDir)) {
+  const line = extractCachedCard(cardPath, usedKeys);
+  if (line) {
+    process.stdout.write(`${line}\\n`);
+  }
+}
+if (cacheDir) {
+  pruneCache(usedKeys);
+}
 """
 
 
-def collect_cards(cards_dir: Path) -> list[dict[str, Any]]:
+def iter_cards(cards_dir: Path, cache_dir: Path | None = None) -> Iterator[dict[str, Any]]:
     with tempfile.TemporaryDirectory() as temp_dir:
         script_path = Path(temp_dir) / "extract_cards.mjs"
-        output_path = Path(temp_dir) / "cards.json"
+        stderr_path = Path(temp_dir) / "stderr.log"
         script_path.write_text(NODE_EXTRACT_SCRIPT, encoding="utf-8")
-        process = subprocess.run(
-            ["node", str(script_path), str(cards_dir.resolve()), str(output_path)],
-            capture_output=True,
-            text=True,
-            check=False,
-        )
-        if process.returncode != 0:
-            stderr = process.stderr.strip()
-            stdout = process.stdout.strip()
-            message = stderr if stderr else stdout
-            raise RuntimeError(f"Failed to extract cards from {cards_dir}: {message}")
-        with output_path.open("r", encoding="utf-8") as f:
-            payload = json.load(f)
-    if not isinstance(payload, list):
-        raise ValueError("Card extraction output is not a list")
-    return [item for item in payload if isinstance(item, dict)]
-
-
-def infer_columns(cards: list[dict[str, Any]]) -> list[tuple[str, str]]:
-    key_types: dict[str, set[type[Any]]] = {}
-    for card in cards:
-        for key, value in card.items():
-            if key in EXCLUDED_KEYS:
-                continue
-            key_types.setdefault(key, set()).add(type(value))
-    if "id" not in key_types:
-        raise ValueError("Missing required key: id")
-    ordered_keys = ["id"] + sorted(k for k in key_types if k != "id")
-    columns: list[tuple[str, str]] = []
-    for key in ordered_keys:
-        types = key_types[key]
-        if len(types) != 1:
-            sqlite_type = "TEXT"
-        else:
-            value_type = next(iter(types))
-            if value_type in (list, dict):
-                sqlite_type = "TEXT"
-            else:
-                sqlite_type = SQLITE_TYPE_BY_PYTHON_TYPE.get(value_type, "TEXT")
-        columns.append((key, sqlite_type))
-    columns.extend(
-        [
-            ("packName", "TEXT"),
-            ("packSeries", "TEXT"),
-            ("packCode", "TEXT"),
-            ("releaseDate", "DATE"),
-            ("imageUrl", "TEXT"),
-        ]
-    )
-    return columns
-
-
-def encode_value(value: Any) -> Any:
-    if isinstance(value, (list, dict)):
-        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
-    return value
-
-
-def create_database(db_path: Path, columns: list[tuple[str, str]]) -> sqlite3.Connection:
-    db_path.parent.mkdir(parents=True, exist_ok=True)
-    if db_path.exists():
-        db_path.unlink()
-    conn = sqlite3.connect(db_path)
-    conn.execute("PRAGMA journal_mode = OFF")
-    conn.execute("PRAGMA synchronous = OFF")
-    conn.execute("PRAGMA temp_store = MEMORY")
-    conn.execute("PRAGMA locking_mode = EXCLUSIVE")
-    definitions = [f'"{name}" {col_type}' for name, col_type in columns]
-    definitions[0] = f"{definitions[0]} PRIMARY KEY"
-    conn.execute(f'DROP TABLE IF EXISTS "{TABLE_NAME}"')
-    conn.execute(f'CREATE TABLE "{TABLE_NAME}" ({", ".join(definitions)})')
-    return conn
-
-
-def parse_release_date(value: Any) -> date | None:
-    if not isinstance(value, str):
-        return None
-    try:
-        return date.fromisoformat(value.replace("/", "-"))
-    except ValueError:
-        return None
+        command = ["node", str(script_path), str(cards_dir.resolve())]
+        if cache_dir is not None:
+            command.append(str(cache_dir.resolve()))
+        with stderr_path.open("w+", encoding="utf-8") as stderr:
+            process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+                text=True,
+                encoding="utf-8",
+            )
+            try:
+                for line in process.stdout:
+                    item = json.loads(line)
+                    if isinstance(item, dict):
+                        yield item
+            finally:
+                process.stdout.close()
+                returncode = process.wait()
+            if returncode != 0:
+                stderr.seek(0)
+                message = stderr.read().strip()
+                raise RuntimeError(f"Failed to extract cards from {cards_dir}: {message}")
 
 
 def pick_text(value: Any) -> str | None:
@@ -238,7 +263,7 @@ def pick_text(value: Any) -> str | None:
     return None
 
 
-def pick_pack_metadata(card: dict[str, Any]) -> tuple[str | None, str | None, str | None, date | None]:
+def pick_pack_metadata(card: dict[str, Any]) -> PackMetadata:
     set_info = card.get("set")
     if not isinstance(set_info, dict):
         return (None, None, None, None)
@@ -258,59 +283,118 @@ def pick_pack_metadata(card: dict[str, Any]) -> tuple[str | None, str | None, st
     return (pack_name, pack_series, pack_code, release_date)
 
 
-def insert_cards(
-    conn: sqlite3.Connection,
-    cards: list[dict[str, Any]],
-    columns: list[tuple[str, str]],
-) -> int:
-    column_names = [name for name, _ in columns]
-    placeholders = ", ".join("?" for _ in column_names)
-    quoted_columns = ", ".join(f'"{name}"' for name in column_names)
-    sql = f'INSERT INTO "{TABLE_NAME}" ({quoted_columns}) VALUES ({placeholders})'
-    total = 0
-    with conn:
-        rows = []
-        for card in cards:
-            pack_name, pack_series, pack_code, release_date = pick_pack_metadata(card)
-            image_url = None
-            images = card.get("images")
-            if isinstance(images, dict):
-                image_value = images.get("small")
-                if isinstance(image_value, str):
-                    image_url = image_value
-            if image_url is None:
-                image = card.get("image")
-                if isinstance(image, str):
-                    image_url = image
-            values: list[Any] = []
-            for name in column_names:
-                if name == "packName":
-                    values.append(pack_name)
-                elif name == "packSeries":
-                    values.append(pack_series)
-                elif name == "packCode":
-                    values.append(pack_code)
-                elif name == "releaseDate":
-                    values.append(release_date.isoformat() if release_date is not None else None)
-                elif name == "imageUrl":
-                    values.append(image_url)
-                else:
-                    values.append(encode_value(card.get(name)))
-            rows.append(tuple(values))
-        conn.executemany(sql, rows)
-        total += len(rows)
-    return total
+def pick_set_id(card: dict[str, Any]) -> str | None:
+    set_info = card.get("set")
+    if not isinstance(set_info, dict):
+        return None
+    set_id = set_info.get("id")
+    return set_id if isinstance(set_id, str) else None
+
+
+def pick_pack_id(
+    card: dict[str, Any], packs: dict[str, int], pack_metadata: dict[str, PackMetadata]
+) -> int | None:
+    set_id = pick_set_id(card)
+    if set_id is None:
+        return None
+    pack_id = packs.get(set_id)
+    if pack_id is None:
+        pack_id = packs[set_id] = len(packs) + 1
+        pack_metadata[set_id] = pick_pack_metadata(card)
+    return pack_id
+
+
+def pick_image_url(card: dict[str, Any]) -> str | None:
+    images = card.get("images")
+    if isinstance(images, dict):
+        image_url = images.get("small")
+        if isinstance(image_url, str):
+            return image_url
+    image = card.get("image")
+    if isinstance(image, str):
+        return image
+    return None
+
+
+def encode_cards(
+    cards: list[dict[str, Any]], packs: dict[str, int], pack_metadata: dict[str, PackMetadata]
+) -> CardBatch:
+    key_types = collect_key_types(cards, TCGDEX_EXCLUDED_KEYS)
+    extras = {
+        "packId": partial(pick_pack_id, packs=packs, pack_metadata=pack_metadata),
+        "imageUrl": pick_image_url,
+    }
+    return build_batch(cards, key_types, extras)
+
+
+class TcgdexAdapter(SourceAdapter):
+    name = "compile2"
+    cards_dir = CARDS_DIR
+    shadows = False
+
+    def __init__(self, cards: Iterable[dict[str, Any]], batch_size: int = BATCH_SIZE) -> None:
+        super().__init__()
+        self.cards = cards
+        self.batch_size = batch_size
+
+    def stage(self, staging: Staging, profiler: Profiler) -> None:
+        iterator = profiler.timed("extract", self.cards)
+        while batch := list(islice(iterator, self.batch_size)):
+            with profiler.phase("encode") as phase:
+                card_batch = encode_cards(batch, self.packs, self.pack_metadata)
+                phase.add(rows=len(card_batch.rows))
+            with profiler.phase("stage") as phase:
+                phase.add(rows=staging.add(card_batch))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=f"Compile {CARDS_DIR} into {DB_PATH}.")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"re-evaluate every card module instead of reusing {EXTRACT_CACHE_DIR}",
+    )
+    parser.add_argument(
+        "--serving",
+        action="store_true",
+        help="build for read serving: WITHOUT ROWID cards, covering indexes, ANALYZE and larger pages",
+    )
+    parser.add_argument(
+        "--keep",
+        type=int,
+        default=0,
+        help=f"keep this many previous generations of {DB_PATH} next to it",
+    )
+    parser.add_argument(
+        "--patch",
+        type=Path,
+        help=f"also write a row-level patch from the current {DB_PATH} to the new build",
+    )
+    parser.add_argument(
+        "--intern",
+        action="store_true",
+        help="store list and dict values once in per-column value tables referenced by id",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        help="write wall time, CPU time, peak RSS, rows and bytes per build phase as JSON (- for stdout)",
+    )
+    parser.add_argument(
+        "--cprofile",
+        type=Path,
+        help="also dump cProfile stats of the extract, encode and stage loops into this directory",
+    )
+    return parser.parse_args()
 
 
 def main() -> None:
-    cards = collect_cards(CARDS_DIR)
-    if not cards:
-        raise FileNotFoundError(f"No cards found in {CARDS_DIR}")
-    columns = infer_columns(cards)
-    conn = create_database(DB_PATH, columns)
-    total = insert_cards(conn, cards, columns)
-    conn.execute("VACUUM")
-    conn.close()
+    args = parse_args()
+    profiler = Profiler("compile2", args.profile is not None, args.cprofile, PROFILE_HOT_PHASES)
+    cache_dir = None if args.no_cache else EXTRACT_CACHE_DIR
+    adapter = TcgdexAdapter(iter_cards(CARDS_DIR, cache_dir))
+    total = compile_cards(DB_PATH, adapter, args, profiler, args.intern)
+    profiler.write(args.profile)
     print(f"Compiled {total} cards into {DB_PATH}")
 
 
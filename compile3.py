@@ -1,30 +1,46 @@
+import argparse
 import json
+import os
 import sqlite3
-from datetime import date
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Any
+from typing import Any, NamedTuple
+
+from compiler import (
+    EXCLUDED_KEYS,
+    SQLITE_TYPE_BY_PYTHON_TYPE,
+    TABLE_NAME,
+    CardBatch,
+    ExtraGetter,
+    PackMetadata,
+    SourceAdapter,
+    Staging,
+    assign_pack_ids,
+    build_batch,
+    collect_key_types,
+    compile_cards,
+    copy_staged_rows,
+    encode_value,
+    iter_card_files,
+    read_set_metadata,
+    small_image_url,
+)
+from profiling import Profiler
+from x import normalize_sets
 
 CARDS_DIR = Path("pokemon-tcg-data/cards/en")
 SETS_PATH = Path("pokemon-tcg-data/sets/en2.json")
 DB_PATH = Path("api/cards.sqlite")
-TABLE_NAME = "cards"
-EXCLUDED_KEYS = {
-    "retreatCost",
-    "flavorText",
-    "legalities",
-    "images",
-    "nationalPokedexNumbers",
-}
-SQLITE_TYPE_BY_PYTHON_TYPE: dict[type[Any], str] = {
-    int: "INTEGER",
-    float: "REAL",
-    str: "TEXT",
-    bool: "INTEGER",
-}
-
-
-def iter_card_files(cards_dir: Path) -> list[Path]:
-    return sorted(cards_dir.glob("*.json"))
+PROFILE_HOT_PHASES = ("parse", "stage")
+CHILD_KEY_COLUMNS = [("cardId", "TEXT"), ("ordinal", "INTEGER")]
+CHILD_INDEX_COLUMNS = ("name", "type", "damage", "value")
+
+
+class CardFile(NamedTuple):
+    batch: CardBatch
+    children: dict[str, CardBatch]
 
 
 def flatten_value(prefix: str, value: Any, output: dict[str, Any]) -> None:
@@ -50,23 +66,40 @@ def flatten_card(card: dict[str, Any]) -> dict[str, Any]:
     return flat
 
 
-def infer_columns(card_files: list[Path]) -> list[tuple[str, str]]:
-    key_types: dict[str, set[type[Any]]] = {}
-    for path in card_files:
-        with path.open("r", encoding="utf-8") as f:
-            cards = json.load(f)
-        for card in cards:
-            flat_card = flatten_card(card)
-            for key, value in flat_card.items():
-                if value is None:
-                    key_types.setdefault(key, set())
-                    continue
-                key_types.setdefault(key, set()).add(type(value))
-    if "id" not in key_types:
-        raise ValueError("Missing required key: id")
-    ordered_keys = ["id"] + sorted(k for k in key_types if k != "id")
-    columns: list[tuple[str, str]] = []
-    for key in ordered_keys:
+def split_card(card: dict[str, Any]) -> tuple[dict[str, Any], dict[str, list[dict[str, Any]]]]:
+    flat: dict[str, Any] = {}
+    children: dict[str, list[dict[str, Any]]] = {}
+    for key, value in card.items():
+        if key in EXCLUDED_KEYS:
+            continue
+        if isinstance(value, list):
+            children[key] = [child_values(item) for item in value]
+            continue
+        flatten_value(key, value, flat)
+    return flat, children
+
+
+def child_values(item: Any) -> dict[str, Any]:
+    if isinstance(item, dict):
+        return {key: encode_value(value) for key, value in item.items()}
+    return {"value": encode_value(item)}
+
+
+def tabulate(
+    records: list[dict[str, Any]],
+    extras: dict[str, ExtraGetter] | None = None,
+    sources: list[dict[str, Any]] | None = None,
+) -> CardBatch:
+    key_types = collect_key_types(records)
+    for types in key_types.values():
+        types.discard(type(None))
+    return build_batch(records, key_types, extras, sources)
+
+
+def infer_child_columns(key_types: dict[str, set[type[Any]]]) -> list[tuple[str, str]]:
+    child_key_names = {name for name, _ in CHILD_KEY_COLUMNS}
+    columns = list(CHILD_KEY_COLUMNS)
+    for key in sorted(k for k in key_types if k not in child_key_names):
         types = key_types[key]
         if len(types) != 1:
             sqlite_type = "TEXT"
@@ -74,114 +107,186 @@ def infer_columns(card_files: list[Path]) -> list[tuple[str, str]]:
             value_type = next(iter(types))
             sqlite_type = SQLITE_TYPE_BY_PYTHON_TYPE.get(value_type, "TEXT")
         columns.append((key, sqlite_type))
-    columns.extend(
-        [
-            ("packName", "TEXT"),
-            ("packSeries", "TEXT"),
-            ("packCode", "TEXT"),
-            ("releaseDate", "DATE"),
-            ("imageUrl", "TEXT"),
-        ]
-    )
     return columns
 
 
-def create_database(db_path: Path, columns: list[tuple[str, str]]) -> sqlite3.Connection:
-    db_path.parent.mkdir(parents=True, exist_ok=True)
-    if db_path.exists():
-        db_path.unlink()
-    conn = sqlite3.connect(db_path)
-    conn.execute("PRAGMA journal_mode = OFF")
-    conn.execute("PRAGMA synchronous = OFF")
-    conn.execute("PRAGMA temp_store = MEMORY")
-    conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+def create_child_table(
+    conn: sqlite3.Connection, key: str, columns: list[tuple[str, str]], without_rowid: bool = False
+) -> str:
+    table_name = f"{TABLE_NAME}_{key}"
     definitions = [f'"{name}" {col_type}' for name, col_type in columns]
-    definitions[0] = f'{definitions[0]} PRIMARY KEY'
-    conn.execute(f'DROP TABLE IF EXISTS "{TABLE_NAME}"')
-    conn.execute(f'CREATE TABLE "{TABLE_NAME}" ({", ".join(definitions)})')
-    return conn
+    definitions[0] = f'{definitions[0]} NOT NULL REFERENCES "{TABLE_NAME}" ("id")'
+    conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    conn.execute(
+        f'CREATE TABLE "{table_name}" ({", ".join(definitions)}, PRIMARY KEY ("cardId", "ordinal"))'
+        + (" WITHOUT ROWID" if without_rowid else "")
+    )
+    return table_name
+
+
+def create_child_indexes(
+    conn: sqlite3.Connection, table_name: str, columns: list[tuple[str, str]]
+) -> None:
+    for name, _ in columns:
+        if name in CHILD_INDEX_COLUMNS:
+            conn.execute(f'CREATE INDEX "{table_name}_{name}" ON "{table_name}" ("{name}")')
+
+
+def read_card_file(path: Path, set_pack_ids: dict[str, int], normalized: bool = False) -> CardFile:
+    pack_id = set_pack_ids.get(path.stem)
+    with path.open("r", encoding="utf-8") as f:
+        cards = json.load(f)
+    flat_cards: list[dict[str, Any]] = []
+    child_records: dict[str, list[dict[str, Any]]] = {}
+    for card in cards:
+        if not normalized:
+            flat_cards.append(flatten_card(card))
+            continue
+        flat_card, children = split_card(card)
+        flat_cards.append(flat_card)
+        for key, items in children.items():
+            records = child_records.setdefault(key, [])
+            for ordinal, values in enumerate(items, start=1):
+                records.append({"cardId": card.get("id"), "ordinal": ordinal, **values})
+    extras = {"packId": lambda _: pack_id, "imageUrl": small_image_url}
+    return CardFile(
+        tabulate(flat_cards, extras, cards),
+        {key: tabulate(records) for key, records in child_records.items()},
+    )
 
 
-def insert_cards(
-    conn: sqlite3.Connection,
+def iter_read_card_files(
     card_files: list[Path],
-    columns: list[tuple[str, str]],
-    set_metadata: dict[str, tuple[str | None, str | None, str | None, date | None]],
-) -> int:
-    column_names = [name for name, _ in columns]
-    placeholders = ", ".join("?" for _ in column_names)
-    quoted_columns = ", ".join(f'"{name}"' for name in column_names)
-    sql = f'INSERT INTO "{TABLE_NAME}" ({quoted_columns}) VALUES ({placeholders})'
-    total = 0
-    with conn:
+    set_pack_ids: dict[str, int],
+    workers: int,
+    normalized: bool = False,
+) -> Iterator[CardFile]:
+    if workers <= 1:
         for path in card_files:
-            pack_name, pack_series, pack_code, release_date = set_metadata.get(
-                path.stem, (None, None, None, None)
-            )
-            with path.open("r", encoding="utf-8") as f:
-                cards = json.load(f)
-            rows = []
-            for card in cards:
-                image_url = None
-                images = card.get("images")
-                if isinstance(images, dict):
-                    image_url = images.get("small")
-                flat_card = flatten_card(card)
-                values: list[Any] = []
-                for name in column_names:
-                    if name == "packName":
-                        values.append(pack_name)
-                    elif name == "packSeries":
-                        values.append(pack_series)
-                    elif name == "packCode":
-                        values.append(pack_code)
-                    elif name == "releaseDate":
-                        values.append(release_date.isoformat() if release_date is not None else None)
-                    elif name == "imageUrl":
-                        values.append(image_url)
-                    else:
-                        values.append(flat_card.get(name))
-                rows.append(tuple(values))
-            conn.executemany(sql, rows)
-            total += len(rows)
-    return total
-
-
-def parse_release_date(value: Any) -> date | None:
-    if not isinstance(value, str):
-        return None
-    try:
-        return date.fromisoformat(value.replace("/", "-"))
-    except ValueError:
-        return None
-
-
-def load_set_metadata(
-    sets_path: Path,
-) -> dict[str, tuple[str | None, str | None, str | None, date | None]]:
-    with sets_path.open("r", encoding="utf-8") as f:
-        sets = json.load(f)
-    metadata: dict[str, tuple[str | None, str | None, str | None, date | None]] = {}
-    for item in sets:
-        metadata[item["id"]] = (
-            item.get("name"),
-            item.get("series"),
-            item.get("ptcgoCode"),
-            parse_release_date(item.get("releaseDate")),
+            yield read_card_file(path, set_pack_ids, normalized)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(read_card_file, card_files, repeat(set_pack_ids), repeat(normalized))
+
+
+def count_card_rows(card_file: CardFile) -> int:
+    return len(card_file.batch.rows)
+
+
+class FlattenedAdapter(SourceAdapter):
+    name = "compile3"
+    cards_dir = CARDS_DIR
+
+    def __init__(
+        self,
+        card_files: list[Path],
+        set_metadata: dict[str, PackMetadata],
+        workers: int = 1,
+        normalized: bool = False,
+    ) -> None:
+        super().__init__()
+        self.card_files = card_files
+        self.workers = workers
+        self.normalized = normalized
+        self.set_pack_ids = assign_pack_ids(card_files, set_metadata, self.packs)
+        self.pack_metadata = set_metadata
+        self.children: dict[str, Staging] = {}
+
+    def input_paths(self) -> list[Path]:
+        return [*self.card_files, SETS_PATH]
+
+    def metadata(self) -> dict[str, str]:
+        return {**super().metadata(), "normalized": str(self.normalized).lower()}
+
+    def stage(self, staging: Staging, profiler: Profiler) -> None:
+        card_file_reader = iter_read_card_files(
+            self.card_files, self.set_pack_ids, self.workers, self.normalized
         )
-    return metadata
+        for card_file in profiler.timed("parse", card_file_reader, count_card_rows):
+            with profiler.phase("stage") as phase:
+                phase.add(rows=staging.add(card_file.batch))
+                for key, batch in card_file.children.items():
+                    child_staging = self.children.get(key)
+                    if child_staging is None:
+                        child_staging = self.children[key] = Staging(
+                            staging.conn, f"{TABLE_NAME}_{key}_staging", CHILD_KEY_COLUMNS
+                        )
+                    child_staging.add(batch)
+
+    def build_extra(self, conn: sqlite3.Connection, serving: bool, profiler: Profiler) -> None:
+        with profiler.phase("children") as phase:
+            for key in sorted(self.children):
+                child_staging = self.children[key]
+                child_columns = infer_child_columns(child_staging.key_types)
+                child_table_name = create_child_table(
+                    conn, key, child_columns, without_rowid=serving
+                )
+                with conn:
+                    phase.add(
+                        rows=copy_staged_rows(
+                            conn, child_staging.table_name, child_table_name, child_columns
+                        )
+                    )
+                create_child_indexes(conn, child_table_name, child_columns)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=f"Compile {CARDS_DIR} into {DB_PATH}.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processes used to parse card files (0 uses every CPU)",
+    )
+    parser.add_argument(
+        "--serving",
+        action="store_true",
+        help="build for read serving: WITHOUT ROWID cards, covering indexes, ANALYZE and larger pages",
+    )
+    parser.add_argument(
+        "--normalized",
+        action="store_true",
+        help="write list fields such as attacks into indexed child tables instead of positional columns",
+    )
+    parser.add_argument(
+        "--keep",
+        type=int,
+        default=0,
+        help=f"keep this many previous generations of {DB_PATH} next to it",
+    )
+    parser.add_argument(
+        "--patch",
+        type=Path,
+        help=f"also write a row-level patch from the current {DB_PATH} to the new build",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        help="write wall time, CPU time, peak RSS, rows and bytes per build phase as JSON (- for stdout)",
+    )
+    parser.add_argument(
+        "--cprofile",
+        type=Path,
+        help="also dump cProfile stats of the parse and stage loops into this directory",
+    )
+    args = parser.parse_args()
+    if args.workers == 0:
+        args.workers = os.cpu_count() or 1
+    return args
 
 
 def main() -> None:
-    card_files = iter_card_files(CARDS_DIR)
-    if not card_files:
-        raise FileNotFoundError(f"No JSON files found in {CARDS_DIR}")
-    set_metadata = load_set_metadata(SETS_PATH)
-    columns = infer_columns(card_files)
-    conn = create_database(DB_PATH, columns)
-    total = insert_cards(conn, card_files, columns, set_metadata)
-    conn.execute("VACUUM")
-    conn.close()
+    args = parse_args()
+    profiler = Profiler("compile3", args.profile is not None, args.cprofile, PROFILE_HOT_PHASES)
+    with profiler.phase("discover") as phase:
+        card_files = iter_card_files(CARDS_DIR)
+        if not card_files:
+            raise FileNotFoundError(f"No JSON files found in {CARDS_DIR}")
+        set_metadata = read_set_metadata(normalize_sets(SETS_PATH, SETS_PATH))
+        phase.add(rows=len(card_files), size=sum(path.stat().st_size for path in card_files))
+    adapter = FlattenedAdapter(card_files, set_metadata, args.workers, args.normalized)
+    total = compile_cards(DB_PATH, adapter, args, profiler)
+    profiler.write(args.profile)
     print(f"Compiled {total} cards into {DB_PATH}")
 
 
@@ -0,0 +1,816 @@
+import argparse
+import filecmp
+import hashlib
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable
+from datetime import date
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from dbpatch import patch_summary, write_patch
+from deck import build_deck_index, deck_index_path
+from profiling import Profiler
+from publish import build_path, publish_database, validate_database, write_version
+from shards import MANIFEST_NAME, shards_path, write_pack_shards
+
+try:
+    import snapshot
+except ImportError:
+    snapshot = None
+
+TABLE_NAME = "cards"
+STAGING_TABLE_NAME = "cards_staging"
+PACKS_TABLE_NAME = "packs"
+METADATA_TABLE_NAME = "build_metadata"
+DEFAULT_PAGE_SIZE = 4096
+SERVING_PAGE_SIZE = 8192
+SERVING_INDEXES = [
+    ("cards_pack_rarity", TABLE_NAME, ["packId", "rarity", "name", "number"]),
+    ("cards_pack_number", TABLE_NAME, ["packId", "number"]),
+    ("cards_name", TABLE_NAME, ["name", "packId", "number"]),
+    ("packs_code", PACKS_TABLE_NAME, ["packCode"]),
+]
+EXCLUDED_KEYS = frozenset(
+    {
+        "retreatCost",
+        "flavorText",
+        "legalities",
+        "images",
+        "nationalPokedexNumbers",
+    }
+)
+EXTRA_COLUMNS = [
+    ("packId", "INTEGER"),
+    ("imageUrl", "TEXT"),
+]
+SQLITE_TYPE_BY_PYTHON_TYPE: dict[type[Any], str] = {
+    int: "INTEGER",
+    float: "REAL",
+    str: "TEXT",
+    bool: "INTEGER",
+}
+JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, check_circular=False, separators=(",", ":"))
+ENCODED_TYPES = {list, dict}
+INTERNED_TYPES = {list, dict, type(None)}
+SHADOW_DIGITS = "0123456789"
+SHADOW_MAX_SUFFIX = 3
+SHADOW_MIN_SHARE = 0.9
+SHADOW_SAMPLE_LIMIT = 5
+INPUT_CHUNK_SIZE = 1 << 20
+
+PackMetadata = tuple[str | None, str | None, str | None, date | None]
+ExtraGetter = Callable[[dict[str, Any]], Any]
+
+
+class ShadowColumn(NamedTuple):
+    source: str
+    has_suffix: bool
+    uncoerced: int
+    samples: list[Any]
+    empty: int = 0
+
+
+class CardBatch(NamedTuple):
+    column_names: list[str]
+    rows: list[tuple[Any, ...]]
+    key_types: dict[str, set[type[Any]]]
+
+
+def iter_card_files(cards_dir: Path) -> list[Path]:
+    return sorted(cards_dir.glob("*.json"))
+
+
+def collect_key_types(
+    records: Iterable[dict[str, Any]], excluded: frozenset[str] = frozenset()
+) -> dict[str, set[type[Any]]]:
+    key_types: dict[str, set[type[Any]]] = {}
+    for record in records:
+        for key, value in record.items():
+            types = key_types.get(key)
+            if types is None:
+                if key in excluded:
+                    continue
+                types = key_types[key] = set()
+            types.add(type(value))
+    return key_types
+
+
+def encode_value(value: Any, cache: dict[tuple[str, ...], str] | None = None) -> Any:
+    if not isinstance(value, (list, dict)):
+        return value
+    if cache is None or not isinstance(value, list) or not all(type(item) is str for item in value):
+        return JSON_ENCODER.encode(value)
+    key = tuple(value)
+    encoded = cache.get(key)
+    if encoded is None:
+        encoded = cache[key] = JSON_ENCODER.encode(value)
+    return encoded
+
+
+class RowBuilder:
+    def __init__(
+        self, key_types: dict[str, set[type[Any]]], extras: dict[str, ExtraGetter] | None = None
+    ) -> None:
+        self.keys = list(key_types)
+        self.column_names = self.keys + list(extras or {})
+        self.encoded = [
+            position for position, key in enumerate(self.keys) if key_types[key] & ENCODED_TYPES
+        ]
+        self.extras = list((extras or {}).values())
+        self.cache: dict[tuple[str, ...], str] = {}
+
+    def build(
+        self,
+        records: list[dict[str, Any]],
+        sources: list[dict[str, Any]] | None = None,
+    ) -> list[tuple[Any, ...]]:
+        keys = self.keys
+        encoded = self.encoded
+        extras = self.extras
+        cache = self.cache
+        rows: list[tuple[Any, ...]] = []
+        for record, source in zip(records, sources or records):
+            values = list(map(record.get, keys))
+            for position in encoded:
+                values[position] = encode_value(values[position], cache)
+            for extra in extras:
+                values.append(extra(source))
+            rows.append(tuple(values))
+        return rows
+
+
+def build_batch(
+    records: list[dict[str, Any]],
+    key_types: dict[str, set[type[Any]]],
+    extras: dict[str, ExtraGetter] | None = None,
+    sources: list[dict[str, Any]] | None = None,
+) -> CardBatch:
+    builder = RowBuilder(key_types, extras)
+    return CardBatch(builder.column_names, builder.build(records, sources), key_types)
+
+
+def small_image_url(card: dict[str, Any]) -> Any:
+    images = card.get("images")
+    if isinstance(images, dict):
+        return images.get("small")
+    return None
+
+
+def infer_columns(
+    key_types: dict[str, set[type[Any]]], interned: Iterable[str] = ()
+) -> list[tuple[str, str]]:
+    if "id" not in key_types:
+        raise ValueError("Missing required key: id")
+    ordered_keys = ["id"] + sorted(k for k in key_types if k != "id")
+    interned_names = set(interned)
+    columns: list[tuple[str, str]] = []
+    for key in ordered_keys:
+        types = key_types[key]
+        if key in interned_names:
+            sqlite_type = "INTEGER"
+        elif len(types) != 1:
+            sqlite_type = "TEXT"
+        else:
+            sqlite_type = SQLITE_TYPE_BY_PYTHON_TYPE.get(next(iter(types)), "TEXT")
+        columns.append((key, sqlite_type))
+    columns.extend(EXTRA_COLUMNS)
+    return columns
+
+
+def internable_columns(key_types: dict[str, set[type[Any]]]) -> list[str]:
+    return [
+        name for name, types in key_types.items() if types & {list, dict} and types <= INTERNED_TYPES
+    ]
+
+
+def value_table_name(column_name: str) -> str:
+    return f"{TABLE_NAME}_{column_name}_values"
+
+
+def create_value_table(conn: sqlite3.Connection, column_name: str) -> None:
+    table_name = value_table_name(column_name)
+    conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    conn.execute(f'CREATE TABLE "{table_name}" ("id" INTEGER PRIMARY KEY, "value" TEXT NOT NULL)')
+
+
+def read_value_tables(conn: sqlite3.Connection) -> dict[str, dict[str, int]]:
+    prefix = f"{TABLE_NAME}_"
+    interned: dict[str, dict[str, int]] = {}
+    for (table_name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?",
+        (f"{prefix}*_values",),
+    ):
+        column_name = table_name[len(prefix) : -len("_values")]
+        interned[column_name] = {
+            value: value_id
+            for value_id, value in conn.execute(f'SELECT "id", "value" FROM "{table_name}"')
+        }
+    return interned
+
+
+def intern_rows(
+    conn: sqlite3.Connection,
+    interned: dict[str, dict[str, int]],
+    column_names: list[str],
+    key_types: dict[str, set[type[Any]]],
+    rows: list[tuple[Any, ...]],
+    interned_rowids: dict[str, list[int]] | None = None,
+    first_rowid: int = 1,
+    intern_columns: set[str] | None = None,
+) -> list[tuple[Any, ...]]:
+    internable = set(internable_columns(key_types))
+    if intern_columns is not None:
+        internable &= intern_columns
+    positions = [position for position, name in enumerate(column_names) if name in internable]
+    if not positions:
+        return rows
+    for position in positions:
+        if column_names[position] not in interned:
+            create_value_table(conn, column_names[position])
+            interned[column_names[position]] = {}
+    new_values: dict[str, list[tuple[int, str]]] = {}
+    interned_rows: list[tuple[Any, ...]] = []
+    for rowid, row in enumerate(rows, first_rowid):
+        values = list(row)
+        for position in positions:
+            value = values[position]
+            if value is None:
+                continue
+            if interned_rowids is not None:
+                interned_rowids.setdefault(column_names[position], []).append(rowid)
+            ids = interned[column_names[position]]
+            value_id = ids.get(value)
+            if value_id is None:
+                value_id = ids[value] = len(ids) + 1
+                new_values.setdefault(column_names[position], []).append((value_id, value))
+            values[position] = value_id
+        interned_rows.append(tuple(values))
+    for column_name, values in new_values.items():
+        conn.executemany(
+            f'INSERT INTO "{value_table_name(column_name)}" ("id", "value") VALUES (?, ?)', values
+        )
+    return interned_rows
+
+
+def revert_mixed_columns(
+    conn: sqlite3.Connection,
+    interned: dict[str, dict[str, int]],
+    key_types: dict[str, set[type[Any]]],
+    interned_rowids: dict[str, list[int]],
+    staging_table_name: str = STAGING_TABLE_NAME,
+) -> None:
+    internable = set(internable_columns(key_types))
+    for column_name in [name for name in interned if name not in internable]:
+        table_name = value_table_name(column_name)
+        staged_value = f'"{staging_table_name}"."{column_name}"'
+        conn.executemany(
+            f'UPDATE "{staging_table_name}" SET "{column_name}" = '
+            f'(SELECT "value" FROM "{table_name}" WHERE "id" = {staged_value}) WHERE rowid = ?',
+            [(rowid,) for rowid in interned_rowids.pop(column_name, [])],
+        )
+        conn.execute(f'DROP TABLE "{table_name}"')
+        del interned[column_name]
+
+
+def create_decoded_view(
+    conn: sqlite3.Connection, columns: list[tuple[str, str]], interned: Iterable[str]
+) -> None:
+    interned_names = set(interned)
+    selected: list[str] = []
+    joins: list[str] = []
+    for position, (name, _) in enumerate(columns):
+        if name in interned_names:
+            selected.append(f'v{position}."value" AS "{name}"')
+            joins.append(
+                f'LEFT JOIN "{value_table_name(name)}" AS v{position} ON v{position}."id" = c."{name}"'
+            )
+        else:
+            selected.append(f'c."{name}"')
+    conn.execute(f'DROP VIEW IF EXISTS "{TABLE_NAME}_decoded"')
+    conn.execute(
+        f'CREATE VIEW "{TABLE_NAME}_decoded" AS SELECT {", ".join(selected)} '
+        f'FROM "{TABLE_NAME}" AS c {" ".join(joins)}'
+    )
+
+
+def create_database(db_path: Path, page_size: int = DEFAULT_PAGE_SIZE) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    if db_path.exists():
+        db_path.unlink()
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"PRAGMA page_size = {page_size}")
+    conn.execute("PRAGMA auto_vacuum = NONE")
+    conn.execute("PRAGMA encoding = 'UTF-8'")
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+    return conn
+
+
+def create_cards_table(
+    conn: sqlite3.Connection, columns: list[tuple[str, str]], without_rowid: bool = False
+) -> None:
+    definitions = [f'"{name}" {col_type}' for name, col_type in columns]
+    definitions[0] = f"{definitions[0]} PRIMARY KEY"
+    options = " WITHOUT ROWID" if without_rowid else ""
+    conn.execute(f'DROP TABLE IF EXISTS "{TABLE_NAME}"')
+    conn.execute(f'CREATE TABLE "{TABLE_NAME}" ({", ".join(definitions)}){options}')
+
+
+def create_serving_indexes(conn: sqlite3.Connection) -> None:
+    for index_name, table_name, index_columns in SERVING_INDEXES:
+        table_columns = {row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')}
+        if not table_columns.issuperset(index_columns):
+            continue
+        quoted_columns = ", ".join(f'"{name}"' for name in index_columns)
+        conn.execute(
+            f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ({quoted_columns})'
+        )
+    conn.execute("ANALYZE")
+
+
+def shadow_candidates(key_types: dict[str, set[type[Any]]]) -> list[str]:
+    return sorted(
+        key
+        for key, types in key_types.items()
+        if key != "id" and str in types and not types & {float, bool, list, dict}
+    )
+
+
+def numeric_condition(quoted: str) -> str:
+    suffix = f"ltrim({quoted}, '{SHADOW_DIGITS}')"
+    return (
+        f"({quoted} GLOB '[0-9]*' AND {suffix} NOT GLOB '*[0-9]*' "
+        f"AND length({suffix}) <= {SHADOW_MAX_SUFFIX})"
+    )
+
+
+def detect_shadow_columns(
+    conn: sqlite3.Connection, table_name: str, candidates: list[str]
+) -> tuple[list[ShadowColumn], list[tuple[str, int, int]]]:
+    shadows: list[ShadowColumn] = []
+    rejected: list[tuple[str, int, int]] = []
+    for name in candidates:
+        quoted = f'"{name}"'
+        numeric_value = numeric_condition(quoted)
+        total, empty, numeric, suffixed = conn.execute(
+            f"SELECT COUNT({quoted}), COALESCE(SUM({quoted} = ''), 0), "
+            f"COALESCE(SUM({numeric_value}), 0), "
+            f"COALESCE(SUM({numeric_value} AND ltrim({quoted}, '{SHADOW_DIGITS}') <> ''), 0) "
+            f'FROM "{table_name}"'
+        ).fetchone()
+        total -= empty
+        if total == 0 or numeric == 0:
+            continue
+        if numeric < total * SHADOW_MIN_SHARE:
+            rejected.append((name, numeric, total))
+            continue
+        samples = [
+            row[0]
+            for row in conn.execute(
+                f'SELECT DISTINCT {quoted} FROM "{table_name}" '
+                f"WHERE {quoted} IS NOT NULL AND {quoted} <> '' AND NOT {numeric_value} LIMIT ?",
+                (SHADOW_SAMPLE_LIMIT,),
+            )
+        ]
+        shadows.append(ShadowColumn(name, suffixed > 0, total - numeric, samples, empty))
+    return shadows, rejected
+
+
+def read_shadow_columns(column_names: list[str]) -> list[ShadowColumn]:
+    names = set(column_names)
+    return [
+        ShadowColumn(name, f"{name}_suffix" in names, 0, [])
+        for name in column_names
+        if f"{name}_int" in names
+    ]
+
+
+def shadow_definitions(shadows: list[ShadowColumn]) -> list[tuple[str, str]]:
+    columns: list[tuple[str, str]] = []
+    for shadow in shadows:
+        columns.append((f"{shadow.source}_int", "INTEGER"))
+        if shadow.has_suffix:
+            columns.append((f"{shadow.source}_suffix", "TEXT"))
+    return columns
+
+
+def shadow_expressions(shadows: list[ShadowColumn]) -> list[str]:
+    expressions: list[str] = []
+    for shadow in shadows:
+        quoted = f'"{shadow.source}"'
+        numeric = numeric_condition(quoted)
+        digits = f"length({quoted}) - length(ltrim({quoted}, '{SHADOW_DIGITS}'))"
+        expressions.append(
+            f"CASE WHEN {numeric} THEN CAST(substr({quoted}, 1, {digits}) AS INTEGER) END"
+        )
+        if shadow.has_suffix:
+            expressions.append(f"CASE WHEN {numeric} THEN ltrim({quoted}, '{SHADOW_DIGITS}') END")
+    return expressions
+
+
+def create_shadow_indexes(conn: sqlite3.Connection, shadows: list[ShadowColumn]) -> None:
+    for shadow in shadows:
+        index_columns = [f"{shadow.source}_int"]
+        if shadow.has_suffix:
+            index_columns = ["packId", *index_columns, f"{shadow.source}_suffix"]
+        quoted_columns = ", ".join(f'"{name}"' for name in index_columns)
+        conn.execute(
+            f'CREATE INDEX IF NOT EXISTS "{TABLE_NAME}_{shadow.source}_int" '
+            f'ON "{TABLE_NAME}" ({quoted_columns})'
+        )
+
+
+def report_shadow_columns(
+    shadows: list[ShadowColumn], rejected: list[tuple[str, int, int]]
+) -> None:
+    for shadow in shadows:
+        notes = [f"Typed {', '.join(name for name, _ in shadow_definitions([shadow]))}"]
+        if shadow.uncoerced:
+            samples = ", ".join(str(sample) for sample in shadow.samples)
+            notes.append(f"{shadow.uncoerced} {shadow.source} values left NULL (e.g. {samples})")
+        if shadow.empty:
+            notes.append(f"{shadow.empty} empty {shadow.source} values left NULL")
+        print("; ".join(notes))
+    for name, numeric, total in rejected:
+        print(f"Could not coerce {name}: only {numeric} of {total} values are numeric")
+
+
+def create_packs_table(conn: sqlite3.Connection) -> None:
+    conn.execute(f'DROP TABLE IF EXISTS "{PACKS_TABLE_NAME}"')
+    conn.execute(
+        f'CREATE TABLE "{PACKS_TABLE_NAME}" ('
+        '"id" INTEGER PRIMARY KEY, "setId" TEXT NOT NULL UNIQUE, "packName" TEXT, '
+        '"packSeries" TEXT, "packCode" TEXT, "releaseDate" DATE, '
+        '"cardCount" INTEGER NOT NULL DEFAULT 0)'
+    )
+
+
+def read_packs(conn: sqlite3.Connection) -> dict[str, int] | None:
+    column_names = [row[1] for row in conn.execute(f'PRAGMA table_info("{PACKS_TABLE_NAME}")')]
+    if not column_names:
+        return {}
+    if "setId" not in column_names:
+        return None
+    return dict(conn.execute(f'SELECT "setId", "id" FROM "{PACKS_TABLE_NAME}"'))
+
+
+def assign_pack_ids(
+    card_files: list[Path],
+    set_metadata: dict[str, PackMetadata],
+    packs: dict[str, int],
+) -> dict[str, int]:
+    next_pack_id = max(packs.values(), default=0) + 1
+    set_pack_ids: dict[str, int] = {}
+    for path in card_files:
+        if path.stem not in set_metadata:
+            continue
+        if path.stem not in packs:
+            packs[path.stem] = next_pack_id
+            next_pack_id += 1
+        set_pack_ids[path.stem] = packs[path.stem]
+    return set_pack_ids
+
+
+def write_packs(
+    conn: sqlite3.Connection, packs: dict[str, int], pack_metadata: dict[str, PackMetadata]
+) -> None:
+    rows: list[tuple[int, str, str | None, str | None, str | None, str | None]] = []
+    for set_id, pack_id in packs.items():
+        metadata = pack_metadata.get(set_id)
+        if metadata is None:
+            continue
+        pack_name, pack_series, pack_code, release_date = metadata
+        release_value = release_date.isoformat() if release_date is not None else None
+        rows.append((pack_id, set_id, pack_name, pack_series, pack_code, release_value))
+    conn.executemany(
+        f'INSERT INTO "{PACKS_TABLE_NAME}" '
+        '("id", "setId", "packName", "packSeries", "packCode", "releaseDate") '
+        "VALUES (?, ?, ?, ?, ?, ?) "
+        'ON CONFLICT ("id") DO UPDATE SET "packName" = excluded."packName", '
+        '"packSeries" = excluded."packSeries", "packCode" = excluded."packCode", '
+        '"releaseDate" = excluded."releaseDate"',
+        sorted(rows),
+    )
+    counts = conn.execute(
+        f'SELECT COUNT(*), "packId" FROM "{TABLE_NAME}" WHERE "packId" IS NOT NULL GROUP BY "packId"'
+    ).fetchall()
+    conn.execute(f'UPDATE "{PACKS_TABLE_NAME}" SET "cardCount" = 0')
+    conn.executemany(f'UPDATE "{PACKS_TABLE_NAME}" SET "cardCount" = ? WHERE "id" = ?', counts)
+    conn.execute(f'DELETE FROM "{PACKS_TABLE_NAME}" WHERE "cardCount" = 0')
+
+
+def parse_release_date(value: Any) -> date | None:
+    if not isinstance(value, str):
+        return None
+    try:
+        return date.fromisoformat(value.replace("/", "-"))
+    except ValueError:
+        return None
+
+
+def read_set_metadata(sets: Iterable[dict[str, Any]]) -> dict[str, PackMetadata]:
+    metadata: dict[str, PackMetadata] = {}
+    for item in sets:
+        metadata[item["id"]] = (
+            item.get("name"),
+            item.get("series"),
+            item.get("ptcgoCode"),
+            parse_release_date(item.get("releaseDate")),
+        )
+    return metadata
+
+
+def load_set_metadata(sets_path: Path) -> dict[str, PackMetadata]:
+    with sets_path.open("r", encoding="utf-8") as f:
+        return read_set_metadata(json.load(f))
+
+
+def hash_inputs(paths: Iterable[Path]) -> str:
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(f"{path.as_posix()}\0{path.stat().st_size}\0".encode("utf-8"))
+        with path.open("rb") as f:
+            while chunk := f.read(INPUT_CHUNK_SIZE):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def input_metadata(paths: list[Path]) -> dict[str, str]:
+    return {"inputHash": hash_inputs(paths), "inputFiles": str(len(paths))}
+
+
+def create_metadata_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        f'CREATE TABLE IF NOT EXISTS "{METADATA_TABLE_NAME}" '
+        '("key" TEXT PRIMARY KEY, "value" TEXT NOT NULL) WITHOUT ROWID'
+    )
+
+
+def read_metadata(conn: sqlite3.Connection) -> dict[str, str]:
+    table = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (METADATA_TABLE_NAME,)
+    ).fetchone()
+    if table is None:
+        return {}
+    return dict(conn.execute(f'SELECT "key", "value" FROM "{METADATA_TABLE_NAME}" ORDER BY "key"'))
+
+
+def write_metadata(conn: sqlite3.Connection, metadata: dict[str, str]) -> None:
+    conn.execute(f'DELETE FROM "{METADATA_TABLE_NAME}"')
+    conn.executemany(
+        f'INSERT INTO "{METADATA_TABLE_NAME}" ("key", "value") VALUES (?, ?)',
+        sorted(metadata.items()),
+    )
+
+
+def publish_version(db_path: Path) -> dict[str, Any]:
+    conn = sqlite3.connect(f"file:{db_path.resolve()}?mode=ro", uri=True)
+    try:
+        metadata = read_metadata(conn)
+    finally:
+        conn.close()
+    return write_version(db_path, metadata)
+
+
+def create_staging_table(
+    conn: sqlite3.Connection,
+    table_name: str = STAGING_TABLE_NAME,
+    columns: list[tuple[str, str]] = EXTRA_COLUMNS,
+) -> set[str]:
+    quoted_columns = ", ".join(f'"{name}"' for name, _ in columns)
+    conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    conn.execute(f'CREATE TABLE "{table_name}" ({quoted_columns})')
+    return {name for name, _ in columns}
+
+
+def stage_rows(
+    conn: sqlite3.Connection,
+    table_name: str,
+    staged_columns: set[str],
+    column_names: list[str],
+    rows: list[tuple[Any, ...]],
+) -> None:
+    for name in column_names:
+        if name not in staged_columns:
+            conn.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{name}"')
+            staged_columns.add(name)
+    placeholders = ", ".join("?" for _ in column_names)
+    quoted_columns = ", ".join(f'"{name}"' for name in column_names)
+    conn.executemany(
+        f'INSERT INTO "{table_name}" ({quoted_columns}) VALUES ({placeholders})',
+        rows,
+    )
+
+
+class Staging:
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        table_name: str = STAGING_TABLE_NAME,
+        columns: list[tuple[str, str]] = EXTRA_COLUMNS,
+        interned: dict[str, dict[str, int]] | None = None,
+        intern_columns: set[str] | None = None,
+    ) -> None:
+        self.conn = conn
+        self.table_name = table_name
+        self.interned = interned
+        self.intern_columns = intern_columns
+        self.staged_columns = create_staging_table(conn, table_name, columns)
+        self.key_types: dict[str, set[type[Any]]] = {}
+        self.interned_rowids: dict[str, list[int]] = {}
+        self.rows = 0
+
+    def add(self, batch: CardBatch) -> int:
+        for key, types in batch.key_types.items():
+            self.key_types.setdefault(key, set()).update(types)
+        rows = batch.rows
+        if self.interned is not None:
+            rows = intern_rows(
+                self.conn,
+                self.interned,
+                batch.column_names,
+                batch.key_types,
+                rows,
+                self.interned_rowids,
+                self.rows + 1,
+                self.intern_columns,
+            )
+        stage_rows(self.conn, self.table_name, self.staged_columns, batch.column_names, rows)
+        self.rows += len(rows)
+        return len(rows)
+
+    def finish(self) -> dict[str, set[type[Any]]]:
+        if self.interned is not None:
+            revert_mixed_columns(
+                self.conn, self.interned, self.key_types, self.interned_rowids, self.table_name
+            )
+        return self.key_types
+
+
+def copy_staged_rows(
+    conn: sqlite3.Connection,
+    staging_table_name: str,
+    table_name: str,
+    columns: list[tuple[str, str]],
+    shadows: list[ShadowColumn] | None = None,
+) -> int:
+    shadows = shadows or []
+    quoted_columns = ", ".join(f'"{name}"' for name, _ in columns + shadow_definitions(shadows))
+    selected = ", ".join([f'"{name}"' for name, _ in columns] + shadow_expressions(shadows))
+    cursor = conn.execute(
+        f'INSERT INTO "{table_name}" ({quoted_columns}) '
+        f'SELECT {selected} FROM "{staging_table_name}" ORDER BY rowid'
+    )
+    conn.execute(f'DROP TABLE "{staging_table_name}"')
+    return cursor.rowcount
+
+
+class SourceAdapter(ABC):
+    name = "compile"
+    cards_dir = Path()
+    shadows = True
+
+    def __init__(self) -> None:
+        self.packs: dict[str, int] = {}
+        self.pack_metadata: dict[str, PackMetadata] = {}
+
+    @abstractmethod
+    def stage(self, staging: Staging, profiler: Profiler) -> None:
+        pass
+
+    def create_tables(self, conn: sqlite3.Connection) -> None:
+        pass
+
+    def write_tables(self, conn: sqlite3.Connection) -> None:
+        pass
+
+    def build_extra(self, conn: sqlite3.Connection, serving: bool, profiler: Profiler) -> None:
+        pass
+
+    def input_paths(self) -> list[Path]:
+        return sorted(path for path in self.cards_dir.rglob("*") if path.is_file())
+
+    def metadata(self) -> dict[str, str]:
+        return {"compiler": self.name, **input_metadata(self.input_paths())}
+
+
+def build_cards(
+    db_path: Path,
+    adapter: SourceAdapter,
+    profiler: Profiler,
+    serving: bool = False,
+    intern: bool = False,
+) -> int:
+    conn = create_database(db_path, SERVING_PAGE_SIZE if serving else DEFAULT_PAGE_SIZE)
+    with profiler.phase("metadata") as phase:
+        metadata = {
+            **adapter.metadata(),
+            "intern": str(intern).lower(),
+            "serving": str(serving).lower(),
+            "sqliteVersion": sqlite3.sqlite_version,
+        }
+        phase.add(rows=int(metadata["inputFiles"]))
+    interned: dict[str, dict[str, int]] | None = {} if intern else None
+    staging = Staging(conn, interned=interned)
+    try:
+        with conn:
+            adapter.stage(staging, profiler)
+            key_types = staging.finish()
+    except BaseException:
+        conn.close()
+        raise
+    if not key_types:
+        conn.close()
+        raise FileNotFoundError(f"No cards found in {adapter.cards_dir}")
+    with profiler.phase("infer") as phase:
+        columns = infer_columns(key_types, interned or ())
+        shadows: list[ShadowColumn] = []
+        rejected: list[tuple[str, int, int]] = []
+        if adapter.shadows:
+            shadows, rejected = detect_shadow_columns(
+                conn, STAGING_TABLE_NAME, shadow_candidates(key_types)
+            )
+        phase.add(rows=len(columns))
+    with profiler.phase("insert") as phase:
+        create_cards_table(conn, columns + shadow_definitions(shadows), without_rowid=serving)
+        create_packs_table(conn)
+        create_metadata_table(conn)
+        adapter.create_tables(conn)
+        with conn:
+            inserted = copy_staged_rows(conn, STAGING_TABLE_NAME, TABLE_NAME, columns, shadows)
+            write_packs(conn, adapter.packs, adapter.pack_metadata)
+            write_metadata(conn, metadata)
+            adapter.write_tables(conn)
+        phase.add(rows=inserted)
+    with profiler.phase("index"):
+        create_shadow_indexes(conn, shadows)
+        if interned:
+            create_decoded_view(conn, columns + shadow_definitions(shadows), interned)
+    report_shadow_columns(shadows, rejected)
+    adapter.build_extra(conn, serving, profiler)
+    with profiler.phase("index"):
+        if serving:
+            create_serving_indexes(conn)
+    with profiler.phase("vacuum") as phase:
+        conn.execute("VACUUM")
+        phase.add(size=db_path.stat().st_size)
+    conn.close()
+    return staging.rows
+
+
+def publish_build(staged_path: Path, db_path: Path, args: argparse.Namespace) -> bool:
+    if args.patch is not None and db_path.exists():
+        patch = write_patch(db_path, staged_path, args.patch)
+        print(f"Wrote {args.patch}: {patch_summary(patch)}")
+    if db_path.exists() and filecmp.cmp(staged_path, db_path, shallow=False):
+        staged_path.unlink()
+        print(f"{db_path} is byte-identical to the new build, keeping it")
+        return False
+    publish_database(staged_path, db_path, args.keep)
+    return True
+
+
+def outputs_exist(db_path: Path) -> bool:
+    return (
+        deck_index_path(db_path).exists()
+        and (shards_path(db_path) / MANIFEST_NAME).exists()
+        and (snapshot is None or snapshot.snapshot_matches(db_path))
+    )
+
+
+def write_outputs(db_path: Path, profiler: Profiler) -> None:
+    with profiler.phase("deck-index") as phase:
+        phase.add(rows=build_deck_index(db_path))
+    with profiler.phase("pack-shards") as phase:
+        phase.add(rows=write_pack_shards(db_path))
+    if snapshot is not None:
+        with profiler.phase("snapshot") as phase:
+            phase.add(rows=snapshot.write_snapshot(db_path))
+
+
+def compile_cards(
+    db_path: Path,
+    adapter: SourceAdapter,
+    args: argparse.Namespace,
+    profiler: Profiler,
+    intern: bool = False,
+) -> int:
+    staged_path = build_path(db_path)
+    try:
+        total = build_cards(staged_path, adapter, profiler, args.serving, intern)
+        with profiler.phase("validate") as phase:
+            validate_database(staged_path, {TABLE_NAME: total})
+            phase.add(rows=total, size=staged_path.stat().st_size)
+        with profiler.phase("publish"):
+            published = publish_build(staged_path, db_path, args)
+            publish_version(db_path)
+    except BaseException:
+        staged_path.unlink(missing_ok=True)
+        raise
+    if published or not outputs_exist(db_path):
+        write_outputs(db_path, profiler)
+    return total
@@ -0,0 +1,274 @@
+import argparse
+import gzip
+import hashlib
+import json
+import sqlite3
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+from deck import build_deck_index, deck_index_path
+from shards import MANIFEST_NAME, shards_path, write_pack_shards
+
+try:
+    import snapshot
+except ImportError:
+    snapshot = None
+
+PATCH_FORMAT = 1
+BLOB_KEY = "$blob"
+
+
+def encode_cell(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return {BLOB_KEY: value.hex()}
+    return value
+
+
+def decode_cell(value: Any) -> Any:
+    if isinstance(value, dict):
+        return bytes.fromhex(value[BLOB_KEY])
+    return value
+
+
+def encode_row(row: tuple[Any, ...]) -> list[Any]:
+    return [encode_cell(value) for value in row]
+
+
+def decode_row(row: list[Any]) -> tuple[Any, ...]:
+    return tuple(decode_cell(value) for value in row)
+
+
+def read_schema(conn: sqlite3.Connection) -> dict[str, tuple[str, str, str]]:
+    return {
+        name: (object_type, table_name, sql)
+        for object_type, name, table_name, sql in conn.execute(
+            "SELECT type, name, tbl_name, sql FROM sqlite_master "
+            "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+    }
+
+
+def table_names(schema: dict[str, tuple[str, str, str]]) -> list[str]:
+    return [
+        name
+        for name, (object_type, _, sql) in schema.items()
+        if object_type == "table" and not sql.upper().startswith("CREATE VIRTUAL")
+    ]
+
+
+def table_columns(conn: sqlite3.Connection, table_name: str) -> list[tuple[str, str]]:
+    return [(row[1], row[2]) for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+
+
+def table_key(conn: sqlite3.Connection, table_name: str) -> list[str]:
+    keyed = sorted(
+        (row[5], row[1]) for row in conn.execute(f'PRAGMA table_info("{table_name}")') if row[5]
+    )
+    if keyed:
+        return [name for _, name in keyed]
+    return [name for name, _ in table_columns(conn, table_name)]
+
+
+def iter_rows(conn: sqlite3.Connection, table_name: str) -> Iterator[tuple[Any, ...]]:
+    quoted_columns = ", ".join(f'"{name}"' for name, _ in table_columns(conn, table_name))
+    quoted_key = ", ".join(f'"{name}"' for name in table_key(conn, table_name))
+    yield from conn.execute(f'SELECT {quoted_columns} FROM "{table_name}" ORDER BY {quoted_key}')
+
+
+def content_hash(conn: sqlite3.Connection) -> str:
+    digest = hashlib.sha256()
+    for table_name in table_names(read_schema(conn)):
+        digest.update(json.dumps([table_name, table_columns(conn, table_name)]).encode("utf-8"))
+        for row in iter_rows(conn, table_name):
+            digest.update(json.dumps(encode_row(row), ensure_ascii=False).encode("utf-8"))
+            digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def diff_table(
+    old: sqlite3.Connection, new: sqlite3.Connection, table_name: str
+) -> dict[str, Any] | None:
+    columns = table_columns(new, table_name)
+    key = table_key(new, table_name)
+    key_positions = [position for position, (name, _) in enumerate(columns) if name in key]
+    old_rows = {
+        tuple(row[position] for position in key_positions): row
+        for row in iter_rows(old, table_name)
+    }
+    upserted: list[list[Any]] = []
+    for row in iter_rows(new, table_name):
+        row_key = tuple(row[position] for position in key_positions)
+        if old_rows.pop(row_key, None) != row:
+            upserted.append(encode_row(row))
+    if not upserted and not old_rows:
+        return None
+    return {
+        "columns": [name for name, _ in columns],
+        "key": [columns[position][0] for position in key_positions],
+        "deleted": [encode_row(row_key) for row_key in old_rows],
+        "upserted": upserted,
+    }
+
+
+def diff_databases(old_path: Path, new_path: Path) -> dict[str, Any]:
+    old = sqlite3.connect(f"file:{old_path.resolve()}?mode=ro", uri=True)
+    new = sqlite3.connect(f"file:{new_path.resolve()}?mode=ro", uri=True)
+    old_schema = read_schema(old)
+    new_schema = read_schema(new)
+    old_tables = set(table_names(old_schema))
+    new_tables = table_names(new_schema)
+    changed_objects = [
+        name for name, definition in new_schema.items() if old_schema.get(name) != definition
+    ]
+    rebuilt_tables = {name for name in changed_objects if new_schema[name][0] == "table"}
+    changed_objects.extend(
+        name
+        for name, (_, table_name, _) in new_schema.items()
+        if table_name in rebuilt_tables and name not in changed_objects
+    )
+    tables: dict[str, Any] = {}
+    for table_name in new_tables:
+        if table_name not in old_tables or table_name in changed_objects:
+            tables[table_name] = {
+                "create": new_schema[table_name][2],
+                "columns": [name for name, _ in table_columns(new, table_name)],
+                "key": [],
+                "deleted": [],
+                "upserted": [encode_row(row) for row in iter_rows(new, table_name)],
+            }
+            continue
+        table_patch = diff_table(old, new, table_name)
+        if table_patch is not None:
+            tables[table_name] = table_patch
+    patch = {
+        "format": PATCH_FORMAT,
+        "baseHash": content_hash(old),
+        "targetHash": content_hash(new),
+        "dropped": [
+            [old_schema[name][0], name]
+            for name in old_schema
+            if name not in new_schema or name in changed_objects
+        ],
+        "created": [
+            new_schema[name][2] for name in changed_objects if new_schema[name][0] != "table"
+        ],
+        "tables": tables,
+    }
+    old.close()
+    new.close()
+    return patch
+
+
+def write_patch(old_path: Path, new_path: Path, patch_path: Path) -> dict[str, Any]:
+    patch = diff_databases(old_path, new_path)
+    patch_path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(patch_path, "wt", encoding="utf-8") as f:
+        json.dump(patch, f, ensure_ascii=False, separators=(",", ":"))
+    return patch
+
+
+def read_patch(patch_path: Path) -> dict[str, Any]:
+    with gzip.open(patch_path, "rt", encoding="utf-8") as f:
+        patch = json.load(f)
+    if patch.get("format") != PATCH_FORMAT:
+        raise ValueError(f"Unsupported patch format in {patch_path}: {patch.get('format')}")
+    return patch
+
+
+def apply_table_patch(
+    conn: sqlite3.Connection, table_name: str, table_patch: dict[str, Any]
+) -> None:
+    if table_patch.get("create"):
+        conn.execute(table_patch["create"])
+    key = table_patch["key"]
+    if table_patch["deleted"]:
+        condition = " AND ".join(f'"{name}" = ?' for name in key)
+        conn.executemany(
+            f'DELETE FROM "{table_name}" WHERE {condition}',
+            [decode_row(row_key) for row_key in table_patch["deleted"]],
+        )
+    if table_patch["upserted"]:
+        quoted_columns = ", ".join(f'"{name}"' for name in table_patch["columns"])
+        placeholders = ", ".join("?" for _ in table_patch["columns"])
+        conn.executemany(
+            f'INSERT OR REPLACE INTO "{table_name}" ({quoted_columns}) VALUES ({placeholders})',
+            [decode_row(row) for row in table_patch["upserted"]],
+        )
+
+
+def apply_patch(db_path: Path, patch: dict[str, Any], force: bool = False) -> None:
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        if not force and content_hash(conn) != patch["baseHash"]:
+            raise ValueError(f"{db_path} does not match the base of this patch")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for object_type, name in patch["dropped"]:
+                conn.execute(f'DROP {object_type.upper()} IF EXISTS "{name}"')
+            for table_name, table_patch in patch["tables"].items():
+                apply_table_patch(conn, table_name, table_patch)
+            for sql in patch["created"]:
+                conn.execute(sql)
+            if content_hash(conn) != patch["targetHash"]:
+                raise ValueError(f"Patched {db_path} does not match the target content hash")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+            conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def patch_summary(patch: dict[str, Any]) -> str:
+    upserted = sum(len(table["upserted"]) for table in patch["tables"].values())
+    deleted = sum(len(table["deleted"]) for table in patch["tables"].values())
+    return (
+        f"{len(patch['tables'])} tables, {upserted} upserted and {deleted} deleted rows, "
+        f"{len(patch['dropped'])} dropped and {len(patch['created'])} created schema objects"
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Diff and patch compiled card databases by row.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    diff = commands.add_parser("diff", help="write a patch that turns OLD into NEW")
+    diff.add_argument("old", type=Path, help="previous database generation")
+    diff.add_argument("new", type=Path, help="new database generation")
+    diff.add_argument("-o", "--output", type=Path, required=True, help="patch file (.json.gz)")
+    apply = commands.add_parser("apply", help="apply a patch to a database in one transaction")
+    apply.add_argument("db", type=Path, help="database to patch in place")
+    apply.add_argument("patch", type=Path, help="patch file written by diff")
+    apply.add_argument(
+        "--force", action="store_true", help="skip the base content hash check before patching"
+    )
+    content = commands.add_parser("hash", help="print the content hash of a database")
+    content.add_argument("db", type=Path, help="database to hash")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.command == "diff":
+        patch = write_patch(args.old, args.new, args.output)
+        print(f"Wrote {args.output} ({args.output.stat().st_size} bytes): {patch_summary(patch)}")
+    elif args.command == "apply":
+        patch = read_patch(args.patch)
+        apply_patch(args.db, patch, args.force)
+        if deck_index_path(args.db).exists():
+            build_deck_index(args.db)
+        if (shards_path(args.db) / MANIFEST_NAME).exists():
+            write_pack_shards(args.db)
+        if snapshot is not None and snapshot.snapshot_path(args.db).exists():
+            snapshot.write_snapshot(args.db)
+        print(f"Patched {args.db}: {patch_summary(patch)}")
+    else:
+        conn = sqlite3.connect(f"file:{args.db.resolve()}?mode=ro", uri=True)
+        print(content_hash(conn))
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import argparse
+import json
+import re
+import sqlite3
+import unicodedata
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from publish import build_path, publish_database, validate_database
+
+DECK_LINE_PATTERN = re.compile(r"^\s*(\d+)\s+(.+?)\s+([A-Za-z0-9-]{2,})\s+([A-Za-z0-9-]+)\s*$")
+NAME_ONLY_LINE_PATTERN = re.compile(r"^\s*(\d+)\s+(.+?)\s*$")
+SECTION_LINE_PATTERN = re.compile(r"^\s*[^:\d][^:]*:\s*\d*\s*$")
+COMMENT_PATTERN = re.compile(r"\s+#.*$")
+NAME_SEPARATOR_PATTERN = re.compile(r"[^0-9a-z]+")
+DB_PATH = Path("api/cards.sqlite")
+DECK_INDEX_SUFFIX = ".deck.sqlite"
+FUZZY_CANDIDATES = 8
+FUZZY_MIN_SIMILARITY = 0.6
+
+
+class DeckEntry(NamedTuple):
+    count: int
+    name: str
+    pack_code: str | None
+    number: str | None
+
+
+class ResolvedCard(NamedTuple):
+    name: str
+    pack_code: str
+    number: str
+    rarity: str | None
+
+
+def parse_deck_line(line: str) -> DeckEntry | None:
+    line = COMMENT_PATTERN.sub("", line)
+    if not line.strip() or SECTION_LINE_PATTERN.match(line):
+        return None
+    match = DECK_LINE_PATTERN.match(line)
+    if match:
+        count, name, pack_code, number = match.groups()
+        return DeckEntry(int(count), name, pack_code, number)
+    match = NAME_ONLY_LINE_PATTERN.match(line)
+    if match:
+        count, name = match.groups()
+        return DeckEntry(int(count), name, None, None)
+    return None
+
+
+def parse_deck(text: str) -> list[DeckEntry]:
+    entries: list[DeckEntry] = []
+    for line in text.splitlines():
+        entry = parse_deck_line(line)
+        if entry is not None:
+            entries.append(entry)
+    return entries
+
+
+def entry_names(entry: DeckEntry) -> list[str]:
+    if entry.pack_code is None:
+        return [entry.name]
+    return [entry.name, f"{entry.name} {entry.pack_code} {entry.number}"]
+
+
+def format_card(count: int, card: ResolvedCard) -> str:
+    return f"{count} {card.name} {card.pack_code} {card.number} # {card.rarity or ''}"
+
+
+def convert_deck(
+    text: str, resolve: Callable[[DeckEntry], ResolvedCard | None]
+) -> dict[str, Any]:
+    lines: list[str] = []
+    card_count = 0
+    missing_count = 0
+    for entry in parse_deck(text):
+        card = resolve(entry)
+        if card is None:
+            missing_count += 1
+            continue
+        lines.append(format_card(entry.count, card))
+        card_count += entry.count
+    return {"text": "\n".join(lines), "cardCount": card_count, "missingCount": missing_count}
+
+
+def normalize_name(name: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return NAME_SEPARATOR_PATTERN.sub(" ", stripped.casefold()).strip()
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def trigram_similarity(left: str, right: str) -> float:
+    left_grams = trigrams(left)
+    right_grams = trigrams(right)
+    if not left_grams or not right_grams:
+        return 0.0
+    return len(left_grams & right_grams) / len(left_grams | right_grams)
+
+
+def fts_query(normalized: str) -> str:
+    return " OR ".join(f'"{gram}"' for gram in sorted(trigrams(normalized)))
+
+
+def card_source_table(conn: sqlite3.Connection) -> str:
+    decoded = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'cards_decoded'"
+    ).fetchone()
+    return "cards_decoded" if decoded else "cards"
+
+
+def display_name(value: Any) -> str:
+    if isinstance(value, str) and value.startswith("{"):
+        try:
+            localized = json.loads(value)
+        except json.JSONDecodeError:
+            return value
+        if isinstance(localized, dict):
+            english = localized.get("en")
+            if isinstance(english, str):
+                return english
+            for item in localized.values():
+                if isinstance(item, str):
+                    return item
+    return str(value)
+
+
+def deck_index_path(db_path: Path) -> Path:
+    return db_path.with_suffix(DECK_INDEX_SUFFIX)
+
+
+def build_deck_index(db_path: Path, index_path: Path | None = None) -> int:
+    index_path = index_path or deck_index_path(db_path)
+    source = sqlite3.connect(f"file:{db_path.resolve()}?mode=ro", uri=True)
+    rows = source.execute(
+        'SELECT c."id", c."name", p."packCode", c."number", c."rarity" '
+        f'FROM "{card_source_table(source)}" AS c LEFT JOIN "packs" AS p ON p."id" = c."packId" '
+        'WHERE c."name" IS NOT NULL ORDER BY p."releaseDate" DESC, c."id"'
+    ).fetchall()
+    source.close()
+    staged_path = build_path(index_path)
+    staged_path.unlink(missing_ok=True)
+    conn = sqlite3.connect(staged_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute(
+        'CREATE TABLE "deck_cards" ("id" INTEGER PRIMARY KEY, "name" TEXT NOT NULL, '
+        '"packCode" TEXT NOT NULL, "number" TEXT NOT NULL, "rarity" TEXT)'
+    )
+    conn.execute(
+        'CREATE TABLE "deck_codes" ("packCode" TEXT NOT NULL, "number" TEXT NOT NULL, '
+        '"cardId" INTEGER NOT NULL, PRIMARY KEY ("packCode", "number")) WITHOUT ROWID'
+    )
+    conn.execute(
+        'CREATE TABLE "deck_names" ("normName" TEXT PRIMARY KEY, "cardId" INTEGER NOT NULL) '
+        "WITHOUT ROWID"
+    )
+    conn.execute(
+        'CREATE VIRTUAL TABLE "deck_names_fts" USING fts5('
+        '"normName", "cardId" UNINDEXED, tokenize = "trigram")'
+    )
+    with conn:
+        for card_id, (source_id, name, pack_code, number, rarity) in enumerate(rows, start=1):
+            name = display_name(name)
+            pack_code = pack_code or str(source_id).rsplit("-", 1)[0]
+            conn.execute(
+                'INSERT INTO "deck_cards" VALUES (?, ?, ?, ?, ?)',
+                (card_id, name, pack_code, str(number), rarity),
+            )
+            conn.execute(
+                'INSERT OR IGNORE INTO "deck_codes" VALUES (?, ?, ?)',
+                (pack_code, str(number), card_id),
+            )
+            conn.execute(
+                'INSERT OR IGNORE INTO "deck_names" VALUES (?, ?)',
+                (normalize_name(name), card_id),
+            )
+        conn.execute(
+            'INSERT INTO "deck_names_fts" ("normName", "cardId") '
+            'SELECT "normName", "cardId" FROM "deck_names"'
+        )
+    conn.execute("VACUUM")
+    conn.close()
+    try:
+        validate_database(staged_path, {"deck_cards": len(rows)})
+    except BaseException:
+        staged_path.unlink(missing_ok=True)
+        raise
+    publish_database(staged_path, index_path)
+    return len(rows)
+
+
+class DeckIndex:
+    def __init__(
+        self,
+        cards: dict[int, ResolvedCard],
+        codes: dict[tuple[str, str], int],
+        names: dict[str, int],
+    ) -> None:
+        self.cards = cards
+        self.codes = {key: cards[card_id] for key, card_id in codes.items()}
+        self.names = {key: cards[card_id] for key, card_id in names.items()}
+
+    @classmethod
+    def load(cls, index_path: Path) -> "DeckIndex":
+        conn = sqlite3.connect(f"file:{index_path.resolve()}?mode=ro", uri=True)
+        cards = {
+            row[0]: ResolvedCard(row[1], row[2], row[3], row[4])
+            for row in conn.execute(
+                'SELECT "id", "name", "packCode", "number", "rarity" FROM "deck_cards"'
+            )
+        }
+        codes = {
+            (pack_code, number): card_id
+            for pack_code, number, card_id in conn.execute('SELECT * FROM "deck_codes"')
+        }
+        names = dict(conn.execute('SELECT "normName", "cardId" FROM "deck_names"'))
+        conn.close()
+        return cls(cards, codes, names)
+
+    def fuzzy(self, conn: sqlite3.Connection, normalized: str) -> ResolvedCard | None:
+        query = fts_query(normalized)
+        if not query:
+            return None
+        rows = conn.execute(
+            'SELECT "normName", "cardId" FROM "deck_names_fts" WHERE "deck_names_fts" MATCH ? '
+            "ORDER BY rank LIMIT ?",
+            (query, FUZZY_CANDIDATES),
+        ).fetchall()
+        best_similarity = FUZZY_MIN_SIMILARITY
+        best_card: ResolvedCard | None = None
+        for candidate, card_id in rows:
+            similarity = trigram_similarity(normalized, candidate)
+            if similarity >= best_similarity:
+                best_similarity = similarity
+                best_card = self.cards[card_id]
+        return best_card
+
+    def resolve(self, entry: DeckEntry, conn: sqlite3.Connection | None = None) -> ResolvedCard | None:
+        if entry.pack_code is not None:
+            card = self.codes.get((entry.pack_code, entry.number or ""))
+            if card is not None:
+                return card
+        normalized_names = [normalize_name(name) for name in entry_names(entry)]
+        for normalized in normalized_names:
+            card = self.names.get(normalized)
+            if card is not None:
+                return card
+        if conn is None:
+            return None
+        return self.fuzzy(conn, normalized_names[0])
+
+    def convert_many(
+        self, texts: Iterable[str], conn: sqlite3.Connection | None = None
+    ) -> list[dict[str, Any]]:
+        resolved: dict[DeckEntry, ResolvedCard | None] = {}
+
+        def resolve(entry: DeckEntry) -> ResolvedCard | None:
+            key = entry._replace(count=0)
+            if key not in resolved:
+                resolved[key] = self.resolve(key, conn)
+            return resolved[key]
+
+        return [convert_deck(text, resolve) for text in texts]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Build the deck-text resolver index next to a compiled database."
+    )
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="compiled cards database")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    total = build_deck_index(args.db)
+    print(f"Indexed {total} cards into {deck_index_path(args.db)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import argparse
+import hashlib
+import sqlite3
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import numpy as np
+
+from deck import display_name
+
+DB_PATH = Path("api/cards.sqlite")
+COMMON_SLOTS = 6
+UNCOMMON_SLOTS = 3
+RARE_SLOTS = 1
+PACK_SIZE = COMMON_SLOTS + UNCOMMON_SLOTS + RARE_SLOTS
+COMMON_RANK = 0
+UNCOMMON_RANK = 1
+RARE_RANK = 2
+RARITY_RANKS = {
+    "Common": 0,
+    "Uncommon": 1,
+    "Rare": 2,
+    "Promo": 2,
+    "Classic Collection": 2,
+    "Rare Holo": 3,
+    "Rare BREAK": 3,
+    "Rare Prime": 3,
+    "Rare Prism Star": 3,
+    "Rare ACE": 3,
+    "ACE SPEC Rare": 3,
+    "Amazing Rare": 3,
+    "Radiant Rare": 3,
+    "LEGEND": 3,
+    "Rare Shiny": 3,
+    "Double Rare": 4,
+    "Rare Holo EX": 4,
+    "Rare Holo GX": 4,
+    "Rare Holo LV.X": 4,
+    "Rare Holo Star": 4,
+    "Rare Holo V": 4,
+    "Rare Holo VMAX": 4,
+    "Rare Holo VSTAR": 4,
+    "Shiny Rare": 4,
+    "Trainer Gallery Rare Holo": 4,
+    "Ultra Rare": 5,
+    "Rare Ultra": 5,
+    "Illustration Rare": 5,
+    "Shiny Ultra Rare": 5,
+    "Rare Shining": 5,
+    "Rare Secret": 6,
+    "Rare Rainbow": 6,
+    "Rare Shiny GX": 6,
+    "Special Illustration Rare": 6,
+    "Hyper Rare": 6,
+}
+RARE_SLOT_WEIGHTS = {2: 60.0, 3: 25.0, 4: 10.0, 5: 4.0, 6: 1.0}
+
+
+class PackPool(NamedTuple):
+    pack_name: str
+    common: np.ndarray
+    uncommon: np.ndarray
+    rare: np.ndarray
+    rare_cumulative: np.ndarray
+    top: np.ndarray
+    bottom: np.ndarray
+
+
+def rarity_rank(rarity: Any) -> int:
+    if not isinstance(rarity, str):
+        return RARE_RANK
+    return RARITY_RANKS.get(rarity, RARE_RANK)
+
+
+def seed_rng(seed: str, pack_name: str) -> np.random.Generator:
+    digest = hashlib.sha256(f"{seed}\0{pack_name}".encode("utf-8")).digest()
+    return np.random.default_rng(int.from_bytes(digest[:16], "little"))
+
+
+def build_pool(pack_name: str, indices: np.ndarray, ranks: np.ndarray) -> PackPool:
+    pack_ranks = ranks[indices]
+    common = indices[pack_ranks == COMMON_RANK]
+    uncommon = indices[pack_ranks == UNCOMMON_RANK]
+    rare = indices[pack_ranks >= RARE_RANK]
+    if len(common) == 0:
+        common = indices
+    if len(uncommon) == 0:
+        uncommon = common
+    if len(rare) == 0:
+        rare = indices
+    rare_ranks = ranks[rare]
+    tier_ranks, tier_sizes = np.unique(rare_ranks, return_counts=True)
+    tier_weights = {
+        int(rank): RARE_SLOT_WEIGHTS.get(int(rank), RARE_SLOT_WEIGHTS[RARE_RANK]) / int(size)
+        for rank, size in zip(tier_ranks, tier_sizes)
+    }
+    weights = np.array([tier_weights[int(rank)] for rank in rare_ranks], dtype=np.float64)
+    return PackPool(
+        pack_name=pack_name,
+        common=common,
+        uncommon=uncommon,
+        rare=rare,
+        rare_cumulative=np.cumsum(weights),
+        top=rare[rare_ranks == rare_ranks.max()],
+        bottom=rare[rare_ranks == rare_ranks.min()],
+    )
+
+
+class DrawEngine:
+    def __init__(
+        self,
+        card_ids: Sequence[str],
+        names: Sequence[str],
+        numbers: Sequence[str],
+        rarities: Sequence[str | None],
+        pack_codes: Sequence[str],
+        ranks: np.ndarray,
+        upgrade: np.ndarray,
+        pack_indices: dict[str, np.ndarray],
+    ) -> None:
+        self.card_ids = card_ids
+        self.names = names
+        self.numbers = numbers
+        self.rarities = rarities
+        self.pack_codes = pack_codes
+        self.ranks = ranks
+        self.upgrade = upgrade
+        self.pack_indices = pack_indices
+        self.pools = {
+            pack_name: build_pool(pack_name, indices, ranks)
+            for pack_name, indices in pack_indices.items()
+        }
+
+    @classmethod
+    def from_columns(
+        cls,
+        card_ids: list[str],
+        names: list[str],
+        numbers: list[str],
+        rarities: list[str | None],
+        pack_codes: list[str],
+        pack_names: list[str],
+    ) -> "DrawEngine":
+        ranks = np.array([rarity_rank(rarity) for rarity in rarities], dtype=np.int8)
+        upgrade = np.arange(len(card_ids), dtype=np.int64)
+        indices_by_pack: dict[str, list[int]] = {}
+        for index, pack_name in enumerate(pack_names):
+            indices_by_pack.setdefault(pack_name, []).append(index)
+        for pack_indices in indices_by_pack.values():
+            best_by_name: dict[str, int] = {}
+            for index in pack_indices:
+                best = best_by_name.get(names[index])
+                if best is None or ranks[index] > ranks[best]:
+                    best_by_name[names[index]] = index
+            for index in pack_indices:
+                upgrade[index] = best_by_name[names[index]]
+        return cls(
+            card_ids,
+            names,
+            numbers,
+            rarities,
+            pack_codes,
+            ranks,
+            upgrade,
+            {
+                pack_name: np.array(pack_indices, dtype=np.int64)
+                for pack_name, pack_indices in indices_by_pack.items()
+            },
+        )
+
+    @classmethod
+    def load(cls, db_path: Path = DB_PATH) -> "DrawEngine":
+        conn = sqlite3.connect(f"file:{db_path.resolve()}?mode=ro", uri=True)
+        decoded = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'cards_decoded'"
+        ).fetchone()
+        rows = conn.execute(
+            'SELECT c."id", c."name", c."number", c."rarity", p."packCode", p."packName" '
+            f'FROM "{"cards_decoded" if decoded else "cards"}" AS c '
+            'JOIN "packs" AS p ON p."id" = c."packId" '
+            'WHERE p."packName" IS NOT NULL ORDER BY p."id", c."id"'
+        ).fetchall()
+        conn.close()
+        card_ids = [row[0] for row in rows]
+        return cls.from_columns(
+            card_ids=card_ids,
+            names=[display_name(row[1]) for row in rows],
+            numbers=[str(row[2]) for row in rows],
+            rarities=[row[3] for row in rows],
+            pack_codes=[row[4] or card_id.rsplit("-", 1)[0] for row, card_id in zip(rows, card_ids)],
+            pack_names=[row[5] for row in rows],
+        )
+
+    def open_packs(
+        self,
+        pool: PackPool,
+        quantity: int,
+        rng: np.random.Generator,
+        highest: bool = False,
+        god_draw: bool = False,
+        min_draw: bool = False,
+    ) -> np.ndarray:
+        common = pool.common[rng.integers(0, len(pool.common), size=(quantity, COMMON_SLOTS))]
+        uncommon = pool.uncommon[rng.integers(0, len(pool.uncommon), size=(quantity, UNCOMMON_SLOTS))]
+        if god_draw:
+            rare = pool.top[rng.integers(0, len(pool.top), size=(quantity, RARE_SLOTS))]
+        elif min_draw:
+            rare = pool.bottom[rng.integers(0, len(pool.bottom), size=(quantity, RARE_SLOTS))]
+        else:
+            targets = rng.random((quantity, RARE_SLOTS)) * pool.rare_cumulative[-1]
+            positions = np.searchsorted(pool.rare_cumulative, targets, side="right")
+            rare = pool.rare[np.minimum(positions, len(pool.rare) - 1)]
+        drawn = np.concatenate([common, uncommon, rare], axis=1)
+        if highest:
+            drawn = self.upgrade[drawn]
+        return drawn
+
+    def format_line(self, index: int, count: int) -> str:
+        rarity = self.rarities[index] or ""
+        return (
+            f"{count} {self.names[index]} {self.pack_codes[index]} {self.numbers[index]} # {rarity}"
+        )
+
+    def draw(
+        self,
+        seed: str,
+        packs: dict[str, int],
+        highest: bool = False,
+        draw4: bool = False,
+        god_draw: bool = False,
+        min_draw: bool = False,
+    ) -> dict[str, Any]:
+        lines: list[str] = []
+        pack_count = 0
+        card_count = 0
+        for pack_name in sorted(packs):
+            quantity = int(packs[pack_name])
+            if quantity <= 0:
+                continue
+            pool = self.pools.get(pack_name)
+            if pool is None:
+                raise KeyError(f"Unknown pack: {pack_name}")
+            rng = seed_rng(seed, pack_name)
+            drawn = self.open_packs(pool, quantity, rng, highest, god_draw, min_draw and not god_draw)
+            indices, counts = np.unique(drawn, return_counts=True)
+            order = sorted(
+                range(len(indices)),
+                key=lambda i: (-self.ranks[indices[i]], self.names[indices[i]], self.numbers[indices[i]]),
+            )
+            for i in order:
+                lines.append(self.format_line(int(indices[i]), 4 if draw4 else int(counts[i])))
+            pack_count += quantity
+            card_count += drawn.size
+        return {
+            "seed": seed,
+            "packCount": pack_count,
+            "cardCount": card_count,
+            "text": "\n".join(lines),
+        }
+
+
+def parse_pack_argument(value: str) -> tuple[str, int]:
+    pack_name, separator, quantity = value.rpartition("=")
+    if not separator:
+        return value, 1
+    return pack_name, int(quantity)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=f"Open packs from {DB_PATH}.")
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="compiled cards database")
+    parser.add_argument("--seed", required=True, help="draw seed")
+    parser.add_argument(
+        "--pack",
+        action="append",
+        default=[],
+        type=parse_pack_argument,
+        help="pack to open as NAME=QUANTITY (repeatable)",
+    )
+    parser.add_argument("--highest", action="store_true", help="upgrade pulls to the highest rarity printing")
+    parser.add_argument("--draw4", action="store_true", help="list every pulled card as a playset of 4")
+    parser.add_argument("--god-draw", action="store_true", help="fill the rare slot from the top rarity")
+    parser.add_argument("--min-draw", action="store_true", help="fill the rare slot from the lowest rarity")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    engine = DrawEngine.load(args.db)
+    packs: dict[str, int] = {}
+    for pack_name, quantity in args.pack:
+        packs[pack_name] = packs.get(pack_name, 0) + quantity
+    result = engine.draw(args.seed, packs, args.highest, args.draw4, args.god_draw, args.min_draw)
+    print(result["text"])
+    print(f"Opened {result['packCount']} packs and drew {result['cardCount']} cards. Seed: {args.seed}")
+
+
+if __name__ == "__main__":
+    main()
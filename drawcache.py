@@ -0,0 +1,159 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from publish import database_digest
+
+DRAW_CACHE_SUFFIX = ".draws.sqlite"
+MAX_MEMORY_BYTES = 64 << 20
+MAX_DISK_BYTES = 512 << 20
+
+
+def draw_cache_path(db_path: Path) -> Path:
+    return db_path.with_suffix(DRAW_CACHE_SUFFIX)
+
+
+def database_version(db_path: Path) -> str:
+    return database_digest(db_path)
+
+
+def request_key(request: dict[str, Any]) -> str:
+    canonical = {**request, "packs": dict(sorted(request["packs"].items()))}
+    encoded = json.dumps(canonical, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class DrawCache:
+    def __init__(
+        self,
+        version: str,
+        max_memory_bytes: int = MAX_MEMORY_BYTES,
+        path: Path | None = None,
+        max_disk_bytes: int = MAX_DISK_BYTES,
+    ) -> None:
+        self.version = version
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.conn: sqlite3.Connection | None = None
+        if path is not None and max_disk_bytes > 0:
+            self.conn = open_disk_cache(path, version)
+            self.disk_bytes = self.conn.execute(
+                'SELECT COALESCE(SUM(LENGTH("body")), 0) FROM "draws"'
+            ).fetchone()[0]
+
+    def get(self, key: str) -> bytes | None:
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+                self.memory_hits += 1
+                return body
+            if self.conn is not None:
+                row = self.conn.execute(
+                    'SELECT "body" FROM "draws" WHERE "key" = ? AND "version" = ?',
+                    (key, self.version),
+                ).fetchone()
+                if row is not None:
+                    with self.conn:
+                        self.conn.execute(
+                            'UPDATE "draws" SET "lastUsed" = ? WHERE "key" = ?', (time.time(), key)
+                        )
+                    self.disk_hits += 1
+                    self.remember(key, row[0])
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, body: bytes) -> None:
+        with self.lock:
+            self.remember(key, body)
+            if self.conn is None or len(body) > self.max_disk_bytes:
+                return
+            with self.conn:
+                previous = self.conn.execute(
+                    'SELECT LENGTH("body") FROM "draws" WHERE "key" = ?', (key,)
+                ).fetchone()
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO "draws" ("key", "version", "body", "lastUsed") '
+                    "VALUES (?, ?, ?, ?)",
+                    (key, self.version, body, time.time()),
+                )
+                self.disk_bytes += len(body) - (previous[0] if previous else 0)
+                if self.disk_bytes > self.max_disk_bytes:
+                    self.evict_disk()
+
+    def remember(self, key: str, body: bytes) -> None:
+        if len(body) > self.max_memory_bytes:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.memory_bytes -= len(previous)
+        self.entries[key] = body
+        self.memory_bytes += len(body)
+        while self.memory_bytes > self.max_memory_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def evict_disk(self) -> None:
+        assert self.conn is not None
+        evicted: list[tuple[str]] = []
+        for key, size in self.conn.execute(
+            'SELECT "key", LENGTH("body") FROM "draws" ORDER BY "lastUsed", "key"'
+        ):
+            if self.disk_bytes <= self.max_disk_bytes:
+                break
+            evicted.append((key,))
+            self.disk_bytes -= size
+        self.conn.executemany('DELETE FROM "draws" WHERE "key" = ?', evicted)
+        self.evictions += len(evicted)
+
+    def stats(self) -> dict[str, Any]:
+        with self.lock:
+            disk_entries = 0
+            if self.conn is not None:
+                disk_entries = self.conn.execute('SELECT COUNT(*) FROM "draws"').fetchone()[0]
+            return {
+                "version": self.version,
+                "hits": self.memory_hits + self.disk_hits,
+                "memoryHits": self.memory_hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.memory_bytes,
+                "diskEntries": disk_entries,
+                "diskBytes": self.disk_bytes,
+            }
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def open_disk_cache(path: Path, version: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    with conn:
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS "draws" ("key" TEXT PRIMARY KEY, "version" TEXT NOT NULL, '
+            '"body" BLOB NOT NULL, "lastUsed" REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS "draws_lastUsed" ON "draws" ("lastUsed")')
+        conn.execute('DELETE FROM "draws" WHERE "version" <> ?', (version,))
+    return conn
@@ -0,0 +1,503 @@
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sqlite3
+import ssl
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import NamedTuple
+from urllib.parse import urljoin, urlsplit
+
+from compiler import TABLE_NAME
+from publish import build_path, publish_database, validate_database
+
+DB_PATH = Path("api/cards.sqlite")
+CACHE_DIR = Path("api/images")
+INDEX_NAME = "index.sqlite"
+IMAGES_SUFFIX = ".images.sqlite"
+IMAGES_TABLE_NAME = "card_images"
+MAX_CACHE_BYTES = 2 << 30
+MAX_IMAGE_BYTES = 16 << 20
+CONCURRENCY = 8
+RETRIES = 4
+BACKOFF_SECONDS = 0.5
+MAX_RETRY_AFTER_SECONDS = 60.0
+TIMEOUT_SECONDS = 30.0
+MAX_REDIRECTS = 5
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+USER_AGENT = "cards-image-prefetch/1"
+
+
+class FetchError(Exception):
+    def __init__(
+        self, message: str, retryable: bool = False, retry_after: float | None = None
+    ) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class Response(NamedTuple):
+    status: int
+    headers: dict[str, str]
+    body: bytes
+    keep_alive: bool
+
+
+class CachedImage(NamedTuple):
+    sha256: str
+    size: int
+    content_type: str | None
+
+
+class HttpConnection:
+    def __init__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host_header: str
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.host_header = host_header
+
+    @classmethod
+    async def open(cls, scheme: str, host: str, port: int) -> "HttpConnection":
+        context = ssl.create_default_context() if scheme == "https" else None
+        reader, writer = await asyncio.open_connection(host, port, ssl=context)
+        default_port = 443 if scheme == "https" else 80
+        return cls(reader, writer, host if port == default_port else f"{host}:{port}")
+
+    async def get(self, target: str, max_bytes: int) -> Response:
+        self.writer.write(
+            (
+                f"GET {target} HTTP/1.1\r\nHost: {self.host_header}\r\nUser-Agent: {USER_AGENT}\r\n"
+                "Accept: image/*\r\nAccept-Encoding: identity\r\nConnection: keep-alive\r\n\r\n"
+            ).encode("latin-1")
+        )
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        version, status, *_ = status_line.decode("latin-1").split(None, 2)
+        headers: dict[str, str] = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            body = await self.read_chunked(max_bytes)
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            if length > max_bytes:
+                raise FetchError(f"Image is {length} bytes, over the {max_bytes} byte limit")
+            body = await self.reader.readexactly(length)
+        else:
+            body = await self.read_to_eof(max_bytes)
+            keep_alive = False
+        if len(body) > max_bytes:
+            raise FetchError(f"Image is over the {max_bytes} byte limit")
+        return Response(int(status), headers, body, keep_alive)
+
+    async def read_chunked(self, max_bytes: int) -> bytes:
+        chunks: list[bytes] = []
+        total = 0
+        while True:
+            size = int((await self.reader.readline()).split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                while (await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            total += size
+            if total > max_bytes:
+                raise FetchError(f"Image is over the {max_bytes} byte limit")
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+
+    async def read_to_eof(self, max_bytes: int) -> bytes:
+        chunks: list[bytes] = []
+        total = 0
+        while total <= max_bytes:
+            chunk = await self.reader.read(max_bytes + 1 - total)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            total += len(chunk)
+        return b"".join(chunks)
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class Client:
+    def __init__(self, timeout: float = TIMEOUT_SECONDS, max_bytes: int = MAX_IMAGE_BYTES) -> None:
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.connections: dict[tuple[str, str, int], HttpConnection] = {}
+
+    async def request(self, url: str) -> Response:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise FetchError(f"Unsupported image URL: {url}")
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        origin = (parts.scheme, parts.hostname, port)
+        target = parts.path or "/"
+        if parts.query:
+            target = f"{target}?{parts.query}"
+        conn = self.connections.pop(origin, None)
+        if conn is not None:
+            try:
+                response = await asyncio.wait_for(conn.get(target, self.max_bytes), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn.close()
+            except BaseException:
+                conn.close()
+                raise
+            else:
+                return self.release(origin, conn, response)
+        conn = await asyncio.wait_for(HttpConnection.open(*origin), self.timeout)
+        try:
+            response = await asyncio.wait_for(conn.get(target, self.max_bytes), self.timeout)
+        except BaseException:
+            conn.close()
+            raise
+        return self.release(origin, conn, response)
+
+    def release(
+        self, origin: tuple[str, str, int], conn: HttpConnection, response: Response
+    ) -> Response:
+        if response.keep_alive:
+            self.connections[origin] = conn
+        else:
+            conn.close()
+        return response
+
+    async def fetch(self, url: str) -> Response:
+        for _ in range(MAX_REDIRECTS + 1):
+            response = await self.request(url)
+            if response.status not in REDIRECT_STATUSES or "location" not in response.headers:
+                return response
+            url = urljoin(url, response.headers["location"])
+        raise FetchError(f"Too many redirects for {url}")
+
+    def close(self) -> None:
+        for conn in self.connections.values():
+            conn.close()
+        self.connections.clear()
+
+
+def retry_after_seconds(value: str | None) -> float | None:
+    try:
+        return min(max(float(value), 0.0), MAX_RETRY_AFTER_SECONDS) if value else None
+    except ValueError:
+        return None
+
+
+async def download(client: Client, url: str, retries: int = RETRIES) -> Response:
+    attempt = 0
+    while True:
+        try:
+            response = await client.fetch(url)
+            if response.status == 200:
+                return response
+            raise FetchError(
+                f"{url} returned {response.status}",
+                response.status in RETRY_STATUSES,
+                retry_after_seconds(response.headers.get("retry-after")),
+            )
+        except FetchError as error:
+            if not error.retryable or attempt >= retries:
+                raise
+            delay = error.retry_after
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as error:
+            if attempt >= retries:
+                raise FetchError(f"{url} failed: {error!r}") from error
+            delay = None
+        if delay is None:
+            delay = random.uniform(0, BACKOFF_SECONDS * 2**attempt)
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+class ImageCache:
+    def __init__(self, cache_dir: Path, max_bytes: int = MAX_CACHE_BYTES) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index = sqlite3.connect(cache_dir / INDEX_NAME)
+        self.index.execute("PRAGMA journal_mode = WAL")
+        self.index.execute(
+            'CREATE TABLE IF NOT EXISTS "entries" ("sha256" TEXT PRIMARY KEY, '
+            '"size" INTEGER NOT NULL, "contentType" TEXT, "lastUsed" REAL NOT NULL)'
+        )
+        self.index.execute(
+            'CREATE TABLE IF NOT EXISTS "urls" ("url" TEXT PRIMARY KEY, "sha256" TEXT NOT NULL)'
+        )
+        self.index.execute(
+            'CREATE INDEX IF NOT EXISTS "entries_lastUsed" ON "entries" ("lastUsed")'
+        )
+        self.index.commit()
+
+    def path(self, sha256: str) -> Path:
+        return self.cache_dir / sha256[:2] / sha256
+
+    def lookup(self, url: str) -> CachedImage | None:
+        row = self.index.execute(
+            'SELECT e."sha256", e."size", e."contentType" FROM "urls" AS u '
+            'JOIN "entries" AS e ON e."sha256" = u."sha256" WHERE u."url" = ?',
+            (url,),
+        ).fetchone()
+        if row is None:
+            return None
+        image = CachedImage(*row)
+        if not self.path(image.sha256).is_file():
+            with self.index:
+                self.index.execute('DELETE FROM "entries" WHERE "sha256" = ?', (image.sha256,))
+                self.index.execute('DELETE FROM "urls" WHERE "sha256" = ?', (image.sha256,))
+            return None
+        return image
+
+    def store(self, url: str, body: bytes, content_type: str | None) -> CachedImage:
+        sha256 = hashlib.sha256(body).hexdigest()
+        path = self.path(sha256)
+        if not path.is_file():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            staged = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            staged.write_bytes(body)
+            os.replace(staged, path)
+        with self.index:
+            self.index.execute(
+                'INSERT INTO "entries" ("sha256", "size", "contentType", "lastUsed") '
+                'VALUES (?, ?, ?, ?) '
+                'ON CONFLICT ("sha256") DO UPDATE SET "lastUsed" = excluded."lastUsed"',
+                (sha256, len(body), content_type, time.time()),
+            )
+            self.index.execute(
+                'INSERT OR REPLACE INTO "urls" ("url", "sha256") VALUES (?, ?)', (url, sha256)
+            )
+        return CachedImage(sha256, len(body), content_type)
+
+    def touch(self, hashes: Iterable[str]) -> None:
+        now = time.time()
+        with self.index:
+            self.index.executemany(
+                'UPDATE "entries" SET "lastUsed" = ? WHERE "sha256" = ?',
+                [(now, sha256) for sha256 in hashes],
+            )
+
+    def total_bytes(self) -> int:
+        return self.index.execute('SELECT COALESCE(SUM("size"), 0) FROM "entries"').fetchone()[0]
+
+    def evict(self) -> list[str]:
+        excess = self.total_bytes() - self.max_bytes
+        evicted: list[str] = []
+        if excess <= 0:
+            return evicted
+        for sha256, size in self.index.execute(
+            'SELECT "sha256", "size" FROM "entries" ORDER BY "lastUsed", "sha256"'
+        ).fetchall():
+            if excess <= 0:
+                break
+            self.path(sha256).unlink(missing_ok=True)
+            evicted.append(sha256)
+            excess -= size
+        with self.index:
+            self.index.executemany(
+                'DELETE FROM "entries" WHERE "sha256" = ?', [(sha256,) for sha256 in evicted]
+            )
+            self.index.executemany(
+                'DELETE FROM "urls" WHERE "sha256" = ?', [(sha256,) for sha256 in evicted]
+            )
+        return evicted
+
+    def close(self) -> None:
+        self.index.close()
+
+
+class PrefetchResult(NamedTuple):
+    urls: int
+    fetched: int
+    fetched_bytes: int
+    cached: int
+    failed: dict[str, str]
+    evicted: int
+    images: dict[str, CachedImage]
+
+
+def read_image_urls(db_path: Path) -> dict[str, list[str]]:
+    conn = sqlite3.connect(f"file:{db_path.resolve()}?mode=ro", uri=True)
+    try:
+        card_ids: dict[str, list[str]] = {}
+        for card_id, url in conn.execute(
+            f'SELECT "id", "imageUrl" FROM "{TABLE_NAME}" '
+            "WHERE \"imageUrl\" IS NOT NULL AND \"imageUrl\" <> '' ORDER BY \"id\""
+        ):
+            card_ids.setdefault(url, []).append(card_id)
+        return card_ids
+    finally:
+        conn.close()
+
+
+def rewrite_origin(url: str, origin: str | None) -> str:
+    if origin is None:
+        return url
+    parts = urlsplit(url)
+    base = urlsplit(origin)
+    return parts._replace(scheme=base.scheme, netloc=base.netloc).geturl()
+
+
+async def prefetch(
+    urls: list[str],
+    cache: ImageCache,
+    concurrency: int = CONCURRENCY,
+    retries: int = RETRIES,
+    origin: str | None = None,
+    timeout: float = TIMEOUT_SECONDS,
+) -> PrefetchResult:
+    images: dict[str, CachedImage] = {}
+    failed: dict[str, str] = {}
+    pending: list[str] = []
+    for url in urls:
+        image = cache.lookup(url)
+        if image is None:
+            pending.append(url)
+        else:
+            images[url] = image
+    cache.touch(image.sha256 for image in images.values())
+    cached = len(images)
+    fetched_bytes = [0]
+    queue = iter(pending)
+
+    async def worker() -> None:
+        client = Client(timeout)
+        try:
+            for url in queue:
+                try:
+                    response = await download(client, rewrite_origin(url, origin), retries)
+                except FetchError as error:
+                    failed[url] = str(error)
+                    continue
+                images[url] = cache.store(url, response.body, response.headers.get("content-type"))
+                fetched_bytes[0] += len(response.body)
+        finally:
+            client.close()
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(pending))))))
+    evicted = set(cache.evict())
+    kept = {url: image for url, image in images.items() if image.sha256 not in evicted}
+    return PrefetchResult(
+        urls=len(urls),
+        fetched=len(images) - cached,
+        fetched_bytes=fetched_bytes[0],
+        cached=cached,
+        failed=failed,
+        evicted=len(evicted),
+        images=kept,
+    )
+
+
+def images_path(db_path: Path) -> Path:
+    return db_path.with_suffix(IMAGES_SUFFIX)
+
+
+def write_card_images(
+    db_path: Path,
+    card_ids: dict[str, list[str]],
+    images: dict[str, CachedImage],
+    cache: ImageCache,
+) -> int:
+    rows = [
+        (card_id, url, image.sha256, str(cache.path(image.sha256)), image.size, image.content_type)
+        for url, image in images.items()
+        for card_id in card_ids[url]
+    ]
+    path = images_path(db_path)
+    staged_path = build_path(path)
+    staged_path.unlink(missing_ok=True)
+    conn = sqlite3.connect(staged_path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        with conn:
+            conn.execute(
+                f'CREATE TABLE "{IMAGES_TABLE_NAME}" ("cardId" TEXT PRIMARY KEY, '
+                '"url" TEXT NOT NULL, "sha256" TEXT NOT NULL, "path" TEXT NOT NULL, '
+                '"bytes" INTEGER NOT NULL, "contentType" TEXT)'
+            )
+            conn.executemany(
+                f'INSERT INTO "{IMAGES_TABLE_NAME}" '
+                '("cardId", "url", "sha256", "path", "bytes", "contentType") '
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                sorted(rows),
+            )
+    finally:
+        conn.close()
+    try:
+        validate_database(staged_path, {IMAGES_TABLE_NAME: len(rows)})
+    except BaseException:
+        staged_path.unlink(missing_ok=True)
+        raise
+    publish_database(staged_path, path)
+    return len(rows)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Download every card imageUrl into a local content-addressed cache."
+    )
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="compiled cards database")
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR, help="image cache directory")
+    parser.add_argument(
+        "--max-mb",
+        type=float,
+        default=MAX_CACHE_BYTES / 2**20,
+        help="evict least recently used images once the cache is larger than this",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=CONCURRENCY, help="parallel keep-alive downloads"
+    )
+    parser.add_argument(
+        "--retries", type=int, default=RETRIES, help="retries per image on errors, 429 and 5xx"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=TIMEOUT_SECONDS, help="seconds per connect or response"
+    )
+    parser.add_argument(
+        "--origin",
+        help="fetch from this scheme://host[:port] instead, e.g. a local mirror or stand-in server",
+    )
+    parser.add_argument("--limit", type=int, help="only prefetch the first N image URLs")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    card_ids = read_image_urls(args.db)
+    urls = list(card_ids)[: args.limit]
+    cache = ImageCache(args.cache_dir, int(args.max_mb * 2**20))
+    try:
+        started = time.perf_counter()
+        result = asyncio.run(
+            prefetch(urls, cache, args.concurrency, args.retries, args.origin, args.timeout)
+        )
+        elapsed = time.perf_counter() - started
+        rows = write_card_images(args.db, card_ids, result.images, cache)
+        total = cache.total_bytes()
+    finally:
+        cache.close()
+    for url, message in sorted(result.failed.items())[:10]:
+        print(f"Failed {url}: {message}")
+    print(
+        f"Fetched {result.fetched} images ({result.fetched_bytes / 2**20:.1f} MB) "
+        f"in {elapsed:.1f}s, "
+        f"{result.cached} already cached, {len(result.failed)} failed, {result.evicted} evicted; "
+        f"{rows} cards in {images_path(args.db)}, cache holds {total / 2**20:.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
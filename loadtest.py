@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from typing import Any
+from urllib.parse import urlsplit
+
+URL = "http://127.0.0.1:8787"
+SCENARIOS = ("packs", "packs-page", "draw", "deck")
+
+
+class Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.host = host
+
+    @classmethod
+    async def open(cls, url: str) -> "Connection":
+        parts = urlsplit(url)
+        host = parts.hostname or "127.0.0.1"
+        port = parts.port or 80
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, f"{host}:{port}")
+
+    async def request(
+        self, method: str, path: str, payload: Any = None
+    ) -> tuple[int, bytes]:
+        body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n"
+        if body:
+            head += "Content-Type: application/json\r\n"
+        self.writer.write(f"{head}\r\n".encode("latin-1") + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        status = int(status_line.split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, await self.reader.readexactly(length)
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+async def fetch_json(url: str, method: str, path: str, payload: Any = None) -> Any:
+    conn = await Connection.open(url)
+    try:
+        status, body = await conn.request(method, path, payload)
+    finally:
+        conn.close()
+    if status != 200:
+        raise RuntimeError(f"{method} {path} returned {status}: {body[:200]!r}")
+    return json.loads(body)
+
+
+async def build_requests(
+    url: str, scenario: str, count: int, seed: int
+) -> list[tuple[str, str, Any]]:
+    rng = random.Random(seed)
+    pack_names = [pack["packName"] for pack in (await fetch_json(url, "GET", "/api/packs"))["packs"]]
+    if not pack_names:
+        raise RuntimeError("Server has no packs")
+    if scenario == "packs":
+        return [("GET", "/api/packs", None)] * count
+    if scenario == "packs-page":
+        return [("GET", f"/api/packs?limit=5&page={rng.randint(1, 20)}", None) for _ in range(count)]
+    if scenario == "draw":
+        return [
+            (
+                "POST",
+                "/api/draw",
+                {"seed": f"load-{i}", "packs": {rng.choice(pack_names): rng.randint(1, 36)}},
+            )
+            for i in range(count)
+        ]
+    sample = await fetch_json(
+        url, "POST", "/api/draw", {"seed": "load-deck", "packs": {name: 3 for name in pack_names[:4]}}
+    )
+    return [("POST", "/api/deck-draw", {"text": sample["text"]})] * count
+
+
+async def run_worker(
+    url: str,
+    requests: list[tuple[str, str, Any]],
+    cursor: list[int],
+    timings: list[float],
+    errors: list[int],
+) -> None:
+    conn = await Connection.open(url)
+    try:
+        while cursor[0] < len(requests):
+            method, path, payload = requests[cursor[0]]
+            cursor[0] += 1
+            started = time.perf_counter()
+            try:
+                status, _ = await conn.request(method, path, payload)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                errors[0] += 1
+                conn.close()
+                conn = await Connection.open(url)
+                continue
+            timings.append(time.perf_counter() - started)
+            if status != 200:
+                errors[0] += 1
+    finally:
+        conn.close()
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_scenario(
+    url: str, scenario: str, count: int, concurrency: int, seed: int
+) -> dict[str, float]:
+    requests = await build_requests(url, scenario, count, seed)
+    cursor = [0]
+    timings: list[float] = []
+    errors = [0]
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(run_worker(url, requests, cursor, timings, errors) for _ in range(concurrency))
+    )
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(requests),
+        "errors": errors[0],
+        "rps": len(requests) / elapsed,
+        "p50": statistics.median(timings) if timings else 0.0,
+        "p99": percentile(timings, 0.99) if timings else 0.0,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load-test the local card server.")
+    parser.add_argument("--url", default=URL, help="server base URL")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=SCENARIOS,
+        help="scenario to run (repeatable, default: all)",
+    )
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="keep-alive connections")
+    parser.add_argument("--seed", type=int, default=0, help="seed for request parameters")
+    return parser.parse_args()
+
+
+async def run(args: argparse.Namespace) -> None:
+    print(f"{'scenario':<12} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for scenario in args.scenario or SCENARIOS:
+        result = await run_scenario(args.url, scenario, args.requests, args.concurrency, args.seed)
+        print(
+            f"{scenario:<12} {result['requests']:>9} {result['errors']:>7} {result['rps']:>9.1f} "
+            f"{result['p50'] * 1e3:>8.2f} {result['p99'] * 1e3:>8.2f}"
+        )
+
+
+def main() -> None:
+    asyncio.run(run(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
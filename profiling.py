@@ -0,0 +1,152 @@
+import cProfile
+import json
+import resource
+import sys
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, TypeVar
+
+PROC_STATUS_PATH = Path("/proc/self/status")
+PROC_CLEAR_REFS_PATH = Path("/proc/self/clear_refs")
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+T = TypeVar("T")
+
+
+class Phase:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.child_cpu_seconds = 0.0
+        self.peak_rss_bytes = 0
+        self.rows = 0
+        self.bytes = 0
+
+    def add(self, rows: int = 0, size: int = 0) -> None:
+        self.rows += rows
+        self.bytes += size
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "wallSeconds": round(self.wall_seconds, 6),
+            "cpuSeconds": round(self.cpu_seconds, 6),
+            "childCpuSeconds": round(self.child_cpu_seconds, 6),
+            "peakRssBytes": self.peak_rss_bytes,
+            "rows": self.rows,
+            "bytes": self.bytes,
+        }
+
+
+def cpu_seconds(who: int) -> float:
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def reset_peak_rss() -> None:
+    try:
+        PROC_CLEAR_REFS_PATH.write_text("5")
+    except OSError:
+        pass
+
+
+def peak_rss_bytes() -> int:
+    try:
+        for line in PROC_STATUS_PATH.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT
+
+
+class Profiler:
+    def __init__(
+        self,
+        name: str,
+        enabled: bool = False,
+        cprofile_dir: Path | None = None,
+        hot_phases: Iterable[str] = (),
+    ) -> None:
+        self.name = name
+        self.enabled = enabled or cprofile_dir is not None
+        self.cprofile_dir = cprofile_dir
+        self.hot_phases = set(hot_phases)
+        self.phases: dict[str, Phase] = {}
+        self.profiles: dict[str, cProfile.Profile] = {}
+        self.started = time.perf_counter()
+        self.cpu_started = cpu_seconds(resource.RUSAGE_SELF)
+        self.child_cpu_started = cpu_seconds(resource.RUSAGE_CHILDREN)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[Phase]:
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = Phase(name)
+        if not self.enabled:
+            yield phase
+            return
+        profile = None
+        if self.cprofile_dir is not None and name in self.hot_phases:
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+        reset_peak_rss()
+        wall_started = time.perf_counter()
+        cpu_started = cpu_seconds(resource.RUSAGE_SELF)
+        child_cpu_started = cpu_seconds(resource.RUSAGE_CHILDREN)
+        if profile is not None:
+            profile.enable()
+        try:
+            yield phase
+        finally:
+            if profile is not None:
+                profile.disable()
+            phase.wall_seconds += time.perf_counter() - wall_started
+            phase.cpu_seconds += cpu_seconds(resource.RUSAGE_SELF) - cpu_started
+            phase.child_cpu_seconds += cpu_seconds(resource.RUSAGE_CHILDREN) - child_cpu_started
+            phase.peak_rss_bytes = max(phase.peak_rss_bytes, peak_rss_bytes())
+
+    def timed(
+        self, name: str, items: Iterable[T], count: Callable[[T], int] | None = None
+    ) -> Iterator[T]:
+        iterator = iter(items)
+        finished = object()
+        while True:
+            with self.phase(name) as phase:
+                item = next(iterator, finished)
+                if item is not finished:
+                    phase.add(rows=count(item) if count is not None else 1)
+            if item is finished:
+                return
+            yield item
+
+    def report(self) -> dict[str, Any]:
+        phases = [phase.as_dict() for phase in self.phases.values()]
+        return {
+            "script": self.name,
+            "argv": sys.argv[1:],
+            "wallSeconds": round(time.perf_counter() - self.started, 6),
+            "cpuSeconds": round(cpu_seconds(resource.RUSAGE_SELF) - self.cpu_started, 6),
+            "childCpuSeconds": round(
+                cpu_seconds(resource.RUSAGE_CHILDREN) - self.child_cpu_started, 6
+            ),
+            "peakRssBytes": max((phase["peakRssBytes"] for phase in phases), default=0),
+            "childPeakRssBytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            * MAXRSS_UNIT,
+            "phases": phases,
+        }
+
+    def write(self, output: Path | None) -> None:
+        if output is not None:
+            payload = json.dumps(self.report(), indent=2)
+            if str(output) == "-":
+                print(payload)
+            else:
+                output.parent.mkdir(parents=True, exist_ok=True)
+                output.write_text(payload + "\n", encoding="utf-8")
+        if self.cprofile_dir is not None:
+            self.cprofile_dir.mkdir(parents=True, exist_ok=True)
+            for name, profile in self.profiles.items():
+                profile.dump_stats(self.cprofile_dir / f"{self.name}-{name}.prof")
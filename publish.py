@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+from pathlib import Path
+from typing import Any
+
+VERSION_SUFFIX = ".version.json"
+DIGEST_CHUNK_SIZE = 1 << 20
+
+
+def build_path(db_path: Path) -> Path:
+    return db_path.with_name(f".{db_path.name}.{os.getpid()}.tmp")
+
+
+def version_path(db_path: Path) -> Path:
+    return db_path.with_suffix(VERSION_SUFFIX)
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(DIGEST_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_version(db_path: Path, metadata: dict[str, str]) -> dict[str, Any]:
+    version = {**metadata, "outputHash": file_digest(db_path), "bytes": db_path.stat().st_size}
+    path = version_path(db_path)
+    staged = build_path(path)
+    staged.write_text(json.dumps(version, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    os.replace(staged, path)
+    return version
+
+
+def read_version(db_path: Path) -> dict[str, Any] | None:
+    path = version_path(db_path)
+    try:
+        db_stat = db_path.stat()
+        if path.stat().st_mtime_ns < db_stat.st_mtime_ns:
+            return None
+        version = json.loads(path.read_bytes())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if not isinstance(version, dict) or version.get("bytes") != db_stat.st_size:
+        return None
+    return version
+
+
+def database_digest(db_path: Path) -> str:
+    version = read_version(db_path)
+    if version is not None and isinstance(version.get("outputHash"), str):
+        return version["outputHash"]
+    return file_digest(db_path)
+
+
+def generation_path(db_path: Path, generation: int) -> Path:
+    return db_path.with_name(f"{db_path.stem}.{generation}{db_path.suffix}")
+
+
+def validate_database(path: Path, expected_rows: dict[str, int]) -> None:
+    conn = sqlite3.connect(f"file:{path.resolve()}?mode=ro", uri=True)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        if problems != ["ok"]:
+            raise RuntimeError(f"Integrity check failed for {path}: {'; '.join(problems)}")
+        for table_name, expected in expected_rows.items():
+            actual = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+            if actual != expected:
+                raise RuntimeError(
+                    f"{path} has {actual} rows in {table_name}, expected {expected}"
+                )
+    finally:
+        conn.close()
+
+
+def rotate_generations(db_path: Path, keep: int) -> None:
+    stale = keep + 1
+    while generation_path(db_path, stale).exists():
+        generation_path(db_path, stale).unlink()
+        stale += 1
+    if keep <= 0 or not db_path.exists():
+        return
+    for generation in range(keep, 1, -1):
+        previous = generation_path(db_path, generation - 1)
+        if previous.exists():
+            os.replace(previous, generation_path(db_path, generation))
+    newest = generation_path(db_path, 1)
+    newest.unlink(missing_ok=True)
+    try:
+        os.link(db_path, newest)
+    except OSError:
+        shutil.copy2(db_path, newest)
+
+
+def publish_database(path: Path, db_path: Path, keep: int = 0) -> None:
+    rotate_generations(db_path, keep)
+    os.replace(path, db_path)
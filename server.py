@@ -0,0 +1,417 @@
+import argparse
+import asyncio
+import json
+import sqlite3
+import traceback
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, TypeVar
+from urllib.parse import parse_qs, urlsplit
+
+from deck import DeckIndex, deck_index_path
+from draw import DB_PATH
+from drawcache import (
+    MAX_DISK_BYTES,
+    MAX_MEMORY_BYTES,
+    DrawCache,
+    database_version,
+    draw_cache_path,
+    request_key,
+)
+from shards import (
+    MANIFEST_NAME,
+    PackShard,
+    build_pack_shards,
+    encode_json,
+    load_pack_shards,
+    packs_payload,
+    read_pack_list,
+    shard_key,
+    shards_path,
+)
+from snapshot import load_draw_engine
+
+HOST = "127.0.0.1"
+PORT = 8787
+POOL_SIZE = 4
+MAX_BODY_BYTES = 16 << 20
+MAX_DRAW_PACKS = 100_000
+MAX_PACKS_LIMIT = 1000
+MAX_DECK_TEXTS = 2000
+SHARD_CACHE_CONTROL = "public, max-age=300"
+STATUS_TEXT = {
+    200: "OK",
+    204: "No Content",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "content-type",
+}
+
+T = TypeVar("T")
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def connect_read_only(db_path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        f"file:{db_path.resolve()}?mode=ro", uri=True, check_same_thread=False, cached_statements=64
+    )
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, db_path: Path, size: int) -> None:
+        self.connections: asyncio.Queue[sqlite3.Connection] = asyncio.Queue()
+        for _ in range(size):
+            self.connections.put_nowait(connect_read_only(db_path))
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="sqlite")
+
+    async def run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        conn = await self.connections.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, conn)
+        finally:
+            self.connections.put_nowait(conn)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
+
+def accepted_encodings(header: str) -> set[str]:
+    encodings = set()
+    for token in header.split(","):
+        name, _, params = token.strip().lower().partition(";")
+        _, _, quality = params.replace(" ", "").partition("q=")
+        try:
+            if quality and float(quality) <= 0:
+                continue
+        except ValueError:
+            continue
+        encodings.add(name.strip())
+    return encodings
+
+
+def shard_response(
+    shard: PackShard, request_headers: dict[str, str]
+) -> tuple[int, bytes, dict[str, str]]:
+    encodings = accepted_encodings(request_headers.get("accept-encoding", ""))
+    if "br" in encodings and shard.brotli is not None:
+        coding, body = "br", shard.brotli
+    elif "gzip" in encodings:
+        coding, body = "gzip", shard.gzip
+    else:
+        coding, body = "identity", shard.body
+    etag = shard.etags[coding]
+    headers = {"ETag": etag, "Cache-Control": SHARD_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if_none_match = request_headers.get("if-none-match", "")
+    if if_none_match == "*" or etag in (tag.strip() for tag in if_none_match.split(",")):
+        return 304, b"", headers
+    if coding != "identity":
+        headers["Content-Encoding"] = coding
+    return 200, body, headers
+
+
+def parse_positive_int(values: list[str] | None, fallback: int | None) -> int | None:
+    if not values:
+        return fallback
+    try:
+        parsed = int(values[0])
+    except ValueError:
+        return fallback
+    return parsed if parsed > 0 else fallback
+
+
+def parse_json_body(body: bytes) -> dict[str, Any]:
+    try:
+        payload = json.loads(body or b"{}")
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise HTTPError(400, "Invalid JSON body") from None
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "JSON body must be an object")
+    return payload
+
+
+def parse_draw_payload(payload: dict[str, Any]) -> dict[str, Any]:
+    seed = payload.get("seed")
+    if not isinstance(seed, str) or not seed.strip():
+        raise HTTPError(400, "Missing seed")
+    packs = payload.get("packs")
+    if not isinstance(packs, dict) or not packs:
+        raise HTTPError(400, "Select at least one pack quantity.")
+    quantities: dict[str, int] = {}
+    for pack_name, quantity in packs.items():
+        if isinstance(quantity, bool) or (
+            isinstance(quantity, float) and not quantity.is_integer()
+        ):
+            raise HTTPError(400, f"Invalid quantity for {pack_name}")
+        try:
+            parsed = int(quantity)
+        except (TypeError, ValueError, OverflowError):
+            raise HTTPError(400, f"Invalid quantity for {pack_name}") from None
+        if parsed > 0:
+            quantities[str(pack_name)] = parsed
+    if not quantities:
+        raise HTTPError(400, "Select at least one pack quantity.")
+    if sum(quantities.values()) > MAX_DRAW_PACKS:
+        raise HTTPError(400, f"At most {MAX_DRAW_PACKS} packs can be opened per request")
+    return {
+        "seed": seed.strip(),
+        "packs": quantities,
+        "highest": bool(payload.get("highest")),
+        "draw4": bool(payload.get("draw4")),
+        "god_draw": bool(payload.get("godDraw")),
+        "min_draw": bool(payload.get("minDraw")),
+    }
+
+
+class CardServer:
+    def __init__(
+        self,
+        db_path: Path,
+        pool_size: int = POOL_SIZE,
+        cache_memory_bytes: int = MAX_MEMORY_BYTES,
+        cache_disk_bytes: int = 0,
+    ) -> None:
+        index_path = deck_index_path(db_path)
+        if not index_path.exists():
+            raise FileNotFoundError(f"Missing deck index {index_path}; run deck.py --db {db_path}")
+        version = database_version(db_path)
+        self.engine = load_draw_engine(db_path, version)
+        self.draw_cache = DrawCache(
+            version,
+            cache_memory_bytes,
+            draw_cache_path(db_path) if cache_disk_bytes > 0 else None,
+            cache_disk_bytes,
+        )
+        self.deck_index = DeckIndex.load(index_path)
+        self.pool = ConnectionPool(index_path, pool_size)
+        conn = connect_read_only(db_path)
+        self.packs = read_pack_list(conn)
+        conn.close()
+        shard_directory = shards_path(db_path)
+        if (shard_directory / MANIFEST_NAME).exists():
+            self.pack_shards = load_pack_shards(shard_directory)
+        else:
+            self.pack_shards = build_pack_shards(self.packs)
+
+    def close(self) -> None:
+        self.pool.close()
+        self.draw_cache.close()
+
+    async def handle(
+        self, method: str, target: str, headers: dict[str, str], body: bytes
+    ) -> tuple[int, bytes, dict[str, str]]:
+        url = urlsplit(target)
+        if method == "OPTIONS":
+            return 204, b"", {}
+        if url.path == "/api/packs":
+            if method != "GET":
+                raise HTTPError(405, "Use GET")
+            return self.packs_response(parse_qs(url.query), headers)
+        if url.path == "/api/draw":
+            if method != "POST":
+                raise HTTPError(405, "Use POST")
+            return 200, await self.draw(parse_json_body(body)), {}
+        if url.path == "/api/draw-cache":
+            if method != "GET":
+                raise HTTPError(405, "Use GET")
+            return 200, encode_json(self.draw_cache.stats()), {}
+        if url.path in ("/api/deck-draw", "/api/deck_draw"):
+            if method != "POST":
+                raise HTTPError(405, "Use POST")
+            return 200, encode_json(await self.deck_draw(parse_json_body(body))), {}
+        raise HTTPError(404, "Not found")
+
+    def packs_response(
+        self, query: dict[str, list[str]], headers: dict[str, str]
+    ) -> tuple[int, bytes, dict[str, str]]:
+        limit = parse_positive_int(query.get("limit"), None)
+        page = parse_positive_int(query.get("page"), 1) or 1
+        if limit is not None:
+            limit = min(limit, MAX_PACKS_LIMIT)
+        shard = self.pack_shards.get(shard_key(limit, page))
+        if shard is None:
+            return 200, encode_json(packs_payload(self.packs, limit, page)), {}
+        return shard_response(shard, headers)
+
+    async def draw(self, payload: dict[str, Any]) -> bytes:
+        request = parse_draw_payload(payload)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, self.cached_draw, request)
+        except KeyError as err:
+            raise HTTPError(400, str(err.args[0])) from None
+
+    def cached_draw(self, request: dict[str, Any]) -> bytes:
+        key = request_key(request)
+        body = self.draw_cache.get(key)
+        if body is None:
+            body = encode_json(self.engine.draw(**request))
+            self.draw_cache.put(key, body)
+        return body
+
+    async def deck_draw(self, payload: dict[str, Any]) -> dict[str, Any]:
+        texts = payload.get("texts")
+        if texts is None:
+            text = payload.get("text")
+            if not isinstance(text, str) or not text.strip():
+                raise HTTPError(400, "Paste deck text before converting.")
+            return (await self.pool.run(partial(self.deck_index.convert_many, [text])))[0]
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise HTTPError(400, "texts must be a list of deck texts")
+        if len(texts) > MAX_DECK_TEXTS:
+            raise HTTPError(400, f"At most {MAX_DECK_TEXTS} decks can be converted per request")
+        results = await self.pool.run(partial(self.deck_index.convert_many, texts))
+        return {
+            "results": results,
+            "count": len(results),
+            "cardCount": sum(result["cardCount"] for result in results),
+            "missingCount": sum(result["missingCount"] for result in results),
+        }
+
+    async def respond(
+        self, method: str, target: str, headers: dict[str, str], body: bytes
+    ) -> tuple[int, bytes, dict[str, str]]:
+        try:
+            return await self.handle(method, target, headers, body)
+        except HTTPError as err:
+            return err.status, encode_json({"error": err.message}), {}
+        except Exception:
+            traceback.print_exc()
+            return 500, encode_json({"error": "Internal server error"}), {}
+
+    async def serve_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers: dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0"))
+                if length > MAX_BODY_BYTES:
+                    status, payload = 413, encode_json({"error": "Request body too large"})
+                    response_headers: dict[str, str] = {}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload, response_headers = await self.respond(
+                        method.upper(), target, headers, body
+                    )
+                    keep_alive = (
+                        version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                    )
+                writer.write(build_response(status, payload, keep_alive, response_headers))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def build_response(
+    status: int, payload: bytes, keep_alive: bool, extra_headers: dict[str, str] | None = None
+) -> bytes:
+    headers = {
+        **CORS_HEADERS,
+        **(extra_headers or {}),
+        "Content-Length": str(len(payload)),
+        "Connection": "keep-alive" if keep_alive else "close",
+    }
+    if payload:
+        headers["Content-Type"] = "application/json; charset=utf-8"
+    head = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'OK')}\r\n"
+    head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    return f"{head}\r\n".encode("latin-1") + payload
+
+
+async def serve(
+    db_path: Path,
+    host: str,
+    port: int,
+    pool_size: int,
+    cache_memory_bytes: int = MAX_MEMORY_BYTES,
+    cache_disk_bytes: int = 0,
+) -> None:
+    card_server = CardServer(db_path, pool_size, cache_memory_bytes, cache_disk_bytes)
+    server = await asyncio.start_server(card_server.serve_connection, host, port)
+    print(f"Serving {db_path} on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        card_server.close()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Serve /api/packs, /api/draw, /api/draw-cache and /api/deck-draw."
+    )
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="compiled cards database")
+    parser.add_argument("--host", default=HOST, help="address to bind")
+    parser.add_argument("--port", type=int, default=PORT, help="port to bind")
+    parser.add_argument(
+        "--pool-size", type=int, default=POOL_SIZE, help="read-only SQLite connections"
+    )
+    parser.add_argument(
+        "--draw-cache-mb",
+        type=float,
+        default=MAX_MEMORY_BYTES / 2**20,
+        help="in-process LRU of encoded draw results (0 disables it)",
+    )
+    parser.add_argument(
+        "--draw-cache-disk-mb",
+        type=float,
+        default=0,
+        help=f"also keep draw results in {draw_cache_path(DB_PATH).name} next to the database, "
+        f"evicting least recently used ones past this size (e.g. {MAX_DISK_BYTES >> 20})",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    try:
+        asyncio.run(
+            serve(
+                args.db,
+                args.host,
+                args.port,
+                args.pool_size,
+                int(args.draw_cache_mb * 2**20),
+                int(args.draw_cache_disk_mb * 2**20),
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import os
+import shutil
+import sqlite3
+from pathlib import Path
+from typing import Any, NamedTuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DB_PATH = Path("api/cards.sqlite")
+SHARD_LIMITS = (5, 10, 20, 50, 100)
+MANIFEST_NAME = "manifest.json"
+ETAG_SUFFIXES = {"identity": "", "gzip": "-gz", "br": "-br"}
+PACK_FIELDS = ("packName", "packSeries", "packCode", "releaseDate", "cardCount")
+PACKS_QUERY = (
+    'SELECT "packName", "packSeries", "packCode", "releaseDate", "cardCount" FROM "packs" '
+    'WHERE "packName" IS NOT NULL ORDER BY "releaseDate" DESC, "packName"'
+)
+
+
+class PackShard(NamedTuple):
+    body: bytes
+    gzip: bytes
+    brotli: bytes | None
+    etags: dict[str, str]
+
+
+def encode_json(payload: Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def read_pack_list(conn: sqlite3.Connection) -> list[dict[str, Any]]:
+    return [dict(zip(PACK_FIELDS, row)) for row in conn.execute(PACKS_QUERY)]
+
+
+def packs_payload(
+    packs: list[dict[str, Any]], limit: int | None = None, page: int = 1
+) -> dict[str, Any]:
+    total = len(packs)
+    if limit is None:
+        return {"packs": packs, "count": total, "total": total}
+    total_pages = max(1, math.ceil(total / limit))
+    page = min(max(1, page), total_pages)
+    rows = packs[(page - 1) * limit : page * limit]
+    return {
+        "packs": rows,
+        "limit": limit,
+        "page": page,
+        "count": len(rows),
+        "total": total,
+        "totalPages": total_pages,
+    }
+
+
+def shard_key(limit: int | None = None, page: int = 1) -> str:
+    return "all" if limit is None else f"limit-{limit}-page-{page}"
+
+
+def shard_etags(digest: str) -> dict[str, str]:
+    return {coding: f'"{digest}{suffix}"' for coding, suffix in ETAG_SUFFIXES.items()}
+
+
+def make_shard(body: bytes) -> PackShard:
+    return PackShard(
+        body=body,
+        gzip=gzip.compress(body, compresslevel=9, mtime=0),
+        brotli=brotli.compress(body) if brotli is not None else None,
+        etags=shard_etags(hashlib.sha256(body).hexdigest()[:32]),
+    )
+
+
+def build_pack_shards(
+    packs: list[dict[str, Any]], limits: tuple[int, ...] = SHARD_LIMITS
+) -> dict[str, PackShard]:
+    shards = {shard_key(): make_shard(encode_json(packs_payload(packs)))}
+    for limit in limits:
+        total_pages = max(1, math.ceil(len(packs) / limit))
+        for page in range(1, total_pages + 1):
+            shards[shard_key(limit, page)] = make_shard(encode_json(packs_payload(packs, limit, page)))
+    return shards
+
+
+def shards_path(db_path: Path) -> Path:
+    return db_path.with_name(f"{db_path.stem}.packs")
+
+
+def write_pack_shards(db_path: Path, limits: tuple[int, ...] = SHARD_LIMITS) -> int:
+    conn = sqlite3.connect(f"file:{db_path.resolve()}?mode=ro", uri=True)
+    packs = read_pack_list(conn)
+    conn.close()
+    shards = build_pack_shards(packs, limits)
+    directory = shards_path(db_path)
+    staged = directory.with_name(f".{directory.name}.{os.getpid()}.tmp")
+    shutil.rmtree(staged, ignore_errors=True)
+    staged.mkdir(parents=True)
+    manifest: dict[str, Any] = {}
+    for key, shard in shards.items():
+        (staged / f"{key}.json").write_bytes(shard.body)
+        (staged / f"{key}.json.gz").write_bytes(shard.gzip)
+        encodings = ["gzip"]
+        if shard.brotli is not None:
+            (staged / f"{key}.json.br").write_bytes(shard.brotli)
+            encodings.append("br")
+        manifest[key] = {"file": f"{key}.json", "etags": shard.etags, "encodings": encodings}
+    (staged / MANIFEST_NAME).write_bytes(encode_json(manifest))
+    retired = directory.with_name(f".{directory.name}.{os.getpid()}.old")
+    if directory.exists():
+        os.replace(directory, retired)
+    os.replace(staged, directory)
+    shutil.rmtree(retired, ignore_errors=True)
+    return len(shards)
+
+
+def load_pack_shards(directory: Path) -> dict[str, PackShard]:
+    manifest = json.loads((directory / MANIFEST_NAME).read_bytes())
+    shards: dict[str, PackShard] = {}
+    for key, entry in manifest.items():
+        path = directory / entry["file"]
+        brotli_path = path.with_name(f"{path.name}.br")
+        etags = entry.get("etags") or shard_etags(entry["etag"].strip('"'))
+        shards[key] = PackShard(
+            body=path.read_bytes(),
+            gzip=path.with_name(f"{path.name}.gz").read_bytes(),
+            brotli=brotli_path.read_bytes() if "br" in entry["encodings"] else None,
+            etags=etags,
+        )
+    return shards
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Write precompressed /api/packs shards next to a compiled database."
+    )
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="compiled cards database")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    count = write_pack_shards(args.db)
+    print(f"Wrote {count} pack shards into {shards_path(args.db)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import numpy as np
+
+from draw import DB_PATH, PACK_SIZE, DrawEngine, seed_rng
+from snapshot import load_draw_engine
+
+OUTPUT_DIR = Path("simulations")
+SUMMARY_NAME = "summary.json"
+MODES: dict[str, dict[str, bool]] = {
+    "normal": {},
+    "highest": {"highest": True},
+    "godDraw": {"god_draw": True},
+    "minDraw": {"min_draw": True},
+}
+BOX_SIZE = 36
+CHUNK_BOXES = 1000
+HIT_RANK = 3
+CHECKPOINT_SECONDS = 30.0
+
+ENGINE: DrawEngine | None = None
+
+
+class ChunkTask(NamedTuple):
+    pack_name: str
+    mode: str
+    chunk: int
+    quantity: int
+    seed: str
+    box_size: int
+    hit_rank: int
+
+
+class ChunkResult(NamedTuple):
+    pack_name: str
+    mode: str
+    chunk: int
+    packs: int
+    pulls: np.ndarray
+    packs_with: np.ndarray
+    pack_hits: np.ndarray
+    box_hits: np.ndarray
+
+
+def init_worker(db_path: Path) -> None:
+    global ENGINE
+    ENGINE = load_draw_engine(db_path)
+
+
+def chunk_rng(task: ChunkTask) -> np.random.Generator:
+    return seed_rng(f"{task.seed}\0{task.mode}\0{task.chunk}", task.pack_name)
+
+
+def simulate_chunk(task: ChunkTask) -> ChunkResult:
+    engine = ENGINE
+    drawn = engine.open_packs(
+        engine.pools[task.pack_name], task.quantity, chunk_rng(task), **MODES[task.mode]
+    )
+    card_count = len(engine.card_ids)
+    ordered = np.sort(drawn, axis=1)
+    distinct = np.ones(ordered.shape, dtype=bool)
+    distinct[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    hits = (engine.ranks[drawn] >= task.hit_rank).sum(axis=1)
+    boxes = len(hits) // task.box_size
+    box_hits = hits[: boxes * task.box_size].reshape(boxes, task.box_size).sum(axis=1)
+    return ChunkResult(
+        pack_name=task.pack_name,
+        mode=task.mode,
+        chunk=task.chunk,
+        packs=task.quantity,
+        pulls=np.bincount(drawn.ravel(), minlength=card_count),
+        packs_with=np.bincount(ordered[distinct], minlength=card_count),
+        pack_hits=np.bincount(hits, minlength=PACK_SIZE + 1),
+        box_hits=np.bincount(box_hits, minlength=task.box_size * PACK_SIZE + 1),
+    )
+
+
+def engine_fingerprint(engine: DrawEngine) -> str:
+    digest = hashlib.sha256()
+    for card_id, name, rarity in zip(engine.card_ids, engine.names, engine.rarities):
+        digest.update(f"{card_id}\0{name}\0{rarity}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def checkpoint_path(output_dir: Path, pack_name: str, mode: str) -> Path:
+    slug = re.sub(r"[^a-z0-9]+", "-", pack_name.lower()).strip("-")
+    suffix = hashlib.sha256(pack_name.encode("utf-8")).hexdigest()[:8]
+    return output_dir / f"{slug}-{suffix}.{mode}.npz"
+
+
+class Tally:
+    def __init__(self, pack_name: str, mode: str, config: dict[str, Any], card_count: int) -> None:
+        self.pack_name = pack_name
+        self.mode = mode
+        self.config = config
+        self.completed: set[int] = set()
+        self.packs = 0
+        self.pulls = np.zeros(card_count, dtype=np.int64)
+        self.packs_with = np.zeros(card_count, dtype=np.int64)
+        self.pack_hits = np.zeros(PACK_SIZE + 1, dtype=np.int64)
+        self.box_hits = np.zeros(config["boxSize"] * PACK_SIZE + 1, dtype=np.int64)
+
+    def add(self, result: ChunkResult) -> None:
+        self.completed.add(result.chunk)
+        self.packs += result.packs
+        self.pulls += result.pulls
+        self.packs_with += result.packs_with
+        self.pack_hits += result.pack_hits
+        self.box_hits += result.box_hits
+
+    def save(self, path: Path) -> None:
+        staged = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with staged.open("wb") as f:
+            np.savez_compressed(
+                f,
+                config=np.array(json.dumps(self.config, sort_keys=True)),
+                completed=np.array(sorted(self.completed), dtype=np.int64),
+                packs=np.array(self.packs, dtype=np.int64),
+                pulls=self.pulls,
+                packs_with=self.packs_with,
+                pack_hits=self.pack_hits,
+                box_hits=self.box_hits,
+            )
+        os.replace(staged, path)
+
+    def load(self, path: Path) -> None:
+        with np.load(path) as data:
+            config = json.loads(str(data["config"]))
+            if config != self.config:
+                raise ValueError(
+                    f"{path} was written with different settings or cards; "
+                    "remove it or rerun without --resume"
+                )
+            self.completed = set(int(chunk) for chunk in data["completed"])
+            self.packs = int(data["packs"])
+            self.pulls = data["pulls"]
+            self.packs_with = data["packs_with"]
+            self.pack_hits = data["pack_hits"]
+            self.box_hits = data["box_hits"]
+
+    def summary(self, engine: DrawEngine) -> dict[str, Any]:
+        boxes = int(self.box_hits.sum())
+        cards = []
+        for index in np.flatnonzero(self.pulls):
+            probability = self.packs_with[index] / self.packs
+            cards.append(
+                {
+                    "id": engine.card_ids[index],
+                    "name": engine.names[index],
+                    "number": engine.numbers[index],
+                    "rarity": engine.rarities[index],
+                    "pullsPerPack": float(self.pulls[index] / self.packs),
+                    "packProbability": float(probability),
+                    "expectedPacks": float(1 / probability) if probability else None,
+                    "medianPacks": math.ceil(math.log(0.5) / math.log1p(-probability))
+                    if 0 < probability < 1
+                    else 1,
+                }
+            )
+        cards.sort(key=lambda card: (card["packProbability"], card["name"], card["number"]))
+        return {
+            "pack": self.pack_name,
+            "mode": self.mode,
+            "packsOpened": self.packs,
+            "boxesOpened": boxes,
+            "hitsPerPack": histogram_summary(self.pack_hits),
+            "hitsPerBox": histogram_summary(self.box_hits),
+            "cards": cards,
+        }
+
+
+def histogram_summary(histogram: np.ndarray) -> dict[str, Any]:
+    total = int(histogram.sum())
+    values = np.arange(len(histogram))
+    mean = float((values * histogram).sum() / total) if total else 0.0
+    return {
+        "mean": mean,
+        "histogram": {str(value): int(histogram[value]) for value in np.flatnonzero(histogram)},
+    }
+
+
+def write_summary(output_dir: Path, engine: DrawEngine, tallies: list[Tally]) -> None:
+    path = output_dir / SUMMARY_NAME
+    staged = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    payload = {"results": [tally.summary(engine) for tally in tallies if tally.packs]}
+    staged.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(staged, path)
+
+
+def run_tasks(
+    tasks: list[ChunkTask],
+    tallies: dict[tuple[str, str], Tally],
+    db_path: Path,
+    workers: int,
+    checkpoint: Callable[[], None],
+) -> None:
+    if workers <= 1:
+        for task in tasks:
+            tallies[task.pack_name, task.mode].add(simulate_chunk(task))
+            checkpoint()
+        return
+    pending = iter(tasks)
+    running: set[Future[ChunkResult]] = set()
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(db_path,)) as executor:
+        while True:
+            for task in pending:
+                running.add(executor.submit(simulate_chunk, task))
+                if len(running) >= workers * 2:
+                    break
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                tallies[result.pack_name, result.mode].add(result)
+            checkpoint()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Estimate pull rates and hits per box by opening seeded packs in bulk."
+    )
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="compiled cards database")
+    parser.add_argument(
+        "--pack", action="append", help="pack name to simulate (repeatable, default: every pack)"
+    )
+    parser.add_argument(
+        "--mode",
+        action="append",
+        choices=list(MODES),
+        help="draw mode to simulate (repeatable, default: every mode)",
+    )
+    parser.add_argument(
+        "--packs",
+        type=int,
+        default=1_000_000,
+        help="packs to open per pack and mode, rounded up to whole chunks",
+    )
+    parser.add_argument("--seed", default="simulate", help="base seed for every chunk")
+    parser.add_argument("--box-size", type=int, default=BOX_SIZE, help="packs per box")
+    parser.add_argument(
+        "--chunk-boxes", type=int, default=CHUNK_BOXES, help="boxes opened per worker task"
+    )
+    parser.add_argument(
+        "--hit-rank",
+        type=int,
+        default=HIT_RANK,
+        help="lowest rarity rank counted as a hit (3 is Rare Holo)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=0, help="worker processes (0 uses every CPU)"
+    )
+    parser.add_argument(
+        "--output", type=Path, default=OUTPUT_DIR, help="directory for checkpoints and summary"
+    )
+    parser.add_argument(
+        "--checkpoint-seconds",
+        type=float,
+        default=CHECKPOINT_SECONDS,
+        help="seconds between checkpoint writes",
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="continue from checkpoints in the output directory"
+    )
+    args = parser.parse_args()
+    if args.workers == 0:
+        args.workers = os.cpu_count() or 1
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    init_worker(args.db)
+    engine = ENGINE
+    pack_names = args.pack or sorted(engine.pools)
+    for pack_name in pack_names:
+        if pack_name not in engine.pools:
+            raise KeyError(f"Unknown pack: {pack_name}")
+    chunk_packs = args.box_size * args.chunk_boxes
+    chunk_count = math.ceil(args.packs / chunk_packs)
+    args.output.mkdir(parents=True, exist_ok=True)
+    tallies: dict[tuple[str, str], Tally] = {}
+    tasks: list[ChunkTask] = []
+    config = {
+        "seed": args.seed,
+        "boxSize": args.box_size,
+        "chunkPacks": chunk_packs,
+        "hitRank": args.hit_rank,
+        "cards": engine_fingerprint(engine),
+    }
+    for pack_name in pack_names:
+        for mode in args.mode or list(MODES):
+            tally = Tally(pack_name, mode, config, len(engine.card_ids))
+            path = checkpoint_path(args.output, pack_name, mode)
+            if args.resume and path.exists():
+                tally.load(path)
+            tallies[pack_name, mode] = tally
+            for chunk in range(chunk_count):
+                if chunk in tally.completed:
+                    continue
+                tasks.append(
+                    ChunkTask(
+                        pack_name, mode, chunk, chunk_packs, args.seed, args.box_size, args.hit_rank
+                    )
+                )
+    started = last_checkpoint = time.perf_counter()
+    resumed = sum(tally.packs for tally in tallies.values())
+
+    def checkpoint(force: bool = False) -> None:
+        nonlocal last_checkpoint
+        now = time.perf_counter()
+        if not force and now - last_checkpoint < args.checkpoint_seconds:
+            return
+        for (pack_name, mode), tally in tallies.items():
+            if tally.packs:
+                tally.save(checkpoint_path(args.output, pack_name, mode))
+        write_summary(args.output, engine, list(tallies.values()))
+        total = sum(tally.packs for tally in tallies.values())
+        rate = (total - resumed) / max(now - started, 1e-9)
+        print(f"Opened {total} packs ({rate:,.0f} packs/s), checkpointed to {args.output}")
+        last_checkpoint = now
+
+    print(f"Running {len(tasks)} chunks of {chunk_packs} packs on {args.workers} workers")
+    run_tasks(tasks, tallies, args.db, args.workers, checkpoint)
+    checkpoint(force=True)
+
+
+if __name__ == "__main__":
+    main()
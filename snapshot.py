@@ -0,0 +1,233 @@
+import argparse
+import mmap
+import os
+import struct
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+
+from draw import DB_PATH, DrawEngine
+from publish import database_digest
+
+SNAPSHOT_SUFFIX = ".snapshot"
+MAGIC = b"CARDSNAP"
+FORMAT_VERSION = 3
+NO_STRING = 0xFFFFFFFF
+SECTION_ALIGNMENT = 8
+STRING_REF = np.dtype("<u4")
+PACK_DTYPE = np.dtype([("name", "<u4"), ("start", "<u4"), ("stop", "<u4")])
+SECTIONS = {
+    "id": STRING_REF,
+    "name": STRING_REF,
+    "number": STRING_REF,
+    "rarity": STRING_REF,
+    "packCode": STRING_REF,
+    "rank": np.dtype("i1"),
+    "upgrade": np.dtype("<i8"),
+    "packs": PACK_DTYPE,
+    "packMembers": np.dtype("<i8"),
+    "rarityOffsets": np.dtype("<u4"),
+    "rarityOrder": np.dtype("<u4"),
+    "stringOffsets": np.dtype("<u8"),
+    "strings": np.dtype("u1"),
+}
+HEADER = struct.Struct("<8sII32sQ" + "QQ" * len(SECTIONS))
+
+
+def snapshot_path(db_path: Path) -> Path:
+    return db_path.with_suffix(SNAPSHOT_SUFFIX)
+
+
+class StringTable:
+    def __init__(self) -> None:
+        self.refs: dict[str, int] = {}
+        self.chunks: list[bytes] = []
+
+    def ref(self, value: str | None) -> int:
+        if value is None:
+            return NO_STRING
+        ref = self.refs.get(value)
+        if ref is None:
+            ref = self.refs[value] = len(self.chunks)
+            self.chunks.append(value.encode("utf-8"))
+        return ref
+
+    def refs_of(self, values: Sequence[str | None]) -> np.ndarray:
+        return np.array([self.ref(value) for value in values], dtype=STRING_REF)
+
+    def offsets(self) -> np.ndarray:
+        offsets = np.zeros(len(self.chunks) + 1, dtype=SECTIONS["stringOffsets"])
+        np.cumsum([len(chunk) for chunk in self.chunks], out=offsets[1:])
+        return offsets
+
+
+def snapshot_sections(engine: DrawEngine) -> dict[str, np.ndarray]:
+    strings = StringTable()
+    sections = {
+        "id": strings.refs_of(engine.card_ids),
+        "name": strings.refs_of(engine.names),
+        "number": strings.refs_of(engine.numbers),
+        "rarity": strings.refs_of(engine.rarities),
+        "packCode": strings.refs_of(engine.pack_codes),
+        "rank": engine.ranks,
+        "upgrade": engine.upgrade,
+    }
+    packs = np.zeros(len(engine.pack_indices), dtype=PACK_DTYPE)
+    start = 0
+    for position, (pack_name, indices) in enumerate(engine.pack_indices.items()):
+        packs[position] = (strings.ref(pack_name), start, start + len(indices))
+        start += len(indices)
+    sections["packs"] = packs
+    sections["packMembers"] = np.concatenate([np.zeros(0, np.int64), *engine.pack_indices.values()])
+    ranks = engine.ranks.astype(np.int64)
+    rank_counts = np.bincount(ranks, minlength=int(ranks.max(initial=0)) + 1)
+    sections["rarityOffsets"] = np.concatenate([[0], np.cumsum(rank_counts)])
+    sections["rarityOrder"] = np.argsort(ranks, kind="stable")
+    sections["stringOffsets"] = strings.offsets()
+    sections["strings"] = np.frombuffer(b"".join(strings.chunks), dtype=np.uint8)
+    return sections
+
+
+def write_snapshot(db_path: Path, path: Path | None = None) -> int:
+    database_sha256 = bytes.fromhex(database_digest(db_path))
+    database_bytes = db_path.stat().st_size
+    engine = DrawEngine.load(db_path)
+    sections = snapshot_sections(engine)
+    path = path or snapshot_path(db_path)
+    staged = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with staged.open("wb") as f:
+            f.write(bytes(HEADER.size))
+            layout: list[int] = []
+            for name, dtype in SECTIONS.items():
+                data = np.ascontiguousarray(sections[name], dtype=dtype)
+                f.write(bytes(-f.tell() % SECTION_ALIGNMENT))
+                layout += [f.tell(), len(data)]
+                f.write(data.tobytes())
+            f.seek(0)
+            f.write(
+                HEADER.pack(
+                    MAGIC, FORMAT_VERSION, len(SECTIONS), database_sha256, database_bytes, *layout
+                )
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(staged, path)
+    finally:
+        staged.unlink(missing_ok=True)
+    return len(engine.card_ids)
+
+
+class StringColumn(Sequence):
+    __slots__ = ("snapshot", "refs")
+
+    def __init__(self, snapshot: "Snapshot", refs: np.ndarray) -> None:
+        self.snapshot = snapshot
+        self.refs = refs
+
+    def __len__(self) -> int:
+        return len(self.refs)
+
+    def __getitem__(self, index: int) -> str | None:
+        return self.snapshot.string(self.refs.item(index))
+
+
+class Snapshot:
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mmap) < HEADER.size:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} card snapshot")
+        magic, version, count, database_sha256, database_bytes, *layout = HEADER.unpack_from(
+            self.mmap
+        )
+        if magic != MAGIC or version != FORMAT_VERSION or count != len(SECTIONS):
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} card snapshot")
+        self.database_sha256 = database_sha256.hex()
+        self.database_bytes = database_bytes
+        self.sections = {
+            name: np.frombuffer(self.mmap, dtype, layout[2 * i + 1], layout[2 * i])
+            for i, (name, dtype) in enumerate(SECTIONS.items())
+        }
+        self.string_offsets = self.sections["stringOffsets"]
+        self.string_base = layout[2 * list(SECTIONS).index("strings")]
+        self.decoded: dict[int, str] = {}
+
+    def matches(self, db_path: Path, version: str | None = None) -> bool:
+        if db_path.stat().st_size != self.database_bytes:
+            return False
+        return (version or database_digest(db_path)) == self.database_sha256
+
+    def string(self, ref: int) -> str | None:
+        value = self.decoded.get(ref)
+        if value is not None or ref == NO_STRING:
+            return value
+        start, stop = self.string_offsets[ref : ref + 2].tolist()
+        value = self.decoded[ref] = self.mmap[
+            self.string_base + start : self.string_base + stop
+        ].decode("utf-8")
+        return value
+
+    def column(self, name: str) -> StringColumn:
+        return StringColumn(self, self.sections[name])
+
+    def pack_indices(self) -> dict[str, np.ndarray]:
+        members = self.sections["packMembers"]
+        return {
+            self.string(int(ref)): members[start:stop]
+            for ref, start, stop in self.sections["packs"].tolist()
+        }
+
+    def rarity(self, rank: int) -> np.ndarray:
+        offsets = self.sections["rarityOffsets"]
+        if not 0 <= rank < len(offsets) - 1:
+            return self.sections["rarityOrder"][:0]
+        return self.sections["rarityOrder"][offsets[rank] : offsets[rank + 1]]
+
+    def engine(self) -> DrawEngine:
+        return DrawEngine(
+            card_ids=self.column("id"),
+            names=self.column("name"),
+            numbers=self.column("number"),
+            rarities=self.column("rarity"),
+            pack_codes=self.column("packCode"),
+            ranks=self.sections["rank"],
+            upgrade=self.sections["upgrade"],
+            pack_indices=self.pack_indices(),
+        )
+
+
+def snapshot_matches(db_path: Path) -> bool:
+    try:
+        return Snapshot(snapshot_path(db_path)).matches(db_path)
+    except (OSError, ValueError):
+        return False
+
+
+def load_draw_engine(db_path: Path, version: str | None = None) -> DrawEngine:
+    try:
+        snapshot = Snapshot(snapshot_path(db_path))
+    except (OSError, ValueError):
+        return DrawEngine.load(db_path)
+    if not snapshot.matches(db_path, version):
+        return DrawEngine.load(db_path)
+    return snapshot.engine()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Write a memory-mappable card snapshot next to a compiled database."
+    )
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="compiled cards database")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    count = write_snapshot(args.db)
+    print(f"Wrote {count} cards into {snapshot_path(args.db)}")
+
+
+if __name__ == "__main__":
+    main()
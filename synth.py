@@ -0,0 +1,340 @@
+import argparse
+import json
+import random
+import shutil
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any
+
+BASE_SET_COUNT = 170
+MIN_SET_SIZE = 20
+MAX_SET_SIZE = 200
+SERIES_SIZE = 12
+FORMATS = ("json", "ts")
+JSON_CARDS_DIR = Path("pokemon-tcg-data/cards/en")
+JSON_SETS_PATHS = (Path("pokemon-tcg-data/sets/en.json"), Path("pokemon-tcg-data/sets/en2.json"))
+TS_DATA_DIR = Path("cards-database/data")
+MANIFEST_NAME = "synth.json"
+FIRST_RELEASE = date(1999, 1, 9)
+TYPES = (
+    "Colorless",
+    "Darkness",
+    "Dragon",
+    "Fairy",
+    "Fighting",
+    "Fire",
+    "Grass",
+    "Lightning",
+    "Metal",
+    "Psychic",
+    "Water",
+)
+RARITIES = (
+    ("Common", 40),
+    ("Uncommon", 28),
+    ("Rare", 12),
+    ("Rare Holo", 8),
+    ("Rare Holo V", 4),
+    ("Rare Ultra", 3),
+    ("Illustration Rare", 2),
+    ("Rare Secret", 2),
+    ("Promo", 1),
+)
+SUPERTYPES = (("Pokémon", 80), ("Trainer", 16), ("Energy", 4))
+STAGES = ("Basic", "Stage 1", "Stage 2")
+SYLLABLES = ("ka", "zu", "mon", "ri", "chu", "pi", "bul", "sa", "ur", "to", "dra", "gon", "lo")
+SET_SUFFIXES = ("Rising", "Legends", "Storm", "Origins", "Crown")
+ATTACK_SUFFIXES = ("Strike", "Beam", "Blast", "Tackle")
+DAMAGE_VALUES = ("10", "20", "30", "30+", "40", "60", "60×", "90", "120", "")
+
+
+def weighted_choice(rng: random.Random, choices: tuple[tuple[str, int], ...]) -> str:
+    return rng.choices([name for name, _ in choices], [weight for _, weight in choices])[0]
+
+
+def pokemon_name(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def set_id(index: int) -> str:
+    return f"syn{index}"
+
+
+def make_set(index: int, seed: int) -> dict[str, Any]:
+    rng = random.Random(f"{seed}-set-{index}")
+    size = rng.randint(MIN_SET_SIZE, MAX_SET_SIZE)
+    released = FIRST_RELEASE + timedelta(days=index * 45 + rng.randint(0, 30))
+    series = f"Series {index // SERIES_SIZE}"
+    item = {
+        "id": set_id(index),
+        "name": f"{pokemon_name(rng)} {rng.choice(SET_SUFFIXES)} {index}",
+        "series": series,
+        "printedTotal": size - rng.randint(0, size // 10),
+        "total": size,
+        "legalities": {"unlimited": "Legal", **({"expanded": "Legal"} if index % 3 else {})},
+        "releaseDate": released.strftime("%Y/%m/%d"),
+        "updatedAt": f"{released.strftime('%Y/%m/%d')} 10:00:00",
+        "images": {
+            "symbol": f"https://images.example/{set_id(index)}/symbol.png",
+            "logo": f"https://images.example/{set_id(index)}/logo.png",
+        },
+    }
+    if index % 4:
+        item["ptcgoCode"] = f"S{index:03d}"
+    return item
+
+
+def make_prices(rng: random.Random) -> dict[str, Any]:
+    prices: dict[str, Any] = {}
+    for variant in rng.sample(("normal", "holofoil", "reverseHolofoil", "1stEditionHolofoil"), 2):
+        low = round(rng.uniform(0.05, 40), 2)
+        prices[variant] = {
+            "low": low,
+            "mid": round(low * 1.5, 2),
+            "high": round(low * 4, 2),
+            "market": round(low * 1.3, 2) if rng.random() < 0.9 else None,
+            "directLow": round(low * 1.1, 2) if rng.random() < 0.5 else None,
+        }
+    return prices
+
+
+def make_card(set_item: dict[str, Any], number: int, seed: int, index: int) -> dict[str, Any]:
+    rng = random.Random(f"{seed}-card-{set_item['id']}-{number}")
+    supertype = weighted_choice(rng, SUPERTYPES)
+    card_id = f"{set_item['id']}-{number}"
+    card: dict[str, Any] = {
+        "id": card_id,
+        "name": pokemon_name(rng) if supertype != "Energy" else f"{rng.choice(TYPES)} Energy",
+        "supertype": supertype,
+        "subtypes": [rng.choice(STAGES)] if supertype == "Pokémon" else ["Item"],
+        "number": str(number) if number % 29 else f"{number}a",
+        "artist": f"Artist {rng.randint(1, 300)}",
+        "rarity": weighted_choice(rng, RARITIES),
+        "legalities": set_item["legalities"],
+        "images": {
+            "small": f"https://images.example/{set_item['id']}/{number}.png",
+            "large": f"https://images.example/{set_item['id']}/{number}_hires.png",
+        },
+    }
+    if supertype == "Pokémon":
+        hp = rng.choice((30, 40, 60, 70, 90, 120, 180, 230, 330))
+        card["hp"] = str(hp) if index % 17 else hp
+        card["types"] = [rng.choice(TYPES)]
+        card["attacks"] = [
+            {
+                "name": f"{pokemon_name(rng)} {rng.choice(ATTACK_SUFFIXES)}",
+                "cost": [rng.choice(TYPES) for _ in range(cost)],
+                "convertedEnergyCost": cost,
+                "damage": rng.choice(DAMAGE_VALUES),
+                "text": "Flip a coin. If heads, this attack does 10 more damage."
+                if rng.random() < 0.4
+                else "",
+            }
+            for cost in (rng.randint(1, 4) for _ in range(rng.randint(1, 3)))
+        ]
+        card["weaknesses"] = [{"type": rng.choice(TYPES), "value": "×2"}]
+        if rng.random() < 0.3:
+            card["resistances"] = [{"type": rng.choice(TYPES), "value": "-30"}]
+        retreat = rng.randint(0, 4)
+        card["retreatCost"] = ["Colorless"] * retreat
+        card["convertedRetreatCost"] = retreat
+        card["nationalPokedexNumbers"] = [rng.randint(1, 1010)]
+        if rng.random() < 0.15:
+            card["abilities"] = [
+                {
+                    "name": pokemon_name(rng),
+                    "text": "Once during your turn, you may draw a card.",
+                    "type": "Ability",
+                }
+            ]
+        if rng.random() < 0.05:
+            level = rng.randint(5, 70)
+            card["level"] = rng.choice(("X", str(level))) if index % 2 else level
+        if rng.random() < 0.02:
+            card["ancientTrait"] = {"name": "Θ Stop", "text": "Prevent all effects of attacks."}
+        if rng.random() < 0.6:
+            card["flavorText"] = "It lives in synthetic forests."
+    else:
+        card["rules"] = ["You may play as many Item cards during your turn as you like."]
+    if index % 5 == 0:
+        card["regulationMark"] = rng.choice("DEFGH")
+    if rng.random() < 0.8:
+        card["tcgplayer"] = {
+            "url": f"https://prices.example/tcgplayer/{card_id}",
+            "updatedAt": set_item["updatedAt"][:10],
+            "prices": make_prices(rng),
+        }
+    if rng.random() < 0.6:
+        card["cardmarket"] = {
+            "url": f"https://prices.example/cardmarket/{card_id}",
+            "updatedAt": set_item["updatedAt"][:10],
+            "prices": {
+                "averageSellPrice": round(rng.uniform(0.05, 40), 2),
+                "trendPrice": round(rng.uniform(0.05, 40), 2),
+            },
+        }
+    return card
+
+
+def ts_literal(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, indent="\t")
+
+
+def tcgdex_attack(attack: dict[str, Any]) -> dict[str, Any]:
+    item: dict[str, Any] = {"cost": attack["cost"], "name": {"en": attack["name"]}}
+    if attack["text"]:
+        item["effect"] = {"en": attack["text"]}
+    if attack["damage"]:
+        damage = attack["damage"]
+        item["damage"] = int(damage) if damage.isdigit() else damage
+    return item
+
+
+def tcgdex_card(card: dict[str, Any]) -> dict[str, Any]:
+    item: dict[str, Any] = {
+        "name": {"en": card["name"], "fr": card["name"]},
+        "illustrator": card["artist"],
+        "rarity": card["rarity"],
+        "category": "Pokemon" if card["supertype"] == "Pokémon" else card["supertype"],
+    }
+    if "hp" in card:
+        item["hp"] = int(card["hp"])
+        item["types"] = card["types"]
+        item["stage"] = card["subtypes"][0].replace(" ", "")
+        item["dexId"] = card["nationalPokedexNumbers"]
+        item["attacks"] = [tcgdex_attack(attack) for attack in card["attacks"]]
+        item["weaknesses"] = card["weaknesses"]
+        item["retreat"] = card["convertedRetreatCost"]
+    else:
+        item["effect"] = {"en": card["rules"][0]}
+    item["variants"] = {
+        "normal": True,
+        "reverse": True,
+        "holo": "Holo" in card["rarity"],
+        "firstEdition": False,
+    }
+    item["image"] = card["images"]["small"]
+    return item
+
+
+def write_ts_set(data_dir: Path, set_item: dict[str, Any], cards: list[dict[str, Any]]) -> None:
+    serie_name = set_item["series"]
+    serie_path = data_dir / f"{serie_name}.ts"
+    if not serie_path.exists():
+        serie = {"id": serie_name.lower().replace(" ", ""), "name": {"en": serie_name}}
+        serie_path.write_text(
+            "import { Serie } from '../interfaces'\n\n"
+            f"const serie: Serie = {ts_literal(serie)}\n\nexport default serie\n",
+            encoding="utf-8",
+        )
+    set_name = set_item["name"]
+    set_dir = data_dir / serie_name / set_name
+    set_dir.mkdir(parents=True, exist_ok=True)
+    ts_set = {
+        "id": set_item["id"],
+        "name": {"en": set_name, "fr": set_name},
+        "releaseDate": set_item["releaseDate"].replace("/", "-"),
+        "cardCount": {"official": set_item["printedTotal"]},
+        "legal": {"standard": False, "expanded": "expanded" in set_item["legalities"]},
+    }
+    if "ptcgoCode" in set_item:
+        ts_set["tcgOnline"] = set_item["ptcgoCode"]
+    set_literal = ts_literal(ts_set).replace("\n}", ',\n\t"serie": serie\n}', 1)
+    (data_dir / serie_name / f"{set_name}.ts").write_text(
+        "import { Set } from '../../interfaces'\n"
+        f"import serie from '../{serie_name}'\n\n"
+        f"const set: Set = {set_literal}\n\nexport default set\n",
+        encoding="utf-8",
+    )
+    for card in cards:
+        card_literal = ts_literal(tcgdex_card(card)).replace("{", '{\n\t"set": Set,', 1)
+        (set_dir / f"{card['number']}.ts").write_text(
+            "import { Card } from '../../../interfaces'\n"
+            f"import Set from '../{set_name}'\n\n"
+            f"const card: Card = {card_literal}\n\nexport default card\n",
+            encoding="utf-8",
+        )
+
+
+def write_corpus(
+    output: Path, scale: float, seed: int = 0, formats: tuple[str, ...] = FORMATS
+) -> dict[str, Any]:
+    set_count = max(1, round(BASE_SET_COUNT * scale))
+    for path in (output / JSON_CARDS_DIR.parts[0], output / TS_DATA_DIR.parts[0]):
+        shutil.rmtree(path, ignore_errors=True)
+    if "json" in formats:
+        (output / JSON_CARDS_DIR).mkdir(parents=True)
+        for sets_path in JSON_SETS_PATHS:
+            (output / sets_path).parent.mkdir(parents=True, exist_ok=True)
+    if "ts" in formats:
+        (output / TS_DATA_DIR).mkdir(parents=True)
+    sets: list[dict[str, Any]] = []
+    card_count = 0
+    for index in range(set_count):
+        set_item = make_set(index, seed)
+        cards = [
+            make_card(set_item, number, seed, index) for number in range(1, set_item["total"] + 1)
+        ]
+        sets.append(set_item)
+        card_count += len(cards)
+        if "json" in formats:
+            (output / JSON_CARDS_DIR / f"{set_item['id']}.json").write_text(
+                json.dumps(cards, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+        if "ts" in formats:
+            write_ts_set(output / TS_DATA_DIR, set_item, cards)
+    if "json" in formats:
+        for sets_path in JSON_SETS_PATHS:
+            (output / sets_path).write_text(
+                json.dumps(sets, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+    manifest = {
+        "scale": scale,
+        "seed": seed,
+        "formats": list(formats),
+        "sets": set_count,
+        "cards": card_count,
+    }
+    (output / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def read_corpus_manifest(output: Path) -> dict[str, Any] | None:
+    try:
+        return json.loads((output / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic pokemon-tcg-data and cards-database corpus for benchmarks."
+    )
+    parser.add_argument("output", type=Path, help="directory to write the corpus into")
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help=f"corpus size relative to the real one ({BASE_SET_COUNT} sets at 1x)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="seed for generated content")
+    parser.add_argument(
+        "--format",
+        action="append",
+        choices=FORMATS,
+        help="layout to write: json (pokemon-tcg-data) or ts (cards-database), default both",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    manifest = write_corpus(args.output, args.scale, args.seed, tuple(args.format or FORMATS))
+    print(
+        f"Wrote {manifest['cards']} cards in {manifest['sets']} sets "
+        f"({', '.join(manifest['formats'])}) into {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
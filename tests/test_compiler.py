@@ -0,0 +1,175 @@
+import argparse
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from compile import CARDS_DIR, DB_PATH, SETS_PATH, PokemonTcgDataAdapter, update_cards
+from compiler import (
+    STAGING_TABLE_NAME,
+    ShadowColumn,
+    SourceAdapter,
+    Staging,
+    build_batch,
+    collect_key_types,
+    compile_cards,
+    detect_shadow_columns,
+    iter_card_files,
+    read_value_tables,
+    shadow_expressions,
+    value_table_name,
+)
+from profiling import Profiler
+
+
+def stage_records(staging: Staging, records: list[dict]) -> None:
+    staging.add(build_batch(records, collect_key_types(records)))
+
+
+def test_mixed_column_reverts_only_interned_values() -> None:
+    conn = sqlite3.connect(":memory:")
+    staging = Staging(conn, interned={})
+    stage_records(staging, [{"id": "a", "x": [1, 2]}])
+    stage_records(staging, [{"id": "b", "x": 7}])
+    staging.finish()
+    rows = conn.execute(f'SELECT "id", "x" FROM "{STAGING_TABLE_NAME}" ORDER BY rowid').fetchall()
+    assert rows == [("a", "[1,2]"), ("b", 7)]
+    assert staging.interned == {}
+    assert conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name = ?", (value_table_name("x"),)
+    ).fetchone() == (0,)
+
+
+def test_mixed_column_keeps_ints_that_match_value_ids() -> None:
+    conn = sqlite3.connect(":memory:")
+    staging = Staging(conn, interned={})
+    stage_records(staging, [{"id": "a", "x": ["one"]}, {"id": "b", "x": ["two"]}])
+    stage_records(staging, [{"id": "c", "x": 1}, {"id": "d", "x": None}])
+    staging.finish()
+    rows = conn.execute(f'SELECT "id", "x" FROM "{STAGING_TABLE_NAME}" ORDER BY rowid').fetchall()
+    assert rows == [("a", '["one"]'), ("b", '["two"]'), ("c", 1), ("d", None)]
+
+
+def test_interned_column_keeps_ids() -> None:
+    conn = sqlite3.connect(":memory:")
+    staging = Staging(conn, interned={})
+    stage_records(staging, [{"id": "a", "x": [1]}, {"id": "b", "x": [1]}, {"id": "c", "x": None}])
+    staging.finish()
+    rows = conn.execute(f'SELECT "id", "x" FROM "{STAGING_TABLE_NAME}" ORDER BY rowid').fetchall()
+    assert rows == [("a", 1), ("b", 1), ("c", None)]
+    assert staging.rows == 3
+
+
+class FailingAdapter(SourceAdapter):
+    def stage(self, staging: Staging, profiler: Profiler) -> None:
+        stage_records(staging, [{"id": "a", "name": "Staged"}])
+        raise RuntimeError("extraction failed")
+
+    def input_paths(self) -> list[Path]:
+        return []
+
+
+def test_failed_extraction_keeps_live_database(tmp_path: Path) -> None:
+    db_path = tmp_path / "cards.sqlite"
+    db_path.write_bytes(b"live database")
+    args = argparse.Namespace(serving=False, keep=0, patch=None)
+    try:
+        compile_cards(db_path, FailingAdapter(), args, Profiler("test"))
+    except RuntimeError as error:
+        assert str(error) == "extraction failed"
+    else:
+        raise AssertionError("expected RuntimeError")
+    assert db_path.read_bytes() == b"live database"
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["cards.sqlite"]
+
+
+def test_intern_columns_limits_interning() -> None:
+    conn = sqlite3.connect(":memory:")
+    staging = Staging(conn, interned={}, intern_columns={"x"})
+    stage_records(staging, [{"id": "a", "x": [1], "y": [2]}])
+    staging.finish()
+    rows = conn.execute(f'SELECT "x", "y" FROM "{STAGING_TABLE_NAME}"').fetchall()
+    assert rows == [(1, "[2]")]
+    assert staging.interned == {"x": {"[1]": 1}}
+
+
+def test_incremental_intern_keeps_mixed_column_text(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    CARDS_DIR.mkdir(parents=True)
+    SETS_PATH.parent.mkdir(parents=True)
+    SETS_PATH.write_text("[]", encoding="utf-8")
+    mixed = [
+        {"id": "s1-1", "name": "One", "number": "1", "rarity": "Common", "rules": "plain"},
+        {"id": "s1-2", "name": "Two", "number": "2", "rarity": "Common", "rules": ["listed"]},
+    ]
+    (CARDS_DIR / "s1.json").write_text(json.dumps(mixed), encoding="utf-8")
+    card = {"id": "s2-1", "name": "Three", "number": "1", "rarity": "Rare", "rules": ["a"]}
+    (CARDS_DIR / "s2.json").write_text(json.dumps([card]), encoding="utf-8")
+    card_files = iter_card_files(CARDS_DIR)
+    args = argparse.Namespace(serving=False, keep=0, patch=None)
+    compile_cards(DB_PATH, PokemonTcgDataAdapter(card_files, {}), args, Profiler("test"), True)
+    (CARDS_DIR / "s2.json").write_text(json.dumps([{**card, "rules": ["b"]}]), encoding="utf-8")
+    conn = sqlite3.connect(DB_PATH)
+    assert update_cards(conn, card_files, {}, intern=True) == (1, 1, 0)
+    rows = conn.execute('SELECT "id", "rules" FROM "cards" ORDER BY "id"').fetchall()
+    assert rows == [("s1-1", "plain"), ("s1-2", '["listed"]'), ("s2-1", '["b"]')]
+    assert read_value_tables(conn) == {}
+    conn.close()
+
+
+def test_incremental_update_leaves_absent_columns_null(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    CARDS_DIR.mkdir(parents=True)
+    SETS_PATH.parent.mkdir(parents=True)
+    SETS_PATH.write_text("[]", encoding="utf-8")
+    marked = {"id": "s1-1", "name": "One", "number": "1", "rarity": "Common", "regulationMark": "D"}
+    (CARDS_DIR / "s1.json").write_text(json.dumps([marked]), encoding="utf-8")
+    card = {"id": "s2-1", "name": "Two", "number": "1", "rarity": "Rare"}
+    (CARDS_DIR / "s2.json").write_text(json.dumps([card]), encoding="utf-8")
+    card_files = iter_card_files(CARDS_DIR)
+    args = argparse.Namespace(serving=False, keep=0, patch=None)
+    compile_cards(DB_PATH, PokemonTcgDataAdapter(card_files, {}), args, Profiler("test"))
+    (CARDS_DIR / "s2.json").write_text(json.dumps([{**card, "name": "Three"}]), encoding="utf-8")
+    conn = sqlite3.connect(DB_PATH)
+    assert update_cards(conn, card_files, {}) == (1, 1, 0)
+    rows = conn.execute('SELECT "id", "regulationMark" FROM "cards" ORDER BY "id"').fetchall()
+    assert rows == [("s1-1", "D"), ("s2-1", None)]
+    conn.close()
+
+
+def test_shadow_columns_skip_dates_and_count_empty_values() -> None:
+    conn = sqlite3.connect(":memory:")
+    conn.execute('CREATE TABLE "staged" ("number", "damage", "updatedAt")')
+    conn.executemany(
+        'INSERT INTO "staged" VALUES (?, ?, ?)',
+        [
+            ("1", "30+", "2000/05/18"),
+            ("2a", "", "2001/01/02"),
+            ("3", "20×", "2002/03/04"),
+            ("4", "ten", "2003/04/05"),
+        ],
+    )
+    shadows, rejected = detect_shadow_columns(conn, "staged", ["damage", "number", "updatedAt"])
+    assert shadows == [
+        ShadowColumn("number", True, 0, [], 0),
+    ]
+    assert rejected == [("damage", 2, 3)]
+    selected = ", ".join(shadow_expressions(shadows))
+    rows = conn.execute(f'SELECT {selected} FROM "staged" ORDER BY rowid').fetchall()
+    assert rows == [(1, ""), (2, "a"), (3, ""), (4, "")]
+
+
+def test_adapter_without_stage_fails_on_creation() -> None:
+    class IncompleteAdapter(SourceAdapter):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteAdapter()
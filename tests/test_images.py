@@ -0,0 +1,47 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from images import Client, FetchError
+
+BODY = bytes(range(256)) * 1171 + bytes(224)
+
+
+async def serve_until_close(body: bytes, max_bytes: int) -> bytes:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while (await reader.readline()) not in (b"\r\n", b""):
+            pass
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: image/png\r\nConnection: close\r\n\r\n")
+        for start in range(0, len(body), 8192):
+            writer.write(body[start : start + 8192])
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    client = Client(timeout=5.0, max_bytes=max_bytes)
+    try:
+        response = await client.fetch(f"http://127.0.0.1:{port}/card.png")
+    finally:
+        client.close()
+        server.close()
+        await server.wait_closed()
+    assert response.status == 200
+    assert not response.keep_alive
+    return response.body
+
+
+def test_body_without_length_is_read_to_eof() -> None:
+    assert len(BODY) == 300_000
+    assert asyncio.run(serve_until_close(BODY, 1 << 20)) == BODY
+
+
+def test_body_without_length_over_limit() -> None:
+    try:
+        asyncio.run(serve_until_close(BODY, 100_000))
+    except FetchError as error:
+        assert "100000 byte limit" in str(error)
+    else:
+        raise AssertionError("expected FetchError")
@@ -0,0 +1,58 @@
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from server import HTTPError, parse_draw_payload, parse_json_body, shard_response
+from shards import MANIFEST_NAME, load_pack_shards, make_shard, shards_path, write_pack_shards
+
+
+@pytest.mark.parametrize("quantity", ["1e400", "1.5", "true", '"x"', "null", "[1]"])
+def test_draw_payload_rejects_invalid_quantities(quantity: str) -> None:
+    payload = parse_json_body(f'{{"seed": "s", "packs": {{"Base": {quantity}}}}}'.encode())
+    with pytest.raises(HTTPError) as error:
+        parse_draw_payload(payload)
+    assert error.value.status == 400
+    assert error.value.message == "Invalid quantity for Base"
+
+
+def test_draw_payload_accepts_integral_quantities() -> None:
+    payload = {"seed": " s ", "packs": {"Base": 2, "Jungle": 1.0, "Fossil": "3", "Rocket": 0}}
+    assert parse_draw_payload(payload)["packs"] == {"Base": 2, "Jungle": 1, "Fossil": 3}
+
+
+def test_shard_etags_differ_per_content_coding() -> None:
+    shard = make_shard(b'{"packs":[]}')
+    identity = shard_response(shard, {})
+    gzipped = shard_response(shard, {"accept-encoding": "gzip"})
+    assert identity[2]["ETag"] != gzipped[2]["ETag"]
+    assert gzipped[2]["Content-Encoding"] == "gzip"
+    revalidated = shard_response(
+        shard, {"accept-encoding": "gzip", "if-none-match": identity[2]["ETag"]}
+    )
+    assert revalidated[0] == 200
+    revalidated = shard_response(
+        shard, {"accept-encoding": "gzip", "if-none-match": gzipped[2]["ETag"]}
+    )
+    assert revalidated[:2] == (304, b"")
+    assert "Content-Encoding" not in revalidated[2]
+
+
+def test_pack_shards_round_trip_etags(tmp_path: Path) -> None:
+    db_path = tmp_path / "cards.sqlite"
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        'CREATE TABLE "packs" ("packName", "packSeries", "packCode", "releaseDate", "cardCount")'
+    )
+    conn.execute('INSERT INTO "packs" VALUES (?, ?, ?, ?, ?)', ("Base", "Base", "BS", None, 1))
+    conn.commit()
+    conn.close()
+    write_pack_shards(db_path, (5,))
+    manifest = json.loads((shards_path(db_path) / MANIFEST_NAME).read_bytes())
+    loaded = load_pack_shards(shards_path(db_path))
+    assert loaded["all"].etags == manifest["all"]["etags"]
+    assert len(set(loaded["all"].etags.values())) == 3
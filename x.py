@@ -1,6 +1,10 @@
+import argparse
+import filecmp
 import json
+import os
+from collections.abc import Iterator
 from pathlib import Path
-from typing import Any
+from typing import Any, TextIO
 
 INPUT_PATH = Path("pokemon-tcg-data/sets/en2.json")
 OUTPUT_PATH = Path("pokemon-tcg-data/sets/en2.json")
@@ -16,17 +20,73 @@ KEY_ORDER = [
     "updatedAt",
     "images",
 ]
+CHUNK_SIZE = 1 << 16
+WHITESPACE = " \t\n\r"
+DECODER = json.JSONDecoder()
 
 
-def flatten_sets(value: Any) -> list[dict[str, Any]]:
-    if isinstance(value, dict):
-        return [value]
-    if not isinstance(value, list):
-        return []
-    result: list[dict[str, Any]] = []
-    for item in value:
-        result.extend(flatten_sets(item))
-    return result
+class JsonStream:
+    def __init__(self, f: TextIO, chunk_size: int = CHUNK_SIZE) -> None:
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer) or not self.fill():
+                return self.buffer[self.position : self.position + 1]
+
+    def take(self) -> str:
+        char = self.peek()
+        self.position += len(char)
+        return char
+
+    def decode(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            if end < len(self.buffer) or not self.fill():
+                self.position = end
+                return value
+
+
+def iter_sets(stream: JsonStream) -> Iterator[dict[str, Any]]:
+    if stream.peek() != "[":
+        value = stream.decode()
+        if isinstance(value, dict):
+            yield value
+        return
+    stream.take()
+    if stream.peek() == "]":
+        stream.take()
+        return
+    while True:
+        yield from iter_sets(stream)
+        separator = stream.take()
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' in set list, found {separator!r}")
 
 
 def reorder_keys(item: dict[str, Any]) -> dict[str, Any]:
@@ -40,18 +100,53 @@ def reorder_keys(item: dict[str, Any]) -> dict[str, Any]:
     return ordered
 
 
-def convert_sets(data: Any) -> list[dict[str, Any]]:
-    flat = flatten_sets(data)
-    return [reorder_keys(item) for item in flat]
+def encode_set(item: dict[str, Any]) -> str:
+    return "  " + json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+
+
+def normalize_sets(
+    input_path: Path = INPUT_PATH, output_path: Path = OUTPUT_PATH
+) -> Iterator[dict[str, Any]]:
+    staged = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+    try:
+        with (
+            input_path.open("r", encoding="utf-8") as source,
+            staged.open("w", encoding="utf-8") as target,
+        ):
+            stream = JsonStream(source)
+            separator = "[\n"
+            for item in iter_sets(stream):
+                ordered = reorder_keys(item)
+                target.write(separator)
+                target.write(encode_set(ordered))
+                separator = ",\n"
+                yield ordered
+            if stream.peek():
+                raise ValueError(f"Unexpected data after the set list in {input_path}")
+            target.write("[]\n" if separator == "[\n" else "\n]\n")
+            target.flush()
+            os.fsync(target.fileno())
+        if output_path.exists() and filecmp.cmp(staged, output_path, shallow=False):
+            staged.unlink()
+        else:
+            os.replace(staged, output_path)
+    finally:
+        staged.unlink(missing_ok=True)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Flatten nested set lists and order set keys, replacing the output atomically."
+    )
+    parser.add_argument("--input", type=Path, default=INPUT_PATH, help="set list to read")
+    parser.add_argument("--output", type=Path, default=OUTPUT_PATH, help="set list to write")
+    return parser.parse_args()
 
 
 def main() -> None:
-    with INPUT_PATH.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-    converted = convert_sets(data)
-    with OUTPUT_PATH.open("w", encoding="utf-8") as f:
-        json.dump(converted, f, ensure_ascii=False, indent=2)
-        f.write("\n")
+    args = parse_args()
+    count = sum(1 for _ in normalize_sets(args.input, args.output))
+    print(f"Normalized {count} sets into {args.output}")
 
 
 if __name__ == "__main__":